@@ -1,168 +1,123 @@
 from tkinter import *
 import customtkinter as ctk
-from datetime import datetime
 import logging
-from bs4 import BeautifulSoup
-import requests
-from requests.exceptions import ConnectionError
+import threading
+import time
 import json
-from CustomTkinterMessagebox import CTkMessagebox
-
-
-#Sets up logging
-logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, filename="inventory_update.log", datefmt='%Y-%m-%d %H:%M:%S')
-
-#Brings in a config file with settings (including API key, base URL, and information on item process types and labels)
-with open('settings.json') as config_file:
-    settings = json.load(config_file)
-
+from inventory_core.scan_worker import ScanWorker
+from inventory_core.scan_journal import ScanJournal, outcome_of, today_scandate
+from inventory_core.replay import replay_queued
+from inventory_core.rate_limit import TokenBucket
+from inventory_core.telemetry import BUCKETS, profile_from_settings
+from inventory_core.log_setup import logging_from_settings
+from inventory_core.call_numbers import shelf_order_from_settings
+from inventory_core.scan_history import HistoryEntry, ScanHistory, finished_state
+
+
+#Settings, filled in by load_settings() when the program starts (nothing is read or set up just by importing this file)
+settings = None
 #R/W Bibs API Key for Alma instance
-bibapi = settings['bibapi']
+bibapi = None
 #Base Alma server URL
-alma_base = settings['alma_base']
-#headers = settings['headers']
-#Taken from the PROCESSTYPE code table (https://developers.exlibrisgroup.com/blog/Working-with-the-code-tables-API/)
-statuslist = settings['statuslist']
-#Gives that list user-friendly labels:
-processlabel = settings['processlabel']
+alma_base = None
 #Default message when launching program:
-default_message = settings['default_message']
-
-#Takes note of current date
-rawdate=datetime.now().strftime("%Y-%m-%d")
-scandate = (f"{rawdate}Z")
-
-#Back-end functions (The functions that do the API requests and data parsing):
-
-#Look up item by barcode, if found get item record XML
-def scan_barcode (barcode, alma_base, bibapi):
-    headers = settings['headers']
-    #Set up default things for base URL and bib API key
-    try: 
-        r = requests.get(f"{alma_base}/items?view=label&item_barcode={barcode}&apikey={bibapi}",  headers=headers)
-        
-        #If status code is returned and isn't =200, that means it was able to connect to the server but the record wasn't returned (item likely not found)
-        if r.status_code != 200:
-            founditem = False
-            connectFail = False
-        
-        #Otherwise, status code assumed to be 200, connection made and record found
-        else:
-            founditem = True
-            connectFail = False
-
-        return(founditem, connectFail, r, headers)
-    
-    #Adds timeout exception if unable to connect to server to check for item
-    except ConnectionError:
-        connectFail = True
-        founditem = False
-        r = ""
-        return(founditem, connectFail, r, headers)
-
-
-#Parses item data XML to find elements for display and eventual record update
-def retreive_item_data (r, scandate):
-    soup = BeautifulSoup(r.content, "xml")
-
-    #Locate identifiers in data (used for update request)
-    mmsid = soup.mms_id.string
-    holdid = soup.holding_id.string
-    itemid = soup.pid.string
-
-    #Check for process status
+default_message = None
+#Local file every scan is recorded in, so scans made while offline can be sent to Alma later
+journal_file = None
+#How the offline queue is sent once the connection is back (parallel workers, items per second, seconds between reconnect attempts)
+replay_settings = None
+#How many scans are looked up/updated at once (window), and how many more can wait before the user is asked to slow down
+pipeline_settings = None
+#Optional shelf list mode: exported Alma item file for the location being inventoried, and where to write the end-of-session report
+shelf_settings = None
+#Scan timing panel and the optional profiler (see README)
+telemetry_settings = None
+capture = None
+#Scan history panel: rows on screen, and scans kept in memory before older ones are read back from the journal
+history_settings = None
+
+#Back-end functions (The functions that do the API requests and data parsing) live in inventory_core.scanning.
+#The Scanner and everything it pulls in (requests, the XML parser, the caches, the shelf list) is built by warm_up() on a
+#background thread while the window opens, scans made before it's ready just wait in the worker until scannerReady is set
+scanner = None
+process_barcode = None
+#Shared pooled connection to Alma, also used for the offline reconnect check
+client = None
+scannerReady = threading.Event()
+
+
+#Brings in a config file with settings (including API key, base URL, and information on item process types and labels) and sets up logging
+def load_settings(path="settings.json"):
+    global settings, bibapi, alma_base, default_message, journal_file, replay_settings, pipeline_settings, shelf_settings, telemetry_settings, history_settings, capture
+    with open(path) as config_file:
+        settings = json.load(config_file)
+
+    #Sets up logging (written by a background thread, rotated and compressed, see the "logging" block in settings.json)
+    logging_from_settings(settings)
+
+    bibapi = settings['bibapi']
+    alma_base = settings['alma_base']
+    default_message = settings['default_message']
+    journal_file = settings.get('journal_file', "scan_journal.db")
+    replay_settings = settings.get('replay', {})
+    pipeline_settings = settings.get('pipeline', {})
+    shelf_settings = settings.get('shelf_list', {})
+    telemetry_settings = settings.get('telemetry', {})
+    history_settings = settings.get('history', {})
+    capture = profile_from_settings(settings)
+    #Connection pool needs a connection for every scan in flight
+    settings.setdefault('http', {})['pool_size'] = max(pipeline_settings.get('window', 4), settings['http'].get('pool_size', 10))
+
+
+#Runs on its own thread at startup: imports and builds the Scanner, then lets the waiting scans through.
+#If that fails (e.g. the shelf list file is missing), scans come back as errors instead of waiting forever
+def warm_up():
+    global scanner, process_barcode, client
     try:
-        processstatus = soup.process_type.string
-    except AttributeError:
-        processstatus = "None"
-    if processstatus in statuslist:
-        inprocess = True
-        {"syslabel": processstatus}.get("readlabel")
-
-        for syslabel, readlabel in processlabel.items():  
-            if syslabel == processstatus:
-                 processtype = readlabel
-            else:
-                pass
-    else:
-        inprocess = False
-        processtype = ""
-
-    #Look for metadata elements for display
-    try:
-        title = soup.title.string
-    except AttributeError:
-        title = ""
-    
-    try:
-        author = soup.author.string
-    except AttributeError:
-        author = ""
-
-    #Checks to see if item is in a temporary location
-    try:
-        intemp_check = soup.in_temp_location.string
-    except AttributeError:
-        intemp_check = ""
-
-    if intemp_check == 'true':
-        intemp = True
-        templocation_raw = soup.temp_location['desc']
-        location = f"{templocation_raw} (Temporary Location)"
-    else:
-        intemp = False
-        location = soup.location['desc']       
-
-    #Gets call number
-    try:    
-        callnumber = soup.call_number.string
-    except AttributeError:
-        callnumber = ""
-    
-    #Gets item description
-    try:
-        desc = soup.description.string
-    except AttributeError:
-        desc = ""
-
-    #Looks for existing inventory date field, adds it if missing, and updates value to current date
-    try:
-        inventorydate = soup.inventory_date
-        inventorydate.string = scandate
-    except AttributeError:
-        addeddate = soup.new_tag("inventory_date")
-        addeddate.string = scandate
-
-        #Find inventory number field to use as placement reference
-        inventorynumber = soup.inventory_number
-        soup.item.item_data.inventory_number.insert_after(addeddate)
+        #Station sending its scans to a coordinator shared with the other scanning computers (see README), or a Scanner of its own.
+        #A station's shelf list and bulk export are set up on the coordinator instead
+        remote = bool(settings.get('coordinator', {}).get('url'))
+        if remote:
+            from inventory_core.coordinator import remote_scanner_from_settings
+            loaded = remote_scanner_from_settings(settings)
+        else:
+            from inventory_core.scanning import Scanner
+            loaded = Scanner(settings)
 
-    #Updated item record XML to send back to Alma
-    itemdata = soup.item
-    return(itemdata, mmsid, holdid, itemid, processtype, inprocess, title, author, location, callnumber, desc, intemp)
+        #Loads the expected items up front so scans of them show instantly, and so missing items can be reported at the end
+        if shelf_settings.get('file') and not remote:
+            from inventory_core.shelf_list import ShelfList
+            loaded.shelf = ShelfList(shelf_settings.get('location'), shelf_settings.get('call_number_from'), shelf_settings.get('call_number_to'), settings['processlabel'])
+            shelfcount = loaded.shelf.load(shelf_settings['file'])
+            logging.info(f"Shelf list {shelf_settings['file']} loaded: {shelfcount} items, {len(loaded.shelf.expected)} expected in {shelf_settings.get('location')}")
 
+        scanner = loaded
+        process_barcode = loaded.process_barcode
+        client = loaded.client
+    except Exception:
+        logging.exception("Could not start the scanner.")
+    finally:
+        scannerReady.set()
 
-#Update Alma item record 
-def update_inventory_date(itemdata, mmsid, holdid, itemid, bibapi, headers, alma_base):
-    #This should be the XML body data to send back in as a PUT 
-    updatepush = requests.put(f"{alma_base}/bibs/{mmsid}/holdings/{holdid}/items/{itemid}?generate_description=false&apikey={bibapi}", data=itemdata.encode('utf-8'),headers=headers)
+#Colours for the information frame and the scan history rows
+state_colours = {"pending": "#ced4da", "success": "#79dfc1", "warning": "#ffe69c", "error": "#f1aeb5", "note": "#a4ddf1", "misshelved": "#c5b3e6"}
 
-    #Code 200 is "success", anything else is a failure and will display an error
-    if updatepush.status_code != 200:
-        updatestatus = False
-    
-    else:
-        updatestatus = True
+#What the bottom of the frame says for an item in bulk job export mode, instead of "Saved to Alma"
+bulk_messages = {"exported": "Added to bulk job file", "flagged": "Not added to bulk job, written to flagged items file", "duplicate": "Already in this session's bulk job file"}
 
-    return(updatestatus, updatepush)
+#What the frame says when Alma answered but couldn't take the scan (throttled or down after every retry), instead of the offline message
+busy_messages = {"throttled": "Alma is busy", "server_error": "Alma is unavailable"}
 
 
 #Actual GUI and associated GUI functions to make things work
 class Widget:
     def __init__(self, gui):
+        self.gui = gui
         #Basic winow properties
         gui.title("Alma Inventory Date Updater")
         gui.bind('<Return>', lambda e: self.inventoryUpdate() )
+        #Closing the window goes through the same steps as the Exit button
+        gui.protocol("WM_DELETE_WINDOW", lambda: self.exitApp())
         gui.resizable(False, False)
         gui.wm_iconbitmap("inventory_icon.ico")
 
@@ -172,6 +127,7 @@ class Widget:
         #Entry field and Enter button
         self.barcodeEntry = ctk.CTkEntry(gui, width=200)
         self.barcodeEntry.grid(row=1, column=0, padx=10, pady=20)
+        self.entryBorder = self.barcodeEntry.cget("border_color")
         ctk.CTkButton(gui, text="Enter", command=lambda: self.inventoryUpdate()).grid(row=1, column=1, padx=10, pady=20 )
 
         #Center frame to show data, background color is grey by the default but changes with status
@@ -188,8 +144,9 @@ class Widget:
         self.infoDisplay.configure(state="disabled")
         self.infoDisplay.pack()
 
-        #Blank spacer at bottom of frame so it's symmetrical
-        ctk.CTkLabel(self.infoframe, text=" ").pack()
+        #Bottom line of the frame, shows whether the inventory date has been saved yet (blank otherwise so the frame stays symmetrical)
+        self.savetext = ctk.CTkLabel(self.infoframe, text=" ")
+        self.savetext.pack()
         
         #Frame to keep the clear and exit buttons separate from the main grid because that grid's asymmetrical
         self.controlframe = ctk.CTkFrame(gui, fg_color="transparent")
@@ -198,8 +155,109 @@ class Widget:
         #Clear screen button
         ctk.CTkButton(self.controlframe, text="Clear Screen", command=lambda: self.clearEntry()).grid(row=0, column=0, pady=10, padx=10)
 
-        #Exit button
-        ctk.CTkButton(self.controlframe, text="Exit", command=lambda: gui.destroy()).grid(row=0, column=1, pady=10, padx=10)
+        #Exit button (writes the shelf list report first in shelf list mode)
+        ctk.CTkButton(self.controlframe, text="Exit", command=lambda: self.exitApp()).grid(row=0, column=1, pady=10, padx=10)
+
+        #Shelf list mode: button to write the missing/unexpected/wrong location report at any point
+        if shelf_settings.get('file'):
+            ctk.CTkButton(self.controlframe, text="Shelf Report", command=lambda: self.shelfReport()).grid(row=0, column=2, pady=10, padx=10)
+
+        #Retry button for scans whose update didn't save, only shown while there are some. (barcode, journal id, scan date) for each
+        self.failedSaves = []
+        self.retryButton = ctk.CTkButton(self.controlframe, text="", fg_color="#dc3545", hover_color="#b02a37", command=lambda: self.retryFailedSaves())
+        self.retryButton.grid(row=1, columnspan=3, pady=(0, 10))
+        self.retryButton.grid_remove()
+
+        #Connection/offline queue status line under the buttons
+        self.statusline = ctk.CTkLabel(gui, text="", font=('Roboto', 12))
+        self.statusline.grid(row=4, columnspan=2)
+        bulk_settings = settings.get('bulk_export', {})
+        if bulk_settings.get('enabled'):
+            self.statusline.configure(text=f"Bulk job export mode: items are written to {bulk_settings.get('directory', 'bulk_jobs')}, not updated")
+
+        #Alma API throughput and remaining daily quota
+        self.apiline = ctk.CTkLabel(gui, text="", font=('Roboto', 12))
+        self.apiline.grid(row=5, columnspan=2)
+
+        #Optional scan timing panel (throughput, latency and error rate, refreshed with the API line)
+        self.perfline = None
+        if telemetry_settings.get('panel'):
+            self.perfline = ctk.CTkLabel(gui, text="", font=('Roboto', 12), justify="left")
+            self.perfline.grid(row=6, columnspan=2, pady=(0, 10))
+        self.showApiStats(gui)
+
+        #Optional shelf-reading: each item's call number is checked against the last few scans, out of place items get a purple frame
+        self.shelforder = shelf_order_from_settings(settings)
+
+        #Every scan is journaled so nothing is lost if the connection drops
+        self.journal = ScanJournal(journal_file)
+        self.offline = False
+        self.replaying = False
+
+        #Scan history down the right hand side. Only a fixed set of rows exists, scrolling just redraws them from the history buffer
+        self.history = ScanHistory(history_settings.get('capacity', 500), self.journal)
+        #How far down from the newest scan the top row is
+        self.historyTop = 0
+        visiblerows = history_settings.get('rows', 10)
+        self.historyframe = ctk.CTkFrame(gui)
+        self.historyframe.grid(row=0, column=2, rowspan=7, padx=10, pady=10, sticky='ns')
+        self.historyRows = []
+        #What each row is showing, so rows that haven't changed aren't reconfigured
+        self.historyShown = [None] * visiblerows
+        for n in range(visiblerows):
+            row = ctk.CTkLabel(self.historyframe, text="", width=260, anchor="w", justify="left", corner_radius=6, font=('Roboto', 12))
+            row.grid(row=n, column=0, padx=(5, 0), pady=2, sticky='ew')
+            row.bind("<MouseWheel>", lambda e: self.scrollHistory("scroll", -1 if e.delta > 0 else 1, "units"))
+            row.bind("<Button-4>", lambda e: self.scrollHistory("scroll", -1, "units"))
+            row.bind("<Button-5>", lambda e: self.scrollHistory("scroll", 1, "units"))
+            self.historyRows.append(row)
+        self.historyBar = ctk.CTkScrollbar(self.historyframe, command=self.scrollHistory)
+        self.historyBar.grid(row=0, column=1, rowspan=visiblerows, sticky='ns', padx=5)
+
+        #Background worker that talks to Alma so scanning never waits on the network
+        self.pending = 0
+        #When each scan in the worker was handed over (journal id -> perf_counter), for the total time per scan
+        self.submitted = {}
+        #Scans already on screen whose update is still being sent (journal ids), and the one currently showing
+        self.awaitingSave = set()
+        self.displayedScan = None
+        #Several scans run at once, results still come back in scan order
+        handler = self.processScan if capture is None else lambda barcode, scanid: capture.run(self.processScan, barcode, scanid)
+        self.worker = ScanWorker(handler, pipeline_settings.get('window', 4), pipeline_settings.get('max_queued', 20))
+        self.slowingDown = False
+        self.worker.poll(gui, self.showResult)
+
+        #Sends anything left in the offline queue from a previous session
+        if self.journal.queued_count() > 0:
+            self.startReplay()
+
+    #Compares what was scanned against the shelf list and writes the report (set operations over the loaded list, no API calls)
+    def shelfReport (self):
+        if scanner is None or scanner.shelf is None:
+            return
+        reportfile = shelf_settings.get('report_file', "shelf_report.csv")
+        counts = scanner.shelf.write_report(reportfile)
+        logging.info(f"Shelf list report written to {reportfile}: {counts}")
+        self.statusline.configure(text=f"Shelf report saved: {counts['missing']} missing, {counts['unexpected']} unexpected, {counts['wrong_location']} wrong location")
+
+    #Closes the program, saving the shelf list report first if there is one (and closing the bulk job files)
+    def exitApp (self):
+        #Closed before the scanner finished starting, nothing to save
+        if scanner is None:
+            self.gui.destroy()
+            return
+        if scanner.shelf is not None:
+            self.shelfReport()
+        if scanner.bulk is not None:
+            scanner.bulk.close()
+        #Session's timing numbers for the log, and the profile if one was being captured
+        summary = scanner.metrics.summary()
+        if summary is not None:
+            logging.info(f"Scan timings this session: {summary}")
+            logging.info(f"Scan time histogram (ms, up to {BUCKETS} and over): total {scanner.metrics.histogram('total')}, " + ", ".join(f"{name} {scanner.metrics.histogram(name)}" for name in summary['stages']))
+        if capture is not None:
+            capture.dump()
+        self.gui.destroy()
 
     #Function to clear the barcode entry field
     def clearBarcode(self):
@@ -207,26 +265,35 @@ class Widget:
 
     #Returns information frame to default grey
     def frameReset (self):
-        self.infoframe.configure(fg_color="#ced4da")
+        self.infoframe.configure(fg_color=state_colours["pending"])
 
     #Turns information frame green
     def frameSuccess (self):
-        self.infoframe.configure(fg_color="#79dfc1")
+        self.infoframe.configure(fg_color=state_colours["success"])
     
     #Turns information frame yellow
     def frameWarning (self):
-        self.infoframe.configure(fg_color="#ffe69c")
+        self.infoframe.configure(fg_color=state_colours["warning"])
     
     #Turns information frame red
     def frameError (self):
-        self.infoframe.configure(fg_color="#f1aeb5")
+        self.infoframe.configure(fg_color=state_colours["error"])
 
     #Turns information frame blue for a note
     def frameNote (self):
-        self.infoframe.configure(fg_color="#a4ddf1")
+        self.infoframe.configure(fg_color=state_colours["note"])
+
+    #Colour a status/location rule gave the item (one of state_colours)
+    def frameState (self, state):
+        self.infoframe.configure(fg_color=state_colours[state])
+
+    #Turns information frame purple for an item out of shelf order
+    def frameMisshelved (self):
+        self.infoframe.configure(fg_color=state_colours["misshelved"])
 
     #Popup box for connection error
     def connectError (self):
+        from CustomTkinterMessagebox import CTkMessagebox
         CTkMessagebox.messagebox(title="Check Connection", text="Unable to connect to Alma, please check internet connection.", size="400x150")
 
     #Clears central item information display (Text widget must be set to normal state for editing, disables it again after so text can't be added by user)
@@ -239,6 +306,8 @@ class Widget:
     def clearEntry(self):        
         self.frameReset()
         self.displayClear()
+        self.savetext.configure(text=" ")
+        self.displayedScan = None
         self.statustext.configure(text=default_message)        
         self.clearBarcode()
 
@@ -259,86 +328,410 @@ class Widget:
 
     def finalupdate (self, updatestatus, updatepush):
         if updatestatus == False:
-            self.killProgressBar()
             self.frameError()
             self.statustext.configure(text= "Item information was not updated. Please try again")
 
-        else:
-            self.killProgressBar()
-
 
     #The function that handles everything when "Enter" or <Return> are pressed
     def inventoryUpdate (self):
-        self.frameReset()
-        self.displayClear()
         barcode = self.barcodeEntry.get()
+        if barcode == "":
+            return
+
         self.clearBarcode()
-        self.statustext.configure(text= "Working...")
-        self.runProgressBar()
 
-        #Checks Alma for barcode
-        founditem, connectFail, r, headers = scan_barcode (barcode, alma_base, bibapi)
-        
+        #Too many scans waiting on Alma: the barcode isn't taken, the user is asked to wait and scan it again
+        #(it's cleared from the box anyway so the next scan doesn't run into it)
+        if not self.offline and self.worker.full():
+            self.slowDown(barcode)
+            return
+
+        scandate = today_scandate()
+        scanid = self.journal.record(barcode, scandate)
+        self.addHistory(scanid, barcode, "note" if self.offline else "pending")
+
+        #While offline, scans go straight into the local queue and get sent once the connection is back
+        if self.offline:
+            self.journal.queue(scanid)
+            logging.warning(f"Barcode {barcode} scanned while offline. Saved to offline queue.")
+            self.frameNote()
+            self.displayClear()
+            self.statustext.configure(text=f"Offline: barcode {barcode} saved. \nScan next barcode to continue")
+            self.showQueueCount()
+            return
+
+        #Hands the barcode to the background worker so the entry field is ready for the next scan straight away
+        self.worker.submit(barcode, scanid=scanid, scandate=scandate)
+        self.submitted[scanid] = time.perf_counter()
+        if self.pending == 0:
+            self.frameReset()
+            self.displayClear()
+            self.statustext.configure(text= "Working...")
+            self.runProgressBar()
+        self.pending += 1
+
+
+    #Worker handler: looks the item up and sends its details to the screen straight away, then finishes the update.
+    #The finished result (tagged with its journal entry) is what goes back through the poll loop last.
+    #scandate is the date the journal has for the scan (the item gets that date even if it's retried after midnight).
+    #retry is set for scans resubmitted from the retry list (already checked for shelf order the first time round)
+    def processScan (self, barcode, scanid, scandate=None, retry=False):
+        scannerReady.wait()
+        if scanner is None:
+            return {"barcode": barcode, "scanid": scanid, "error": RuntimeError("Scanner didn't start, see the log")}
+        tags = {"scanid": scanid, "retry": True} if retry else {"scanid": scanid}
+        result = scanner.run_scan(barcode, scandate, on_lookup=lambda lookup: self.worker.post(dict(lookup, phase="lookup", **tags)))
+        result.update(tags)
+        return(result)
+
+
+    #Shows a finished scan (called on the Tk thread by the worker's poll loop)
+    def showResult (self, result):
+        #Offline queue finished sending (posted by the replay thread)
+        if "replayed" in result:
+            self.replayFinished(result["replayed"])
+            return
+
+        #Item details are in, the update is still on its way
+        if result.get("phase") == "lookup":
+            self.showLookup(result)
+            return
+
+        self.pending -= 1
+        if self.slowingDown and not self.worker.full():
+            self.slowDownOver()
+        outcome = outcome_of(result)
+        if outcome == "queued":
+            self.journal.queue(result["scanid"])
+        else:
+            self.journal.finish(result["scanid"], outcome, result.get("title"), result.get("callnumber"))
+        entry = self.history.get(result["scanid"])
+        if entry is not None:
+            entry.state = finished_state(entry.state, outcome)
+            self.drawHistory()
+        #Only stop the progress bar once every queued scan has come back
+        if self.pending == 0:
+            self.killProgressBar()
+
+        #Item is already on screen from the lookup, just patch in whether the update saved
+        if result["scanid"] in self.awaitingSave:
+            self.showSaveStatus(result)
+        else:
+            rendered = time.perf_counter()
+            self.showFinished(result)
+            self.gui.update_idletasks()
+            result.setdefault("timings", {})["render"] = (time.perf_counter() - rendered) * 1000
+
+        #Time from the scan being handed to the worker until it was done on screen
+        submitted = self.submitted.pop(result["scanid"], None)
+        if scanner is not None:
+            scanner.metrics.record(result, (time.perf_counter() - submitted) * 1000 if submitted is not None else None)
+
+
+    #Shows a scan that wasn't on screen yet (not found, offline, errors, or a found item that came back in one go)
+    def showFinished (self, result):
+        self.displayedScan = result["scanid"]
+        self.frameReset()
+        self.displayClear()
+        self.savetext.configure(text=" ")
 
-        #If item isn't found in Alma by barcode, give user an error message and change frame color to error color
-        if (connectFail == True):
+        #Something unexpected went wrong while processing (e.g. record missing expected fields)
+        if "error" in result:
             self.frameError()
-            self.killProgressBar()
-            self.connectError()
-            self.statustext.configure(text="Please resolve connection issue before continuing.")
-            #Logs that the item was scanned while not connected (for troubleshooting from log if needed later)
-            logging.error(f"Barcode {barcode} scanned. Connection attempt timed out.")
+            self.statustext.configure(text=f"Could not process barcode {result['barcode']}. \nPlease set aside.")
+
+        #If Alma can't be reached (or is too busy or down to take the scan), switch to offline mode (the scan is already saved in the offline queue)
+        elif result["connectFail"] == True:
+            self.frameNote()
+            busy = busy_messages.get(result.get("lookup"))
+            if busy is not None:
+                self.statustext.configure(text=f"{busy}: barcode {result['barcode']} queued. \nScan next barcode to continue")
+            else:
+                self.statustext.configure(text=f"Offline: barcode {result['barcode']} saved. \nScan next barcode to continue")
+            if not self.offline:
+                #The check connection popup is only for the network, the queue goes to Alma either way once it answers again
+                self.goOffline(popup=busy is None)
+            self.showQueueCount()
+
+        #Alma refused the API key, nothing can be updated until settings.json is fixed
+        elif result.get("lookup") == "auth_error":
+            self.frameError()
+            self.statustext.configure(text="Alma rejected the API key. \nPlease check settings before continuing.")
 
         #If connection was made but item wasn't found, prompt user to set item aside (cannot update record)
-        elif (connectFail == False) & (founditem == False):
+        elif result["founditem"] == False:
             self.frameError()
-            self.killProgressBar()
             self.statustext.configure(text="Item not found! Please set aside.")
-            logging.error(f"Barcode {barcode} scanned. Item not found in Alma.")
 
+        else:
+            self.showItem(result)
+            self.finalupdate(result["updatestatus"], result["updatepush"])
 
-        #If found, retreives and parses item data    
-        else:            
-            itemdata, mmsid, holdid, itemid, processtype, inprocess, title, author, location, callnumber, desc, intemp = retreive_item_data (r, scandate)
-            
-            #Checks if item is currently in a process status or a temp location (to affect display and messages)
-            pathcheck = inprocess or intemp
+            #Rescan of an item that already has today's date (no request was sent)
+            if result.get("cached") or result.get("skipped"):
+                self.statustext.configure(text= self.statustext.cget("text") + "\n(Already inventoried today)")
 
-            if pathcheck == True:
-                if inprocess == True:
-                    screenpath = "withprocess"
-                if intemp == True:
-                    screenpath = "withtemp"
-            else:
-                screenpath = "clearstatus"
 
-            #Update basic display information about item
-            self.update_item_display(barcode, title, author, location, callnumber, desc)
+    #Scanning faster than Alma can keep up with: beep and turn the entry box red until there's room again
+    def slowDown (self, barcode):
+        self.slowingDown = True
+        self.gui.bell()
+        self.barcodeEntry.configure(border_color="#dc3545")
+        self.statusline.configure(text=f"Slow down! Barcode {barcode} was not scanned, please scan it again in a moment")
+        logging.warning(f"Barcode {barcode} not accepted, {self.pending} scans already waiting on Alma.")
 
-            #Attempt to update item data in Alma via API
-            updatestatus, updatepush = update_inventory_date(itemdata, mmsid, holdid, itemid, bibapi, headers, alma_base)
 
-            #Final display update options for item (dependent on item status and if update was successful):
-            #If item is in process, alert the user
-            if screenpath == "withprocess":                
-                self.statustext.configure(text= f"Item has process status: {processtype}, \nPlease set aside!")
-                self.frameWarning()
-                self.finalupdate(updatestatus, updatepush)
-                logging.info(f"Barcode {barcode} scanned. Had process status {processtype}. Updated?: {updatestatus}")
+    def slowDownOver (self):
+        self.slowingDown = False
+        self.barcodeEntry.configure(border_color=self.entryBorder)
+        self.statusline.configure(text="")
 
-            #If it's not in process but it is in temp location, also let the user know
-            elif screenpath == "withtemp":                
-                self.statustext.configure(text= f"Scan next barcode to continue \nNote: This item is in a temporary location")
-                self.frameNote()
-                self.finalupdate(updatestatus, updatepush)
-                logging.info(f"Barcode {barcode} scanned. Item currently has a temporary location. Updated?: {updatestatus}")
 
-            #If item isn't in process or in a temp location, show all clear status (unless there was an error updating the record)
-            elif screenpath == "clearstatus":                
-                self.statustext.configure(text= "Scan next barcode to continue")
-                self.frameSuccess()
-                self.finalupdate(updatestatus, updatepush)
-                logging.info(f"Barcode {barcode} scanned. Updated?: {updatestatus}")
+    #First phase of a found item: everything but the update result is known, so show it now (called on the Tk thread)
+    def showLookup (self, result):
+        rendered = time.perf_counter()
+        self.awaitingSave.add(result["scanid"])
+        self.displayedScan = result["scanid"]
+        self.frameReset()
+        self.displayClear()
+        self.showItem(result)
+        self.savetext.configure(text="Saving to Alma..." if scanner.bulk is None else "Adding to bulk job...")
+        #Shares the timings dict with the full result, so the time to draw the item is in its timing record
+        self.gui.update_idletasks()
+        result["timings"]["render"] = (time.perf_counter() - rendered) * 1000
+
+
+    #Shows item details, colour and status message for a found item (dependent on item status)
+    def showItem (self, result):
+        #Update basic display information about item
+        self.update_item_display(result["barcode"], result["title"], result["author"], result["location"], result["callnumber"], result["desc"])
+        rules = self.showRules(result)
+
+        entry = self.history.get(result["scanid"])
+        if entry is not None:
+            entry.title = result["title"]
+            entry.callnumber = result["callnumber"]
+            entry.state = rules[0]["colour"] if rules else "success"
+
+        #Shelf-reading: where the item is on the shelf compared with the last few scans (a retried save isn't a new position on the shelf)
+        if self.shelforder is not None and not result.get("retry"):
+            self.showShelfOrder(result)
+        self.drawHistory()
+
+
+    #Status message and colour for the rules a found item matched. Returns the matches
+    def showRules (self, result):
+        rules = result.get("rules") or []
+
+        #If item matched any status/location rules (in process, in a temp location, not from this library...), show each one's message.
+        #The first one in settings.json decides the colour, and unless it's a warning/error the user can carry on scanning
+        if rules:
+            message = "\n".join(rule["message"] for rule in rules)
+            if rules[0]["colour"] not in ("warning", "error"):
+                message = f"Scan next barcode to continue \n{message}"
+            self.statustext.configure(text= message)
+            self.frameState(rules[0]["colour"])
+
+        #Otherwise show all clear status
+        else:
+            self.statustext.configure(text= "Scan next barcode to continue")
+            self.frameSuccess()
+        return rules
+
+
+    #Flags an item that's out of shelf order, or the item scanned just before it if that's the one out of place
+    def showShelfOrder (self, result):
+        verdict, other = self.shelforder.check(result["barcode"], result["callnumber"], result.get("shelfkey"))
+        if verdict == "misshelved":
+            logging.warning(f"Barcode {result['barcode']} is out of shelf order: {result['callnumber']} belongs before {other[3]} (barcode {other[2]}).")
+            message = f"Out of shelf order: belongs before {other[3]}"
+            misshelved = self.history.get(result["scanid"])
+        elif verdict == "previous":
+            logging.warning(f"Barcode {other[2]} is out of shelf order: {other[3]} was shelved before {result['callnumber']} (barcode {result['barcode']}).")
+            message = f"Previous item ({other[3]}) is out of shelf order"
+            misshelved = self.history.latest(other[2])
+        else:
+            return
+        self.statustext.configure(text= self.statustext.cget("text") + f"\n{message}")
+        if misshelved is not None and misshelved.state not in ("warning", "error"):
+            misshelved.state = "misshelved"
+        #An item a rule says to set aside (e.g. one with a process status) keeps its yellow/red frame
+        rules = result.get("rules") or []
+        if not rules or rules[0]["colour"] not in ("warning", "error"):
+            self.frameMisshelved()
+
+
+    #Second phase: the update finished. Patches the screen if the item is still showing, and puts failed saves on the retry list
+    def showSaveStatus (self, result):
+        self.awaitingSave.discard(result["scanid"])
+        onscreen = self.displayedScan == result["scanid"]
+
+        #Shown from the shelf list or item cache, but Alma's current record has a different process status/location: show that instead
+        if result.get("corrected"):
+            rules = result.get("rules") or []
+            entry = self.history.get(result["scanid"])
+            if entry is not None:
+                entry.state = finished_state(rules[0]["colour"] if rules else "success", outcome_of(result))
+                self.drawHistory()
+            if onscreen:
+                self.update_item_display(result["barcode"], result["title"], result["author"], result["location"], result["callnumber"], result["desc"])
+                self.showRules(result)
+                self.statustext.configure(text= self.statustext.cget("text") + "\n(Status changed in Alma since it was listed)")
+
+        if result["updatestatus"] == False:
+            self.failedSaves.append((result["barcode"], result["scanid"], result["scandate"]))
+            self.showRetryButton()
+            if onscreen:
+                self.finalupdate(result["updatestatus"], result["updatepush"])
+                self.savetext.configure(text=f"Barcode {result['barcode']} not saved, added to retry list")
+        elif onscreen:
+            self.savetext.configure(text=bulk_messages.get(result.get("bulk"), "Saved to Alma"))
+
+
+    #Shows or hides the retry button with the number of failed saves
+    def showRetryButton (self):
+        if self.failedSaves:
+            self.retryButton.configure(text=f"Retry failed saves ({len(self.failedSaves)})")
+            self.retryButton.grid()
+        else:
+            self.retryButton.grid_remove()
+
+
+    #Sends every failed save through the worker again (full lookup, in case the record changed in the meantime),
+    #with the date each one was first scanned, the same as the offline queue and inventory_recover.py
+    def retryFailedSaves (self):
+        stillfailed = []
+        for barcode, scanid, scandate in self.failedSaves:
+            #Anything that doesn't fit in the window stays on the list for the next try
+            if not self.worker.submit(barcode, scanid=scanid, scandate=scandate, retry=True):
+                stillfailed.append((barcode, scanid, scandate))
+                continue
+            logging.info(f"Barcode {barcode} resubmitted from retry list.")
+            self.submitted[scanid] = time.perf_counter()
+            if self.pending == 0:
+                self.runProgressBar()
+            self.pending += 1
+        self.failedSaves = stillfailed
+        self.showRetryButton()
+
+
+    #Switches to offline mode: scans keep being accepted and saved locally until Alma can be reached again.
+    #popup asks the user to check the internet connection (left out when Alma answered but was busy or down)
+    def goOffline (self, popup=True):
+        self.offline = True
+        if popup:
+            self.connectError()
+        self.startReplay()
+
+
+    #Shows how many scans are waiting in the offline queue
+    def showQueueCount (self):
+        self.statusline.configure(text=f"Offline: {self.journal.queued_count()} scans waiting to be sent to Alma")
+
+
+    #Starts the background thread that waits for the connection and then sends the offline queue
+    def startReplay (self):
+        if not self.replaying:
+            self.replaying = True
+            threading.Thread(target=self.replayLoop, name="replay", daemon=True).start()
+
+
+    #Runs on its own thread: checks the connection every few seconds, then replays every queued scan with its original scan date
+    def replayLoop (self):
+        from requests.exceptions import ConnectionError, Timeout
+        scannerReady.wait()
+        if scanner is None:
+            self.replaying = False
+            return
+        limiter = TokenBucket(replay_settings.get('per_second', 5))
+        while True:
+            try:
+                scanner.check_connection()
+            except (ConnectionError, Timeout):
+                time.sleep(replay_settings.get('retry_seconds', 30))
+                continue
+
+            counts = replay_queued(self.journal, process_barcode, replay_settings.get('workers', 4), limiter)
+            #Connection dropped again partway through, whatever's left is still queued
+            if counts.get("queued"):
+                time.sleep(replay_settings.get('retry_seconds', 30))
+                continue
+
+            #Hands the summary back to the Tk thread through the worker's result queue
+            self.worker.post({"replayed": counts})
+            return
+
+
+    #Back online once the queue is empty (called on the Tk thread)
+    def replayFinished (self, counts):
+        self.replaying = False
+        self.offline = False
+        total = sum(counts.values())
+        logging.info(f"Offline queue sent to Alma. {total} scans replayed: {counts}")
+        self.statusline.configure(text=f"Connection restored: {total} saved scans sent to Alma ({counts.get('updated', 0)} updated, {total - counts.get('updated', 0)} need attention, see log)")
+
+        #Scans saved while the last batch was sending still need to go
+        if self.journal.queued_count() > 0:
+            self.startReplay()
+
+
+    #Refreshes the API throughput/quota line every few seconds
+    def showApiStats (self, gui):
+        stats = client.stats() if client is not None else None
+        if stats is not None and stats["calls"] > 0:
+            remaining = stats["remaining"] if stats["remaining"] is not None else "?"
+            self.apiline.configure(text=f"Alma API: {stats['per_second'] * 60:.0f} calls/min, {remaining} calls left today")
+        if self.perfline is not None:
+            self.showTimings()
+        gui.after(5000, lambda: self.showApiStats(gui))
+
+
+    #Scan timing panel: items per hour, median/p95 time per scan and error rate, then median/p95 for each stage
+    def showTimings (self):
+        if scanner is None:
+            return
+        summary = scanner.metrics.summary()
+        if summary is None or summary["median"] is None:
+            return
+        itemsperhour = f"{summary['items_per_hour']:.0f}" if summary["items_per_hour"] is not None else "-"
+        stages = "  ".join(f"{name} {p50:.0f}/{p95:.0f}" for name, (p50, p95) in summary["stages"].items())
+        self.perfline.configure(text=f"{itemsperhour} items/hour, scan median {summary['median']:.0f} ms, p95 {summary['p95']:.0f} ms, {summary['error_rate']:.0%} errors \n{stages} ms (median/p95)")
+
+
+    #Puts a new scan at the top of the history. If the list is scrolled down, it stays on the rows being looked at
+    def addHistory (self, scanid, barcode, state):
+        self.history.add(HistoryEntry(scanid, barcode, state=state))
+        if self.historyTop > 0:
+            self.historyTop += 1
+        self.drawHistory()
+
+
+    #Redraws the visible history rows (only the ones whose text or colour changed) and moves the scrollbar to match
+    def drawHistory (self):
+        entries = self.history.rows(self.historyTop, len(self.historyRows))
+        for n, row in enumerate(self.historyRows):
+            if n < len(entries):
+                entry = entries[n]
+                shown = (f"{entry.barcode}  {entry.callnumber}\n{entry.title[:40]}", state_colours[entry.state])
+            else:
+                shown = ("", "transparent")
+            if shown != self.historyShown[n]:
+                row.configure(text=shown[0], fg_color=shown[1])
+                self.historyShown[n] = shown
+        total = len(self.history)
+        if total:
+            self.historyBar.set(self.historyTop / total, min(1, (self.historyTop + len(entries)) / total))
+
+
+    #Scrollbar and mouse wheel: ("moveto", fraction) or ("scroll", count, "units"/"pages")
+    def scrollHistory (self, *args):
+        visiblerows = len(self.historyRows)
+        if args[0] == "moveto":
+            top = int(float(args[1]) * len(self.history))
+        else:
+            top = self.historyTop + int(args[1]) * (visiblerows if args[2] == "pages" else 1)
+        self.historyTop = max(0, min(top, len(self.history) - visiblerows))
+        self.drawHistory()
 
 
     #Updates the central item information display with the parsed information from the item scanned
@@ -351,6 +744,9 @@ class Widget:
     
 
 def main():
+    load_settings()
+    #The scanner loads while the window is being built
+    threading.Thread(target=warm_up, name="warm_up", daemon=True).start()
     ctk.set_appearance_mode("System")  # Modes: system (default), light, dark
     ctk.set_default_color_theme("blue")
     root = ctk.CTk()
@@ -1,17 +1,20 @@
+from bootstrap import local_path
 import PySimpleGUI as sg
 from datetime import datetime
 import logging
-from inventory_date_functions import scan_barcode, retreive_item_data, update_inventory_date, check_item_status, loading_animation, stop_animation
+from inventory_date_functions import scan_barcode, retreive_item_data, update_inventory_date, check_item_status, loading_animation, stop_animation, open_item_cache, client_settings
 import configparser
+import threading
+from inventory_date_functions import start_logging, warm_up
 
 default_message = "Please scan barcode to continue"
 
-#Sets up logging
-logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, filename="inventory_update.log", datefmt='%Y-%m-%d %H:%M:%S')
+#Sets up logging (written by a background thread so it never holds up the window, rotated and compressed when it gets big)
+start_logging()
 
 #Pulls in config file
 config = configparser.ConfigParser()
-config.read("inventory_settings.ini")
+config.read(local_path("inventory_settings.ini"))
 
 #Parameters!
 bibapi = config.get("main", "bibapi")
@@ -21,6 +24,16 @@ theme = config.get("style", "theme")
 font_size = config.get("style", "font_size")
 font_family = config.get("style", "font_family")
 
+#Alma connection (pool, timeouts, rate limit, retries), set the same way as in the CustomTKinter version
+alma_settings = client_settings(config, alma_base, bibapi, {"Accept": "application/xml", "Content-Type": "application/xml"})
+
+#Item cache shared with the CustomTKinter version (leave file blank to turn it off)
+cache_file = config.get("cache", "file", fallback="")
+if cache_file:
+    item_cache = open_item_cache(local_path(cache_file), config.getint("cache", "found_ttl_seconds", fallback=604800), config.getint("cache", "not_found_ttl_seconds", fallback=86400), config.getint("cache", "max_items", fallback=50000))
+else:
+    item_cache = None
+
 
 #Takes note of current date
 rawdate=datetime.now().strftime("%Y-%m-%d")
@@ -83,10 +96,12 @@ def main_window():
 
     #Window details
     window_title = "Alma Inventory Date Updater"
-    window = sg.Window(window_title, layout, icon="inventory_icon.ico", grab_anywhere=True, finalize=True)
+    window = sg.Window(window_title, layout, icon=local_path("inventory_icon.ico"), grab_anywhere=True, finalize=True)
 
     window['-ITEM_BARCODE-'].bind("<Return>", "_Enter")
 
+    threading.Thread(target=warm_up, daemon=True).start()
+
     #Actually runs the thing
     while True:
         event, values = window.read()
@@ -107,7 +122,13 @@ def main_window():
             window['-TONEXT-'].update("", background_color=None)  
 
             #Search for barcode
-            founditem, r, headers = scan_barcode(barcode, alma_base, bibapi)
+            founditem, r, headers = scan_barcode(barcode, alma_settings, item_cache)
+
+            #Couldn't reach Alma, nothing was checked or changed
+            if founditem is None:
+                window['-STATUS-'].update("Could not connect to Alma", background_color="tomato", text_color="black", font="bold")
+                logging.error(f"Could not connect to Alma, barcode {barcode} not checked")
+                window['-TONEXT-'].update("Please check the connection and scan again", background_color="tomato", text_color="black", font="bold")
 
             #If it finds the barcode display success message, find metadata to use to update display, and attempt to update inventory date in Alma
             if founditem == True:
@@ -141,16 +162,22 @@ def main_window():
                     window['-TONEXT-'].update("Please wait...Updating Record", text_color="black", background_color=None)
 
                     #Run function to update inventory date in Alma
-                    updatestatus, updatepush = update_inventory_date(itemdata, mmsid, holdid, itemid, bibapi, headers, alma_base)
+                    updatestatus, updatepush = update_inventory_date(itemdata, mmsid, holdid, itemid, alma_settings)
                     logging.info(f"Update data response: {updatepush}")
 
                     #If date was updated show success message, if it wasn't for whever reason display error message and log status
                     if updatestatus == True:
                         window['-TONEXT-'].update("Scan next barcode to continue", text_color="green4", background_color="azure1", font="bold")
-                        logging.info("Inventory date updated!")
+                        logging.info(f"Inventory date updated! Barcode {barcode}")
+                        #The cached copy now has the date just sent, the same as after an update in the CustomTKinter version
+                        if item_cache is not None:
+                            item_cache.updated(barcode, scandate, itemdata.encode('utf-8'))
                     if updatestatus == False:
                         window['-TONEXT-'].update("Item information was not updated. Please try again", background_color="tomato", text_color="black", font="bold")
                         logging.error(f"Inventory date not updated? Barcode {barcode}")
+                    if updatestatus is None:
+                        window['-TONEXT-'].update("Could not connect to Alma, item was not updated. Please try again", background_color="tomato", text_color="black", font="bold")
+                        logging.error(f"Could not connect to Alma, barcode {barcode} not updated")
 
                 
             #If item wasn't found by barcode, prompt user to set aside and scan next item to continue
@@ -0,0 +1,15 @@
+import os
+import sys
+
+#Sets up the paths this version needs, imported before anything else in Inventory_Date_GUI.py
+
+#This version's folder, and the main project folder with the shared inventory_core package
+PSG_FOLDER = os.path.dirname(os.path.abspath(__file__))
+PROJECT_FOLDER = os.path.dirname(PSG_FOLDER)
+
+if PROJECT_FOLDER not in sys.path:
+    sys.path.insert(0, PROJECT_FOLDER)
+
+#Files named in inventory_settings.ini (and the settings file itself) are found from this folder, wherever the program is started from
+def local_path (path):
+    return os.path.join(PSG_FOLDER, path)
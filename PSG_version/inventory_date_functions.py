@@ -1,31 +1,85 @@
+import PySimpleGUI as sg
+
+#Uses the shared inventory_core package from the main project folder (bootstrap.py puts it on the path)
+
+#Same queued, rotating log as the CustomTKinter version
+def start_logging ():
+    from inventory_core.log_setup import setup_logging
+    setup_logging("inventory_update.log")
+
+#Imports what the first scan needs (requests, the Alma client, BeautifulSoup) on a background thread once the window is up,
+#so the window opens without waiting for them and the first scan doesn't either
+def warm_up ():
+    import bs4
+    import inventory_core.alma_client
+    import inventory_core.resilience
+
 def loading_animation ():
-    import PySimpleGUI as sg
     #Loading animation while the function runs
     sg.popup_animated(sg.DEFAULT_BASE64_LOADING_GIF, text_color="black", background_color='white', transparent_color='white', keep_on_top=True, message="Waiting...")
 
 def stop_animation ():
-    import PySimpleGUI as sg
     #Stops progress animation popup 
     sg.popup_animated(None)
+
+#Settings for the Alma connection, in the same shape as the CustomTKinter version's settings.json ([http], [rate_limit], [retry]
+#and [circuit_breaker] in inventory_settings.ini, any left out use the defaults)
+def client_settings (config, alma_base, bibapi, headers):
+    settings = {"alma_base": alma_base, "bibapi": bibapi, "headers": headers}
+    for section in ("http", "rate_limit", "retry", "circuit_breaker"):
+        if config.has_section(section):
+            settings[section] = {key: float(value) if "." in value else int(value) for key, value in config.items(section)}
+    return settings
+
+_client = None
+
+#Pooled keep-alive client shared by the lookup and the update, made on first use
+def alma_client (settings):
+    global _client
+    if _client is None:
+        from inventory_core.alma_client import client_from_settings
+        _client = client_from_settings(settings)
+    return _client
   
-#Look up item by barcode, if found get item record XML
-def scan_barcode (barcode, alma_base, bibapi):
-    import requests
+#Opens the item cache shared with the CustomTKinter version (same file format, so both can point at the same file)
+def open_item_cache (path, found_ttl_seconds, not_found_ttl_seconds, max_items):
+    from inventory_core.item_cache import ItemCache
+    return ItemCache(path, found_ttl_seconds, not_found_ttl_seconds, max_items)
 
-    loading_animation()
+#Look up item by barcode, if found get item record XML (founditem is None if Alma couldn't be reached)
+def scan_barcode (barcode, settings, item_cache=None):
+    from requests.exceptions import ConnectionError, Timeout
+    from inventory_core.resilience import classify
 
     #Set up default things for base URL and bib API key
+    alma_base = settings["alma_base"]
+    bibapi = settings["bibapi"]
+    headers = settings["headers"]
+
+    #Barcode Alma already said doesn't exist (in either version of the program), no need to ask again
+    if item_cache is not None:
+        cached = item_cache.get(barcode)
+        if cached is not None and not cached[0]:
+            return(False, None, headers)
 
-    headers = {"Accept": "application/xml", "Content-Type": "application/xml"}
+    loading_animation()
 
-    r = requests.get(f"{alma_base}/items?view=label&item_barcode={barcode}&apikey={bibapi}", headers=headers)
+    #Network down, timed out, or Alma failing so often the client has stopped trying for now (CircuitOpenError is a ConnectionError)
+    try:
+        r = alma_client(settings).get(f"{alma_base}/items?view=label&item_barcode={barcode}&apikey={bibapi}")
+    except (ConnectionError, Timeout):
+        return(None, None, headers)
+    finally:
+        stop_animation()
 
     if r.status_code != 200:
         founditem = False
+        if item_cache is not None and classify(r) == "not_found":
+            item_cache.put_missing(barcode)
     else:
         founditem = True
-      
-    stop_animation()
+        if item_cache is not None:
+            item_cache.put_record(barcode, r.content)
 
     return(founditem, r, headers)
 
@@ -55,8 +109,6 @@ def check_item_status (r):
 
 #Parses item data XML to find elements for display and eventual record update
 def retreive_item_data (soup, scandate):
-    from bs4 import BeautifulSoup
-    
     loading_animation()
 
     #Locate identifiers in data (used for update request)
@@ -99,21 +151,26 @@ def retreive_item_data (soup, scandate):
     return(itemdata, mmsid, holdid, itemid, title, author, callnumber)
 
 
-#Update Alma item record 
-def update_inventory_date(itemdata, mmsid, holdid, itemid, bibapi, headers, alma_base):
-    import requests
+#Update Alma item record (updatestatus is None if Alma couldn't be reached)
+def update_inventory_date(itemdata, mmsid, holdid, itemid, settings):
+    from requests.exceptions import ConnectionError, Timeout
 
-    loading_animation()
+    alma_base = settings["alma_base"]
+    bibapi = settings["bibapi"]
 
+    loading_animation()
 
     #This should be the XML body data to send back in as a PUT 
-    updatepush = requests.put(f"{alma_base}/bibs/{mmsid}/holdings/{holdid}/items/{itemid}?generate_description=false&apikey={bibapi}", data=itemdata.encode('utf-8'),headers=headers)
+    try:
+        updatepush = alma_client(settings).put(f"{alma_base}/bibs/{mmsid}/holdings/{holdid}/items/{itemid}?generate_description=false&apikey={bibapi}", data=itemdata.encode('utf-8'))
+    except (ConnectionError, Timeout):
+        return(None, None)
+    finally:
+        stop_animation()
 
     if updatepush.status_code != 200:
         updatestatus = False
     else:
         updatestatus = True
 
-    stop_animation()
-
     return(updatestatus, updatepush)
@@ -0,0 +1 @@
+#Benchmarks for the inventory date updater, run from the main project folder with python -m benchmarks.<name>
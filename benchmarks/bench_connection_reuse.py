@@ -0,0 +1,43 @@
+import time
+
+import requests
+
+from benchmarks.mock_alma import start_mock_server
+from inventory_core.alma_client import AlmaClient
+
+SCANS = 200
+HEADERS = {"Accept": "application/xml", "Content-Type": "application/xml"}
+
+
+#One scan = the barcode GET plus the inventory date PUT, same as the GUI does
+def run_scans(get, put, alma_base):
+    start = time.perf_counter()
+    for n in range(SCANS):
+        r = get(f"{alma_base}/items?view=label&item_barcode=B{n}&apikey=test")
+        put(f"{alma_base}/bibs/991234/holdings/221234/items/231234?generate_description=false&apikey=test", data=r.content)
+    return time.perf_counter() - start
+
+
+def main():
+    server, alma_base = start_mock_server()
+
+    #Old behaviour: bare requests.get/requests.put, new connection every call
+    server.connections = 0
+    bare = run_scans(lambda url: requests.get(url, headers=HEADERS), lambda url, data: requests.put(url, data=data, headers=HEADERS), alma_base)
+    bare_connections = server.connections
+
+    #Shared pooled session
+    server.connections = 0
+    client = AlmaClient(alma_base, "test", HEADERS)
+    pooled = run_scans(client.get, client.put, alma_base)
+    pooled_connections = server.connections
+    client.close()
+
+    print(f"{SCANS} scans (GET + PUT each) against local mock server")
+    print(f"bare requests:  {bare:.3f}s  {bare / SCANS * 1000:.2f} ms/scan  {bare_connections} connections opened")
+    print(f"pooled session: {pooled:.3f}s  {pooled / SCANS * 1000:.2f} ms/scan  {pooled_connections} connections opened")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_alma import start_mock_server
+from inventory_core.coordinator import CoordinatorClient, RemoteScanner, start_coordinator
+from inventory_core.scan_journal import outcome_of
+from inventory_core.scanning import Scanner
+from inventory_core.telemetry import ScanMetrics
+
+
+#Settings pointing at the mock. The per-second limit is the one every Scanner applies on its own
+def mock_settings(alma_base, per_second, window):
+    with open("settings.json") as config_file:
+        settings = json.load(config_file)
+    settings.update({"alma_base": alma_base, "bibapi": "benchmark"})
+    settings["rate_limit"] = {"per_second": per_second, "burst": per_second}
+    settings.setdefault("http", {})["pool_size"] = max(window * 4, 10)
+    settings["item_cache"] = {}
+    settings["code_tables"] = {}
+    settings["bulk_export"] = {}
+    return settings
+
+
+#Barcodes for each station: mostly their own, plus every so often one that every station scans at about the same time
+def station_barcodes(stations, items, overlap):
+    every = max(1, round(1 / overlap)) if overlap else None
+    return [[f"SHARED{n}" if every and n % every == 0 else f"ST{station}-{n}" for n in range(items)] for station in range(stations)]
+
+
+#Every station scanning its barcodes at once, window scans in flight each. handlers[n](barcode, on_lookup) runs one scan for station n.
+#Returns (elapsed seconds, outcome counts, seconds from scan to the item being on screen)
+def run_stations(handlers, barcodes, window):
+    counts = {}
+    shown = []
+    lock = threading.Lock()
+
+    def station(handler, station_barcodes):
+        def scan(barcode):
+            start = time.perf_counter()
+            seen = []
+            result = handler(barcode, lambda lookup: seen.append(time.perf_counter()))
+            with lock:
+                outcome = outcome_of(result)
+                counts[outcome] = counts.get(outcome, 0) + 1
+                shown.append((seen[0] if seen else time.perf_counter()) - start)
+
+        with ThreadPoolExecutor(max_workers=window) as pool:
+            list(pool.map(scan, station_barcodes))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=station, args=(handler, station_barcodes)) for handler, station_barcodes in zip(handlers, barcodes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, counts, shown
+
+
+def report(name, server, elapsed, counts, shown, per_second):
+    busiest = max(server.per_second.values())
+    total = sum(counts.values())
+    print(f"{name}: {total} scans in {elapsed:.1f}s ({total / elapsed:.1f} items/s), {server.calls} Alma calls, busiest second {busiest} calls (limit {per_second}/s) {counts}")
+    print(f"  item on screen p50 {statistics.median(shown) * 1000:.0f} ms, p95 {statistics.quantiles(shown, n=20)[18] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Several scanning stations against a local mock Alma: each with its own connection and rate limit, then all through one coordinator.")
+    parser.add_argument("--stations", type=int, default=8)
+    parser.add_argument("--items", type=int, default=30, help="scans per station")
+    parser.add_argument("--overlap", type=float, default=0.2, help="fraction of each station's barcodes that every station scans")
+    parser.add_argument("--window", type=int, default=4, help="scans in flight per station")
+    parser.add_argument("--per-second", type=int, default=20, help="Alma calls per second allowed")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Alma response time in seconds")
+    args = parser.parse_args()
+
+    barcodes = station_barcodes(args.stations, args.items, args.overlap)
+
+    #Before: every station with a Scanner (connection pool and rate limiter) of its own
+    server, alma_base = start_mock_server(latency=args.latency)
+    settings = mock_settings(alma_base, args.per_second, args.window)
+    scanners = [Scanner(settings) for _ in range(args.stations)]
+    handlers = [lambda barcode, on_lookup, scanner=scanner: scanner.run_scan(barcode, on_lookup=on_lookup) for scanner in scanners]
+    elapsed, counts, shown = run_stations(handlers, barcodes, args.window)
+    report("Independent stations", server, elapsed, counts, shown, args.per_second)
+    server.shutdown()
+
+    #After: every station sending its scans to one coordinator
+    server, alma_base = start_mock_server(latency=args.latency)
+    settings = mock_settings(alma_base, args.per_second, args.window * args.stations)
+    coordinator, url = start_coordinator(Scanner(settings), "127.0.0.1", 0)
+    remotes = [RemoteScanner(CoordinatorClient(url, f"station{n}", pool_size=args.window), ScanMetrics()) for n in range(args.stations)]
+    handlers = [lambda barcode, on_lookup, remote=remote: remote.run_scan(barcode, on_lookup=on_lookup) for remote in remotes]
+    elapsed, counts, shown = run_stations(handlers, barcodes, args.window)
+    report("Through the coordinator", server, elapsed, counts, shown, args.per_second)
+    stats = coordinator.coordinator.stats()
+    print(f"  {stats['shared']} scans shared with another station's scan in progress")
+    coordinator.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
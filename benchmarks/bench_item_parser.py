@@ -0,0 +1,38 @@
+import timeit
+
+from benchmarks.mock_alma import ITEM_XML
+from inventory_core.item_parser import parse_item_fast, parse_item_soup
+
+SCANDATE = "2024-01-01Z"
+RUNS = 500
+
+
+#Item record padded out with the public/fulfillment/internal notes and statistics fields a well-used record picks up
+def noted_record(notes):
+    extra = "".join(f"<internal_note_{n % 3 + 1}>Note {n}: checked during shelf read, spine label replaced</internal_note_{n % 3 + 1}>\n<statistics_note_{n % 3 + 1}>STAT{n}</statistics_note_{n % 3 + 1}>\n" for n in range(notes))
+    return ITEM_XML.replace("<inventory_price></inventory_price>\n", f"<inventory_price></inventory_price>\n{extra}").replace("{barcode}", "39000001234567").encode("utf-8")
+
+
+def main():
+    records = {
+        "plain item": ITEM_XML.replace("{barcode}", "39000001234567").encode("utf-8"),
+        "with inventory date": ITEM_XML.replace("<inventory_number></inventory_number>", "<inventory_number></inventory_number><inventory_date>2020-05-01Z</inventory_date>").replace("{barcode}", "39000001234567").encode("utf-8"),
+        "30 notes/stats": noted_record(30),
+    }
+
+    print(f"Parse + set inventory date + serialize, average of {RUNS} runs")
+    for name, content in records.items():
+        #Both parsers must agree on everything but formatting of the serialized record
+        fast = parse_item_fast(content, SCANDATE)
+        soup = parse_item_soup(content, SCANDATE)
+        assert {k: v for k, v in fast.items() if k != "itemdata"} == {k: v for k, v in soup.items() if k != "itemdata"}, name
+
+        fast_time = timeit.timeit(lambda: parse_item_fast(content, SCANDATE), number=RUNS) / RUNS
+        soup_time = timeit.timeit(lambda: parse_item_soup(content, SCANDATE), number=RUNS) / RUNS
+        #Minimal rewrite skips re-serializing, the date is spliced into the original bytes
+        minimal_time = timeit.timeit(lambda: parse_item_fast(content, SCANDATE, minimal=True), number=RUNS) / RUNS
+        print(f"{name:<22} fast: {fast_time * 1e6:8.1f} us  fast+minimal: {minimal_time * 1e6:8.1f} us  soup: {soup_time * 1e6:8.1f} us  ({soup_time / minimal_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import io
+import json
+import statistics
+import time
+
+from benchmarks.mock_alma import start_mock_server
+from inventory_batch import run_batch
+from inventory_core.scan_worker import ScanWorker
+from inventory_core.scanning import Scanner, today_scandate
+
+
+#p50/p95/p99 of a list of seconds, in milliseconds
+def percentiles(samples):
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+def report(name, samples):
+    p50, p95, p99 = percentiles(samples)
+    print(f"  {name:<8} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+#Settings pointing at the mock, with the rate limiter opened up so it doesn't hide the latency being measured
+def mock_settings(alma_base, workers):
+    with open("settings.json") as config_file:
+        settings = json.load(config_file)
+    settings.update({"alma_base": alma_base, "bibapi": "benchmark"})
+    settings["rate_limit"] = {"per_second": 100000, "burst": 100000}
+    settings.setdefault("http", {})["pool_size"] = max(workers, 10)
+    #Every barcode is unique anyway, the caches would only add noise (and the item cache would carry over between runs)
+    settings["duplicate_cache"] = {"size": 0}
+    settings["item_cache"] = {}
+    settings["code_tables"] = {}
+    settings["bulk_export"] = {}
+    return settings
+
+
+#One scan at a time, timing each step the way the GUI runs them
+def sequential(scanner, count):
+    stages = {"lookup": [], "parse": [], "update": [], "total": []}
+    scandate = today_scandate()
+    start = time.perf_counter()
+    for n in range(count):
+        t0 = time.perf_counter()
+        founditem, connectFail, r = scanner.scan_barcode(f"SEQ{n}")
+        t1 = time.perf_counter()
+        itemdata, mmsid, holdid, itemid = scanner.retreive_item_data(r, scandate)[:4]
+        t2 = time.perf_counter()
+        scanner.update_inventory_date(itemdata, mmsid, holdid, itemid)
+        t3 = time.perf_counter()
+        stages["lookup"].append(t1 - t0)
+        stages["parse"].append(t2 - t1)
+        stages["update"].append(t3 - t2)
+        stages["total"].append(t3 - t0)
+    elapsed = time.perf_counter() - start
+    print(f"Sequential scans ({count} items): {count / elapsed:.1f} items/s")
+    for name, samples in stages.items():
+        report(name, samples)
+
+
+#GUI background worker with a window of scans in flight, timing scan-to-result for each barcode.
+#Results have to come back in scan order whatever the window size
+def worker_pool(scanner, count, window):
+    submitted = {}
+    latencies = []
+    order = []
+    worker = ScanWorker(scanner.process_barcode, window)
+    start = time.perf_counter()
+    for n in range(count):
+        submitted[f"WRK{window}-{n}"] = time.perf_counter()
+        worker.submit(f"WRK{window}-{n}")
+    while len(latencies) < count:
+        for result in worker.drain():
+            latencies.append(time.perf_counter() - submitted[result["barcode"]])
+            order.append(result["barcode"])
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    worker.stop()
+    assert order == list(submitted), "results out of scan order"
+    print(f"Background worker, window {window} ({count} items submitted at once): {count / elapsed:.1f} items/s")
+    report("total", latencies)
+
+
+#Headless batch mode over the same mock
+def batch(scanner, count, workers):
+    start = time.perf_counter()
+    run_batch(scanner, (f"BAT{n}" for n in range(count)), io.StringIO(), workers)
+    elapsed = time.perf_counter() - start
+    print(f"Batch mode, {workers} workers ({count} items): {count / elapsed:.1f} items/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan-to-feedback latency against a local mock Alma server.")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated Alma response time in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server, alma_base = start_mock_server(latency=args.latency)
+    scanner = Scanner(mock_settings(alma_base, args.workers))
+    print(f"Mock Alma latency {args.latency * 1000:.0f} ms per request\n")
+    sequential(scanner, args.items)
+    #Throughput should grow with the window instead of stopping at one item per round trip
+    for window in (1, 2, 4, args.workers):
+        worker_pool(scanner, args.items, window)
+    batch(scanner, args.items, args.workers)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Each measurement runs in a fresh interpreter (nothing already imported or cached), in a scratch folder so the log, journal
+#and caches it creates don't touch the real ones. Every script prints "name milliseconds" lines
+CUSTOMTKINTER = """
+import time
+start = time.perf_counter()
+import Inventory_Date_complete_customtkinter as app
+print("import", (time.perf_counter() - start) * 1000)
+app.load_settings()
+print("settings", (time.perf_counter() - start) * 1000)
+app.warm_up()
+print("scanner_ready", (time.perf_counter() - start) * 1000)
+"""
+
+#Window on its own, with the scanner warming up on its thread the way main() does it
+CUSTOMTKINTER_WINDOW = """
+import threading, time, tkinter
+start = time.perf_counter()
+import Inventory_Date_complete_customtkinter as app
+app.load_settings()
+threading.Thread(target=app.warm_up, daemon=True).start()
+try:
+    root = app.ctk.CTk()
+except tkinter.TclError:
+    raise SystemExit(0)
+interface = app.Widget(root)
+root.update()
+print("window_shown", (time.perf_counter() - start) * 1000)
+app.scannerReady.wait()
+print("first_scan_ready", (time.perf_counter() - start) * 1000)
+root.destroy()
+"""
+
+PYSIMPLEGUI = """
+import time
+start = time.perf_counter()
+try:
+    import PySimpleGUI
+except ImportError:
+    raise SystemExit(0)
+import inventory_date_functions
+print("import", (time.perf_counter() - start) * 1000)
+inventory_date_functions.warm_up()
+print("scanner_ready", (time.perf_counter() - start) * 1000)
+"""
+
+
+#Copy of settings.json for the scratch folder: same settings, but no shelf list (it's loaded from a file that may not be there),
+#and the code tables are read from the real folder's file without refreshing them from Alma
+def scratch_settings(directory):
+    with open(os.path.join(ROOT, "settings.json")) as config_file:
+        settings = json.load(config_file)
+    settings["shelf_list"] = {}
+    code_tables = settings.get("code_tables", {})
+    if code_tables.get("file"):
+        settings["code_tables"] = dict(code_tables, file=os.path.join(ROOT, code_tables["file"]), refresh=False)
+    with open(os.path.join(directory, "settings.json"), "w") as config_file:
+        json.dump(settings, config_file)
+
+
+#Runs a script once, returns its timings plus the whole process's wall time (interpreter start up included)
+def run_once(script, directory):
+    #The PySimpleGUI version's folder is on the path the way it is when that version runs
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join((ROOT, os.path.join(ROOT, "PSG_version"))))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", script], cwd=directory, env=environment, capture_output=True, text=True, check=True).stdout
+    process = (time.perf_counter() - start) * 1000
+    timings = {}
+    for line in output.splitlines():
+        name, milliseconds = line.split()
+        timings[name] = float(milliseconds)
+    if timings:
+        timings["process"] = process
+    return timings
+
+
+def measure(name, script, runs, directory):
+    samples = {}
+    for _ in range(runs):
+        for stage, milliseconds in run_once(script, directory).items():
+            samples.setdefault(stage, []).append(milliseconds)
+    if not samples:
+        print(f"{name}: skipped (not installed, or no display)")
+        return
+    print(f"{name} (median of {runs} runs):")
+    for stage, values in samples.items():
+        print(f"  {stage:<18} {statistics.median(values):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of both front-ends: module import, and time until the first scan can be handled.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="inventory_startup_")
+    try:
+        scratch_settings(directory)
+        measure("CustomTkinter version", CUSTOMTKINTER, args.runs, directory)
+        measure("CustomTkinter window", CUSTOMTKINTER_WINDOW, args.runs, directory)
+        measure("PySimpleGUI version", PYSIMPLEGUI, args.runs, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+#Item record in the shape Alma returns from GET /items?item_barcode=
+ITEM_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<item link="https://api-na.hosted.exlibrisgroup.com/almaws/v1/bibs/991234/holdings/221234/items/231234">
+<bib_data link="https://api-na.hosted.exlibrisgroup.com/almaws/v1/bibs/991234">
+<mms_id>991234</mms_id>
+<title>The mock record : a test title /</title>
+<author>Tester, Example.</author>
+</bib_data>
+<holding_data link="https://api-na.hosted.exlibrisgroup.com/almaws/v1/bibs/991234/holdings/221234">
+<holding_id>221234</holding_id>
+<call_number_type desc="Library of Congress classification">0</call_number_type>
+<call_number>QA76.73.P98 T47 2020</call_number>
+<in_temp_location>false</in_temp_location>
+<temp_library/>
+<temp_location/>
+</holding_data>
+<item_data>
+<pid>231234</pid>
+<barcode>{barcode}</barcode>
+<policy desc="Regular loan">01</policy>
+<description></description>
+<library desc="Main Library">MAIN</library>
+<location desc="Main Stacks">STACKS</location>
+<process_type desc=""/>
+<inventory_number></inventory_number>
+<inventory_price></inventory_price>
+</item_data>
+</item>
+"""
+
+#PROCESSTYPE code table rows the mock serves
+MOCK_PROCESS_TYPES = {"LOAN": "On Loan", "MISSING": "Missing", "TECHNICAL": "Technical - Migration", "WORK_ORDER_DEPARTMENT": "In Work Order"}
+
+#What Alma sends back for a barcode it doesn't have (HTTP 400)
+NOT_FOUND_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<web_service_result xmlns="http://com/exlibris/urm/general/xmlbeans"><errorsExist>true</errorsExist><errorList><error><errorCode>401689</errorCode><errorMessage>No items found for barcode {barcode}.</errorMessage></error></errorList></web_service_result>
+"""
+
+#What Alma sends back when the per-second threshold is hit (HTTP 429)
+THROTTLED_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<web_service_result xmlns="http://com/exlibris/urm/general/xmlbeans"><errorsExist>true</errorsExist><errorList><error><errorCode>PER_SECOND_THRESHOLD</errorCode><errorMessage>HTTP requests are more than allowed per second</errorMessage></error></errorList></web_service_result>
+"""
+
+
+#Item record for a barcode. Fixture barcodes:
+#  NF...           not found
+#  PROC-<TYPE>-... item with process type <TYPE> (e.g. PROC-LOAN-1)
+#  TEMP...         item in a temporary location
+#Every barcode gets its own mms/holding/item ids so updates can be told apart
+def item_record(barcode, inventory_date=None):
+    ids = str(zlib.crc32(barcode.encode("utf-8")))
+    record = ITEM_XML.replace("{barcode}", barcode).replace("991234", f"99{ids}").replace("221234", f"22{ids}").replace("231234", f"23{ids}")
+    if barcode.startswith("PROC-"):
+        processtype = barcode.split("-")[1]
+        record = record.replace('<process_type desc=""/>', f'<process_type desc="{processtype}">{processtype}</process_type>')
+    if barcode.startswith("TEMP"):
+        record = record.replace("<in_temp_location>false</in_temp_location>\n<temp_library/>\n<temp_location/>", '<in_temp_location>true</in_temp_location>\n<temp_library desc="Main Library">MAIN</temp_library>\n<temp_location desc="Course Reserves">RESERVES</temp_location>')
+    if inventory_date is not None:
+        record = record.replace("<inventory_number></inventory_number>", f"<inventory_number></inventory_number>\n<inventory_date>{inventory_date}</inventory_date>")
+    return record
+
+
+#(status, body) for the conf API: the fixture record's process types, library and locations
+def conf_response(path):
+    if path.endswith("/conf/code-tables/PROCESSTYPE"):
+        rows = "".join(f"<row><code>{code}</code><description>{label}</description><enabled>true</enabled></row>" for code, label in MOCK_PROCESS_TYPES.items())
+        return 200, f"<code_table><name>PROCESSTYPE</name><rows>{rows}</rows></code_table>"
+    if path.endswith("/conf/libraries"):
+        return 200, "<libraries><library><code>MAIN</code><name>Main Library</name></library></libraries>"
+    if path.endswith("/conf/libraries/MAIN/locations"):
+        return 200, "<locations><location><code>STACKS</code><name>Main Stacks</name></location><location><code>RESERVES</code><name>Course Reserves</name></location></locations>"
+    return 400, NOT_FOUND_XML.replace("{barcode}", "")
+
+
+#Stand-in for the Alma endpoints the updater uses:
+#  GET /items?item_barcode=...                    item lookup
+#  PUT /bibs/{mms}/holdings/{holding}/items/{pid} item update (the inventory date is remembered for later lookups)
+#  GET /conf/code-tables/PROCESSTYPE, /conf/libraries and /conf/libraries/{code}/locations   code tables
+#Options on the server: latency (seconds, plus up to `jitter` more), not_found_rate and throttle_rate (fraction of requests)
+class MockAlmaHandler(BaseHTTPRequestHandler):
+    #HTTP/1.1 so clients can keep the connection open between requests
+    protocol_version = "HTTP/1.1"
+    #Headers and body go out as separate writes, without this keep-alive responses stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_body(self, status, body):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        with self.server.lock:
+            self.server.calls += 1
+            self.server.per_second[int(time.time())] += 1
+            remaining = max(0, self.server.daily_quota - self.server.calls)
+        self.send_header("X-Exl-Api-Remaining", str(remaining))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #Simulated network + Alma processing time, then True if this request should be throttled
+    def simulate(self):
+        server = self.server
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+        if server.throttle_rate and random.random() < server.throttle_rate:
+            self.send_body(429, THROTTLED_XML)
+            return True
+        return False
+
+    def do_GET(self):
+        if self.simulate():
+            return
+        #Connection check used while offline
+        if "/bibs/test" in self.path:
+            self.send_body(200, "<test>GET is ok</test>")
+            return
+        if "/conf/" in self.path:
+            self.send_body(*conf_response(self.path.split("?")[0]))
+            return
+        match = re.search(r"item_barcode=([^&]+)", self.path)
+        if match is None:
+            self.send_body(400, NOT_FOUND_XML.replace("{barcode}", ""))
+            return
+        barcode = match.group(1)
+        if barcode.startswith("NF") or (self.server.not_found_rate and random.random() < self.server.not_found_rate):
+            self.send_body(400, NOT_FOUND_XML.replace("{barcode}", barcode))
+            return
+        with self.server.lock:
+            inventory_date = self.server.inventory_dates.get(barcode)
+        self.send_body(200, item_record(barcode, inventory_date))
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        if self.simulate():
+            return
+        if re.search(r"/bibs/\d+/holdings/\d+/items/\d+", self.path) is None:
+            self.send_body(400, NOT_FOUND_XML.replace("{barcode}", ""))
+            return
+        barcode = re.search(r"<barcode>([^<]*)</barcode>", body)
+        inventory_date = re.search(r"<inventory_date>([^<]*)</inventory_date>", body)
+        if barcode is not None and inventory_date is not None:
+            with self.server.lock:
+                self.server.inventory_dates[barcode.group(1)] = inventory_date.group(1)
+        self.send_body(200, body)
+
+    #Keeps benchmark output readable
+    def log_message(self, format, *args):
+        pass
+
+
+#Starts a mock server in a background thread (port 0 picks a free one), returns (server, base_url)
+def start_mock_server(port=0, latency=0, jitter=0, not_found_rate=0, throttle_rate=0, daily_quota=100000):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockAlmaHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.calls = 0
+    server.latency = latency
+    server.jitter = jitter
+    server.not_found_rate = not_found_rate
+    server.throttle_rate = throttle_rate
+    server.daily_quota = daily_quota
+    server.inventory_dates = {}
+    #Requests answered in each wall-clock second, to see how close clients come to Alma's per-second threshold
+    server.per_second = Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/almaws/v1"
+
+
+#Runs the mock on its own so either front-end can be pointed at it (set alma_base in settings.json to the printed URL)
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Alma item APIs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="up to this many extra seconds, at random")
+    parser.add_argument("--not-found-rate", type=float, default=0, help="fraction of lookups answered as not found")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+    server, alma_base = start_mock_server(args.port, args.latency, args.jitter, args.not_found_rate, args.throttle_rate)
+    print(f"Mock Alma running at {alma_base} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
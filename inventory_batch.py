@@ -0,0 +1,124 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory_core.log_setup import logging_from_settings
+from inventory_core.scanning import Scanner
+from inventory_core.scan_journal import outcome_of
+from inventory_core.telemetry import profile_from_settings
+
+
+#Columns written to the results CSV, one row per barcode
+RESULT_COLUMNS = ["barcode", "found", "process_status", "temp_location", "updated", "outcome"]
+
+
+#Streams barcodes from a text/CSV file (or stdin for "-"): first column of each line, blank lines skipped
+def read_barcodes(path, skip_header=False):
+    source = sys.stdin if path == "-" else open(path, newline='')
+    try:
+        rows = csv.reader(source)
+        if skip_header:
+            next(rows, None)
+        for row in rows:
+            if row and row[0].strip():
+                yield row[0].strip()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+#Flattens a scan result into a results CSV row
+def result_row(result):
+    outcome = outcome_of(result)
+    return {
+        "barcode": result["barcode"],
+        "found": result.get("founditem", ""),
+        "process_status": result.get("processtype", ""),
+        "temp_location": result["location"] if result.get("intemp") else "",
+        "updated": result.get("updatestatus", "") if "bulk" not in result else "",
+        "outcome": outcome,
+    }
+
+
+#Runs every barcode through lookup/parse/update on a thread pool. At most max_inflight barcodes are read ahead of the results,
+#so memory stays flat no matter how long the file is. Rows are written (and flushed) as each barcode finishes.
+#capture is an optional ProfileCapture to profile every barcode with
+def run_batch(scanner, barcodes, out, workers=8, max_inflight=None, capture=None):
+    max_inflight = max_inflight or workers * 2
+    slots = threading.BoundedSemaphore(max_inflight)
+    writer = csv.DictWriter(out, fieldnames=RESULT_COLUMNS)
+    writer.writeheader()
+    write_lock = threading.Lock()
+    counts = {}
+    start = time.monotonic()
+
+    def process(barcode):
+        try:
+            try:
+                result = capture.run(scanner.process_barcode, barcode) if capture is not None else scanner.process_barcode(barcode)
+            except Exception as e:
+                logging.exception(f"Barcode {barcode} batch scanned. Unexpected error while processing.")
+                result = {"barcode": barcode, "error": e}
+            row = result_row(result)
+            with write_lock:
+                writer.writerow(row)
+                out.flush()
+                counts[row["outcome"]] = counts.get(row["outcome"], 0) + 1
+                done = sum(counts.values())
+                if done % 500 == 0:
+                    print(f"{done} barcodes done ({done / (time.monotonic() - start):.1f}/s)", file=sys.stderr)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        for barcode in barcodes:
+            slots.acquire()
+            pool.submit(process, barcode)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update Alma inventory dates for every barcode in a file, without the GUI.")
+    parser.add_argument("barcodes", help="text/CSV file with one barcode per line (first column), or - for stdin")
+    parser.add_argument("-o", "--output", default="inventory_results.csv", help="results CSV (default: inventory_results.csv)")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="parallel requests (default: 8)")
+    parser.add_argument("--max-inflight", type=int, help="barcodes read ahead of finished results (default: 2x workers)")
+    parser.add_argument("--skip-header", action="store_true", help="ignore the first line of the barcode file")
+    parser.add_argument("--settings", default="settings.json", help="settings file (default: settings.json)")
+    parser.add_argument("--bulk-export", metavar="DIR", help="write Alma bulk job files to DIR instead of updating each item")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="barcodes per bulk job file (default: 10000)")
+    args = parser.parse_args(argv)
+
+    with open(args.settings) as config_file:
+        settings = json.load(config_file)
+    logging_from_settings(settings)
+    #Connection pool needs a connection per worker
+    settings.setdefault('http', {})['pool_size'] = max(args.workers, settings['http'].get('pool_size', 10))
+    #--bulk-export takes the place of the bulk_export block, so the Scanner only ever opens one set of job files
+    if args.bulk_export:
+        settings['bulk_export'] = {"enabled": True, "directory": args.bulk_export, "chunk_size": args.chunk_size}
+    scanner = Scanner(settings)
+    capture = profile_from_settings(settings)
+
+    with open(args.output, "w", newline='') as out:
+        counts = run_batch(scanner, read_barcodes(args.barcodes, args.skip_header), out, args.workers, args.max_inflight, capture)
+
+    logging.info(f"Batch run of {args.barcodes} finished: {counts}")
+    print(f"Done: {sum(counts.values())} barcodes {counts}. Results in {args.output}", file=sys.stderr)
+    summary = scanner.metrics.summary()
+    if summary is not None:
+        print(f"Per barcode: median {summary['median']:.0f} ms, p95 {summary['p95']:.0f} ms, {summary['error_rate']:.1%} errors. " + ", ".join(f"{name} {p50:.0f}/{p95:.0f} ms" for name, (p50, p95) in summary['stages'].items()) + " (median/p95)", file=sys.stderr)
+    if capture is not None:
+        capture.dump()
+    if scanner.bulk is not None:
+        scanner.bulk.close()
+        print(f"Bulk job files in {scanner.bulk.directory}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+import logging
+import sys
+import time
+
+from inventory_core.coordinator import start_coordinator
+from inventory_core.log_setup import logging_from_settings
+from inventory_core.scanning import Scanner
+from inventory_core.shelf_list import ShelfList
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared scanning service for several scanning computers: one connection to Alma, one rate limit, and scans of the same barcode from different stations done once.")
+    parser.add_argument("--host", help="address to listen on (default: host in the coordinator block of settings.json, or 127.0.0.1). Anything but this computer needs a token")
+    parser.add_argument("--port", type=int, help="port to listen on (default: port in settings.json, or 8750)")
+    parser.add_argument("--settings", default="settings.json", help="settings file (default: settings.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.settings) as config_file:
+        settings = json.load(config_file)
+    logging_from_settings(settings)
+    coordinator_settings = settings.get('coordinator', {})
+
+    scanner = Scanner(settings)
+    shelf_settings = settings.get('shelf_list', {})
+    if shelf_settings.get('file'):
+        scanner.shelf = ShelfList(shelf_settings.get('location'), shelf_settings.get('call_number_from'), shelf_settings.get('call_number_to'), settings['processlabel'])
+        shelfcount = scanner.shelf.load(shelf_settings['file'])
+        logging.info(f"Shelf list {shelf_settings['file']} loaded: {shelfcount} items, {len(scanner.shelf.expected)} expected in {shelf_settings.get('location')}")
+
+    try:
+        server, url = start_coordinator(scanner, args.host or coordinator_settings.get('host', "127.0.0.1"), args.port or coordinator_settings.get('port', 8750), coordinator_settings.get('token'), coordinator_settings.get('backlog', 128))
+    except ValueError as e:
+        print(f"{e} (\"token\" in the coordinator block of settings.json)", file=sys.stderr)
+        sys.exit(2)
+    logging.info(f"Coordinator listening on port {server.server_address[1]}")
+    print(f"Coordinator running on port {server.server_address[1]} (Ctrl+C to stop). Set \"url\" in each station's coordinator settings to this computer's address, e.g. {url}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+
+    stats = server.coordinator.stats()
+    logging.info(f"Coordinator stopped. Scans per station: {stats['stations']}, {stats['shared']} shared between stations")
+    print(f"Scans per station: {stats['stations']}, {stats['shared']} shared between stations", file=sys.stderr)
+    if scanner.shelf is not None:
+        reportfile = shelf_settings.get('report_file', "shelf_report.csv")
+        counts = scanner.shelf.write_report(reportfile)
+        logging.info(f"Shelf list report written to {reportfile}: {counts}")
+    if scanner.bulk is not None:
+        scanner.bulk.close()
+        print(f"Bulk job files in {scanner.bulk.directory}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+#Shared, GUI-free pieces used by the inventory date updater front-ends
@@ -0,0 +1,90 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from inventory_core.rate_limit import QuotaGovernor
+from inventory_core.resilience import RETRYABLE, CircuitBreaker, CircuitOpenError, RetryPolicy, classify
+from inventory_core.telemetry import span
+
+
+#One pooled, keep-alive HTTP session for every Alma call, so each scan reuses an open TCP/TLS connection
+#instead of doing a fresh handshake for both the GET and the PUT. Every call also goes through the limiter (a QuotaGovernor) if there is one,
+#is retried with backoff on throttling/server/connection errors (both the GET and the full-record PUT are safe to repeat), and is
+#refused straight away with CircuitOpenError while the circuit breaker is open
+class AlmaClient:
+    def __init__(self, alma_base, bibapi, headers=None, pool_size=10, connect_timeout=5, read_timeout=30, limiter=None, retry=None, breaker=None):
+        self.alma_base = alma_base
+        self.bibapi = bibapi
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy(retries=0)
+        self.breaker = breaker
+        #requests takes (connect, read) timeouts as a tuple
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        #Only talking to one host, so a single pool with room for every worker thread is all that's needed
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if self.breaker is not None and not self.breaker.allow():
+                raise CircuitOpenError("Alma circuit breaker is open")
+            if self.limiter is not None:
+                with span("throttle"):
+                    self.limiter.acquire()
+
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout):
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                if attempt >= self.retry.retries:
+                    raise
+                with span("retry_wait"):
+                    time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+
+            if self.limiter is not None:
+                self.limiter.observe(r)
+            kind = classify(r)
+            if self.breaker is not None:
+                #Throttling means Alma is up, only outages count towards opening the breaker
+                if kind == "server_error":
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            if kind not in RETRYABLE or attempt >= self.retry.retries or self.retry.waits_too_long(r):
+                return r
+            with span("retry_wait"):
+                time.sleep(self.retry.delay(attempt, r))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    #Throughput/quota numbers for the status line, None without a limiter
+    def stats(self):
+        return self.limiter.stats() if self.limiter is not None else None
+
+    def close(self):
+        self.session.close()
+
+
+#Optional "http", "rate_limit", "retry" and "circuit_breaker" blocks in settings.json, anything left out falls back to the class defaults
+def client_from_settings(settings):
+    limiter = QuotaGovernor(**settings.get('rate_limit', {}))
+    retry = RetryPolicy(**settings.get('retry', {}))
+    breaker = CircuitBreaker(**settings.get('circuit_breaker', {}))
+    return AlmaClient(settings['alma_base'], settings['bibapi'], settings.get('headers'), limiter=limiter, retry=retry, breaker=breaker, **settings.get('http', {}))
@@ -0,0 +1,99 @@
+import csv
+import logging
+import os
+import threading
+from datetime import datetime
+
+
+#Writes scans out as input files for an Alma bulk job instead of updating each item with its own PUT.
+#Each job file is a CSV with a Barcode column (the format an itemized set can be built from), one set of files per inventory date and
+#at most chunk_size barcodes per file. The set is then run through the "Change Physical Items" job with that inventory date.
+#Items with a process status or in a temporary location go to a separate flagged file, barcodes Alma doesn't know to a not found file
+class BulkJobWriter:
+    def __init__(self, directory="bulk_jobs", chunk_size=10000, name=None):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        #All files from one session share this name, e.g. inventory_20240105_0930_2024-01-05_part1.csv
+        self.name = name or datetime.now().strftime("inventory_%Y%m%d_%H%M")
+        os.makedirs(directory, exist_ok=True)
+        #Open job file per inventory date: [file, writer, part number, rows in this part]
+        self.jobs = {}
+        self.seen = set()
+        self.counts = {"exported": 0, "flagged": 0, "not_found": 0, "duplicate": 0}
+        self.flagged = self.open_file("flagged", ["barcode", "scandate", "reason", "title", "callnumber", "location"])
+        self.notfound = self.open_file("not_found", ["barcode", "scandate"])
+        #Worker threads add results at the same time
+        self.lock = threading.Lock()
+
+    def open_file(self, suffix, header):
+        path = os.path.join(self.directory, f"{self.name}_{suffix}.csv")
+        handle = open(path, "w", newline='', encoding='utf-8')
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        return (handle, writer)
+
+    #Adds a found item's lookup result. Returns where it went: "exported" (job file), "flagged" or "duplicate" (already written this session)
+    def add(self, result):
+        barcode = result["barcode"]
+        scandate = result["scandate"]
+        with self.lock:
+            if (barcode, scandate) in self.seen:
+                self.counts["duplicate"] += 1
+                return "duplicate"
+            self.seen.add((barcode, scandate))
+
+            if result["rules"]:
+                rule = result["rules"][0]
+                if rule["screen"] == "withprocess":
+                    reason = f"Process status: {rule['value']}"
+                elif rule["screen"] == "withtemp":
+                    reason = "Temporary location"
+                else:
+                    reason = f"{rule['name']}: {rule['value']}"
+                handle, writer = self.flagged
+                writer.writerow([barcode, scandate, reason, result["title"], result["callnumber"], result["location"]])
+                handle.flush()
+                self.counts["flagged"] += 1
+                return "flagged"
+
+            job = self.jobs.get(scandate)
+            if job is None or job[3] >= self.chunk_size:
+                part = job[2] + 1 if job is not None else 1
+                if job is not None:
+                    job[0].close()
+                handle, writer = self.open_file(f"{scandate.rstrip('Z')}_part{part}", ["Barcode"])
+                job = self.jobs[scandate] = [handle, writer, part, 0]
+            job[1].writerow([barcode])
+            job[0].flush()
+            job[3] += 1
+            self.counts["exported"] += 1
+            return "exported"
+
+    #Barcode Alma has no item for
+    def missing(self, barcode, scandate):
+        with self.lock:
+            if (barcode, scandate) in self.seen:
+                return
+            self.seen.add((barcode, scandate))
+            handle, writer = self.notfound
+            writer.writerow([barcode, scandate])
+            handle.flush()
+            self.counts["not_found"] += 1
+
+    #Closes every file and returns the counts (files are flushed row by row, so an interrupted session still has everything written so far)
+    def close(self):
+        with self.lock:
+            for job in self.jobs.values():
+                job[0].close()
+            self.flagged[0].close()
+            self.notfound[0].close()
+        logging.info(f"Bulk job files {self.name} closed: {self.counts}")
+        return dict(self.counts)
+
+
+#Optional "bulk_export" block in settings.json, None unless "enabled" is true
+def bulk_export_from_settings(settings):
+    bulk_settings = dict(settings.get('bulk_export', {}))
+    if not bulk_settings.pop('enabled', False):
+        return None
+    return BulkJobWriter(**bulk_settings)
@@ -0,0 +1,117 @@
+import bisect
+import re
+from collections import deque
+from functools import lru_cache
+
+
+#Library of Congress (and NLM, same shape): class letters, class number, then cutters/dates. e.g. "QA76.73.P98 T47 2020"
+LC_RE = re.compile(r"^([A-Z]{1,3})\s*(\d+)(?:\.(\d+))?\s*(.*)$")
+#Dewey: three digit class, decimal, then cutter. e.g. "823.914 D27s"
+DEWEY_RE = re.compile(r"^(\d{3})(?:\.(\d+))?\s*(.*)$")
+#Pieces of whatever comes after the class number: a cutter (letters with digits attached, compared as decimals) or a plain number (year, volume)
+PART_RE = re.compile(r"[A-Z]+\d*|\d+")
+
+
+#Cutters sort as decimals (.B2 < .B15 < .B3), which is plain string order. Standalone numbers (years, volumes) are padded so v.2 < v.10
+def rest_key(rest):
+    return " ".join(part if not part.isdigit() else part.zfill(6) for part in PART_RE.findall(rest))
+
+
+#Sort key for a call number, as a string that compares in shelf order (so it can be stored, cached and sent as JSON as is).
+#The first character is the scheme: "L" for LC, "D" for Dewey, "O" for anything else (numbers padded, everything else in text order).
+#Keys from different schemes don't mean anything compared to each other. Empty for a missing call number.
+#Computed once per call number, scans of the same range keep hitting the cache
+@lru_cache(maxsize=100000)
+def call_number_key(callnumber):
+    normalized = " ".join((callnumber or "").upper().split())
+    if not normalized:
+        return ""
+    match = LC_RE.match(normalized)
+    if match is not None:
+        letters, whole, decimal, rest = match.groups()
+        #Spaces sort before digits and letters, so "Q" < "QA" and 76 < 76.5 < 76.55
+        return f"L{letters:<3}{whole.zfill(5)}{decimal or ''} {rest_key(rest)}"
+    match = DEWEY_RE.match(normalized)
+    if match is not None:
+        whole, decimal, rest = match.groups()
+        return f"D{whole}{decimal or ''} {rest_key(rest)}"
+    return "O" + " ".join(part if not part.isdigit() else part.zfill(8) for part in PART_RE.findall(normalized))
+
+
+#Checks scans against the order they should be on the shelf while shelf-reading. Keeps a window of the last few scans sorted by call number,
+#and each scan is placed in it with a binary search: a scan that sorts before two or more of them is out of place (it belongs further back),
+#and a scan that only sorts before the one just scanned (but after the one before that) means that previous one was the odd one out.
+#Items found out of place aren't kept in the window, so one misshelved item doesn't make its neighbours look wrong.
+#If several scans in a row are out of place but in order with each other, the user has moved on to another section and the window starts again
+class ShelfOrder:
+    def __init__(self, window=10, restart_after=3):
+        self.window = window
+        self.restart_after = restart_after
+        #Scans in the window as (key, seq, barcode, callnumber): in scan order, and sorted by key
+        self.recent = deque()
+        self.sorted = []
+        self.seq = 0
+        #Consecutive out of place scans, in case they turn out to be a new section
+        self.outliers = []
+
+    def add(self, entry):
+        self.recent.append(entry)
+        bisect.insort(self.sorted, entry)
+        if len(self.recent) > self.window:
+            self.remove(self.recent[0])
+
+    def remove(self, entry):
+        self.recent.remove(entry)
+        del self.sorted[bisect.bisect_left(self.sorted, entry)]
+
+    def restart(self, entries):
+        self.recent.clear()
+        self.sorted = []
+        self.outliers = []
+        for entry in entries:
+            self.add(entry)
+
+    #Places one scan. Returns (verdict, entry it's compared against): ("ok", None), ("misshelved", item it belongs before),
+    #("previous", the previous scan, which looks out of place) or ("unknown", None) for an item without a call number
+    def check(self, barcode, callnumber, key=None):
+        key = key if key is not None else call_number_key(callnumber)
+        if not key:
+            return ("unknown", None)
+        self.seq += 1
+        entry = (key, self.seq, barcode, callnumber)
+
+        #Different call number scheme from the last scan: a different part of the collection
+        if self.recent and self.recent[-1][0][0] != key[0]:
+            self.restart([entry])
+            return ("ok", None)
+
+        position = bisect.bisect_right(self.sorted, entry)
+        later = len(self.sorted) - position
+        if later == 0:
+            self.outliers = []
+            self.add(entry)
+            return ("ok", None)
+
+        previous = self.recent[-1]
+        if later == 1 and len(self.recent) >= 2 and previous[0] > key and self.recent[-2][0] <= key:
+            self.outliers = []
+            self.remove(previous)
+            self.add(entry)
+            return ("previous", previous)
+
+        #Out of place, unless it's the start of a new run of scans
+        if self.outliers and self.outliers[-1][0] > key:
+            self.outliers = []
+        self.outliers.append(entry)
+        if len(self.outliers) >= self.restart_after:
+            self.restart(self.outliers)
+            return ("ok", None)
+        return ("misshelved", self.sorted[position])
+
+
+#Optional "shelf_order" block in settings.json: ShelfOrder if shelf-reading is turned on, otherwise None
+def shelf_order_from_settings(settings):
+    shelf_order = dict(settings.get('shelf_order', {}))
+    if not shelf_order.pop('enabled', False):
+        return None
+    return ShelfOrder(**shelf_order)
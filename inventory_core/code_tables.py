@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from functools import partial
+
+from inventory_core.resilience import classify
+
+
+#Layout of the code tables file. Files written with a different one are ignored (and fetched again)
+FORMAT_VERSION = 1
+
+#How long to wait before trying again after a refresh failed (Alma down, network trouble), doubled after each failure in a row up to the TTL
+RETRY_SECONDS = 600
+
+
+#Alma turned the key down for the conf API (it has no Configuration read access). Trying again won't help until settings.json changes
+class CodeTablesRefused(RuntimeError):
+    pass
+
+
+#Labels for Alma's codes: the PROCESSTYPE code table, and library and location names from the libraries configuration.
+#Location codes are only unique within a library, so locations are kept per library (plus one flat lookup for shelf list rows without a library)
+class CodeTables:
+    def __init__(self, process_types, libraries, locations, fetched_at=None, source="alma"):
+        self.process_types = process_types
+        self.libraries = libraries
+        self.locations = locations
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.source = source
+        self.location_names = {code: name for library in locations.values() for code, name in library.items()}
+        #Version stamp of the contents, so a refresh that brings nothing new is just a newer fetched_at
+        self.stamp = hashlib.sha1(json.dumps([process_types, libraries, locations], sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def location_name(self, library_code, location_code):
+        if not location_code:
+            return None
+        return self.locations.get(library_code, {}).get(location_code) or self.location_names.get(location_code)
+
+    #Item fields with any missing library/location names filled in from their codes (shelf list exports often only have the codes).
+    #The same dict if nothing is missing, otherwise a copy
+    def fill_names(self, fields):
+        missing = {}
+        if fields.get("library_code") and not fields.get("library"):
+            missing["library"] = self.libraries.get(fields["library_code"])
+        if fields.get("location_code") and not fields.get("location"):
+            missing["location"] = self.location_name(fields.get("library_code"), fields["location_code"])
+        if fields.get("temp_location_code") and not fields.get("temp_location"):
+            missing["temp_location"] = self.location_names.get(fields["temp_location_code"])
+        missing = {name: value for name, value in missing.items() if value}
+        return dict(fields, **missing) if missing else fields
+
+    def to_json(self):
+        return {"format": FORMAT_VERSION, "stamp": self.stamp, "fetched_at": self.fetched_at, "source": self.source,
+                "process_types": self.process_types, "libraries": self.libraries, "locations": self.locations}
+
+
+#Code tables from a file written by CodeTableCache (or copied from a computer that can reach the conf API). None if it's missing or unreadable
+def load_code_tables(path):
+    try:
+        with open(path, encoding='utf-8') as tables_file:
+            data = json.load(tables_file)
+        if data.get("format") != FORMAT_VERSION:
+            return None
+        return CodeTables(data["process_types"], data["libraries"], data["locations"], data["fetched_at"], data.get("source", "file"))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+#Writes to a temporary file first, so a station reading it (or a crash part way) never sees half a file
+def save_code_tables(tables, path):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding='utf-8') as tables_file:
+        json.dump(tables.to_json(), tables_file)
+    os.replace(temporary, path)
+
+
+def get_xml(client, url):
+    r = client.get(url)
+    kind = classify(r)
+    if kind == "auth_error":
+        raise CodeTablesRefused(f"HTTP {r.status_code} from {url.split('?')[0]}, the API key has no Configuration read access")
+    if kind != "ok":
+        raise RuntimeError(f"HTTP {r.status_code} from {url.split('?')[0]}")
+    return ET.fromstring(r.content)
+
+
+#Fetches the PROCESSTYPE code table and every library's locations from the Alma conf API (needs a key with Configuration read access).
+#One call for the code table, one for the libraries and one per library, all through the shared client and its rate limit
+def fetch_code_tables(client, alma_base, apikey):
+    table = get_xml(client, f"{alma_base}/conf/code-tables/PROCESSTYPE?apikey={apikey}")
+    process_types = {row.findtext("code"): row.findtext("description") or row.findtext("code") for row in table.iter("row") if row.findtext("enabled", "true") != "false"}
+
+    libraries = {}
+    locations = {}
+    for library in get_xml(client, f"{alma_base}/conf/libraries?apikey={apikey}").iter("library"):
+        code = library.findtext("code")
+        libraries[code] = library.findtext("name") or code
+        found = get_xml(client, f"{alma_base}/conf/libraries/{code}/locations?apikey={apikey}")
+        locations[code] = {location.findtext("code"): location.findtext("name") or location.findtext("code") for location in found.iter("location")}
+    return CodeTables(process_types, libraries, locations)
+
+
+#Code tables kept in a local file: read once at start up (a small JSON file, no API calls), and fetched again in the background
+#once they're older than ttl_seconds. The tables in use are swapped for the new ones whole, and listeners are told if anything changed
+class CodeTableCache:
+    def __init__(self, path, fetch, ttl_seconds=24 * 60 * 60, background=True):
+        self.path = path
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        #With background refresh turned off the file is only ever read
+        self.background = background
+        self.tables = load_code_tables(path)
+        self.stopped = threading.Event()
+        #Failed refreshes in a row (for the backoff), and whether Alma refused the key outright
+        self.failures = 0
+        self.refused = False
+
+    #Seconds until the tables should be fetched again (0 if there aren't any yet)
+    def due_in(self):
+        if self.tables is None:
+            return 0
+        return max(0, self.tables.fetched_at + self.ttl_seconds - time.time())
+
+    #Seconds to wait after a failed refresh: RETRY_SECONDS, doubling with each failure in a row, never more than the TTL
+    def retry_in(self):
+        return min(RETRY_SECONDS * 2 ** max(0, self.failures - 1), self.ttl_seconds)
+
+    #Fetches the tables now. Returns True if they changed. Failures are logged and the old tables kept
+    def refresh(self):
+        keeping = "the cached ones" if self.tables is not None else "the labels in settings.json"
+        try:
+            tables = self.fetch()
+        except CodeTablesRefused as e:
+            self.refused = True
+            logging.warning(f"Code tables couldn't be fetched ({e}). Keeping {keeping}, no more attempts this session (set apikey in the code_tables block to a key that can read the configuration)")
+            return False
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f"Code tables couldn't be refreshed ({e}), keeping {keeping}. Trying again in {self.retry_in() / 60:.0f} minutes")
+            return False
+        self.failures = 0
+        if tables is None:
+            return False
+        changed = self.tables is None or tables.stamp != self.tables.stamp
+        self.tables = tables
+        try:
+            save_code_tables(tables, self.path)
+        except OSError as e:
+            logging.warning(f"Code tables couldn't be saved to {self.path}: {e}")
+        if changed:
+            logging.info(f"Code tables updated: {len(tables.process_types)} process types, {len(tables.libraries)} libraries, {len(tables.location_names)} locations (version {tables.stamp})")
+        return changed
+
+    #Background refresh: waits until the tables are due, fetches them, and calls on_change(tables) whenever they changed
+    def start(self, on_change):
+        if not self.background:
+            return
+
+        def run():
+            while not self.stopped.is_set():
+                if self.due_in() == 0:
+                    if self.refresh():
+                        on_change(self.tables)
+                    elif self.refused:
+                        return
+                    elif self.due_in() == 0:
+                        self.stopped.wait(self.retry_in())
+                        continue
+                self.stopped.wait(self.due_in())
+
+        threading.Thread(target=run, name="code-tables", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+#Optional "code_tables" block in settings.json: CodeTableCache if a file is set, otherwise None. The tables come from the Alma conf API
+#(with apikey, a Configuration API key, or the Bibs key if that has conf read access), or from import_file if set (a code tables file
+#copied from a computer that can reach the conf API)
+def code_tables_from_settings(settings, client):
+    code_tables = settings.get('code_tables', {})
+    if not code_tables.get('file'):
+        return None
+    if code_tables.get('import_file'):
+        fetch = partial(load_code_tables, code_tables['import_file'])
+    else:
+        fetch = partial(fetch_code_tables, client, settings['alma_base'], code_tables.get('apikey') or settings['bibapi'])
+    return CodeTableCache(code_tables['file'], fetch, code_tables.get('ttl_seconds', 24 * 60 * 60), code_tables.get('refresh', True))
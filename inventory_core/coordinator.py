@@ -0,0 +1,341 @@
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from inventory_core.scan_journal import today_scandate
+from inventory_core.telemetry import metrics_from_settings
+
+
+#Parts of a result that can't be sent as JSON: the update's response object and the record still to be sent (the exception is sent as its text)
+LOCAL_ONLY = ("updatepush", "pendingupdate", "error")
+
+
+#JSON-safe copy of a result for sending to a station
+def result_to_wire(result):
+    wire = {key: value for key, value in result.items() if key not in LOCAL_ONLY}
+    if "error" in result:
+        wire["error"] = str(result["error"])
+    return wire
+
+
+#Result dict from a station's side, in the same shape the local Scanner returns
+def result_from_wire(wire):
+    result = dict(wire, updatepush=None)
+    if "error" in wire:
+        result["error"] = RuntimeError(wire["error"])
+    return result
+
+
+#A scan being worked on for one station. Other stations scanning the same barcode meanwhile wait on it instead of calling Alma again
+class SharedScan:
+    def __init__(self, station):
+        self.station = station
+        self.lookup = None
+        self.result = None
+        self.changed = threading.Condition()
+
+    def publish(self, lookup=None, result=None):
+        with self.changed:
+            if lookup is not None:
+                self.lookup = lookup
+            if result is not None:
+                self.result = result
+            self.changed.notify_all()
+
+    #Yields the lookup phase (if the scan has one) and then the finished result, as they come in.
+    #Each message is taken under the lock but sent after it's released, so a slow station never holds up the scan or the other stations
+    def follow(self):
+        sent_lookup = False
+        while True:
+            with self.changed:
+                while (self.lookup is None or sent_lookup) and self.result is None:
+                    self.changed.wait()
+                lookup = self.lookup if not sent_lookup else None
+                result = self.result
+            if lookup is not None:
+                sent_lookup = True
+                yield lookup
+            if result is not None:
+                yield result
+                return
+
+
+#Runs scans for every station through one Scanner, so they share its pooled connection, rate limiter, item cache and
+#recently updated barcodes. Scans of a barcode another station is already scanning (same inventory date) share that scan's result
+class Coordinator:
+    def __init__(self, scanner, token=None):
+        self.scanner = scanner
+        #Stations have to send this in the X-Station-Token header if it's set (the coordinator holds the API key)
+        self.token = token or None
+        self.inflight = {}
+        self.lock = threading.Lock()
+        #Scans handled per station, and how many were shared with another station's scan
+        self.stations = {}
+        self.shared = 0
+
+    #Yields the wire messages for one scan: {"phase": "lookup", ...} while the update is being sent (if there is one), then the finished result
+    def scan(self, barcode, scandate, station):
+        key = (barcode, scandate)
+        with self.lock:
+            self.stations[station] = self.stations.get(station, 0) + 1
+            shared = self.inflight.get(key)
+            if shared is None:
+                shared = self.inflight[key] = SharedScan(station)
+                leading = True
+            else:
+                self.shared += 1
+                leading = False
+
+        if not leading:
+            logging.info(f"Barcode {barcode} scanned again. Station {station} joined station {shared.station}'s scan in progress.")
+            for message in shared.follow():
+                #Updated by the other station's scan, shown like a rescan of an item already done today
+                yield dict(message, cached=True) if message.get("updatestatus") else message
+            return
+
+        try:
+            for message in self.run(barcode, scandate, shared):
+                yield message
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def run(self, barcode, scandate, shared):
+        start = time.perf_counter()
+        result = {"barcode": barcode, "scandate": scandate}
+        try:
+            result = self.scanner.lookup_barcode(barcode, scandate)
+            if "pendingupdate" in result:
+                lookup = dict(result_to_wire(result), phase="lookup")
+                shared.publish(lookup=lookup)
+                yield lookup
+                self.scanner.save_update(result)
+        except Exception as e:
+            logging.exception(f"Barcode {barcode} scanned at station {shared.station}. Unexpected error while processing.")
+            result = {"barcode": barcode, "error": e}
+        self.scanner.metrics.record(result, (time.perf_counter() - start) * 1000)
+        finished = result_to_wire(result)
+        shared.publish(result=finished)
+        yield finished
+
+    #Alma quota numbers and per-station counts, for the stations' status line and GET /stats
+    def stats(self):
+        with self.lock:
+            return {"alma": self.scanner.client.stats(), "stations": dict(self.stations), "shared": self.shared, "inflight": len(self.inflight)}
+
+
+#POST /scan with {"barcode", "scandate", "station"}: the reply is streamed as one JSON object per line (chunked), the lookup
+#phase first so the station can show the item while the update is still going, then the finished result with the current stats.
+#GET /stats: the same stats on their own (also used by stations to check the coordinator is up)
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def authorized(self):
+        token = self.server.coordinator.token
+        if token is not None and self.headers.get("X-Station-Token") != token:
+            self.send_json(401, {"message": "Wrong or missing station token"})
+            return False
+        return True
+
+    def send_json(self, status, message):
+        body = json.dumps(message).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_line(self, message):
+        line = json.dumps(message).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path != "/stats":
+            self.send_json(404, {"message": "Unknown path"})
+            return
+        self.send_json(200, self.server.coordinator.stats())
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not self.authorized():
+            return
+        if self.path != "/scan":
+            self.send_json(404, {"message": "Unknown path"})
+            return
+        try:
+            request = json.loads(body)
+            barcode = request["barcode"]
+            scandate = request["scandate"]
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"message": "Expected JSON with barcode and scandate"})
+            return
+        station = request.get("station") or self.client_address[0]
+
+        coordinator = self.server.coordinator
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        #A station that hangs up part way doesn't stop the scan, it still has to finish for any other station waiting on it
+        connected = True
+        for message in coordinator.scan(barcode, scandate, station):
+            if "phase" not in message:
+                message = dict(message, coordinator=coordinator.stats())
+            if connected:
+                try:
+                    self.send_line(message)
+                except OSError:
+                    connected = False
+        if connected:
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.close_connection = True
+
+    #Scans are already in the coordinator's own log
+    def log_message(self, format, *args):
+        pass
+
+
+#True for an address only this computer can reach
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+#Every station keeps several scans in flight, so a lot of connections can arrive at the same moment. ThreadingHTTPServer only queues 5
+#waiting to be accepted and resets the rest, which the stations take for the coordinator being down (and queue those scans as offline)
+class CoordinatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+#Starts the coordinator's HTTP server in a background thread (port 0 picks a free one), returns (server, url).
+#Every scan it takes is sent to Alma with its API key, so it only listens beyond this computer if stations have to send a token.
+#backlog is how many connections can wait to be accepted (at least stations × their pipeline window)
+def start_coordinator(scanner, host="127.0.0.1", port=8750, token=None, backlog=CoordinatorServer.request_queue_size):
+    if not token and not is_loopback(host):
+        raise ValueError(f"Set a station token before listening on {host}, otherwise anyone on the network can send scans with the API key")
+    server = CoordinatorServer((host, port), CoordinatorHandler, bind_and_activate=False)
+    server.request_queue_size = backlog
+    try:
+        server.server_bind()
+        server.server_activate()
+    except OSError:
+        server.server_close()
+        raise
+    server.coordinator = Coordinator(scanner, token)
+    threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+    address = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    return server, f"http://{address}:{server.server_address[1]}"
+
+
+#A station's connection to the coordinator (one keep-alive pool for all of the station's scans in flight)
+class CoordinatorClient:
+    def __init__(self, url, station=None, token=None, pool_size=10, connect_timeout=5, read_timeout=60):
+        self.url = url.rstrip("/")
+        self.station = station or socket.gethostname()
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["X-Station-Token"] = token
+        #Latest stats the coordinator sent back with a finished scan
+        self.latest = None
+
+    #Yields the messages for one scan as they arrive. Raises requests' ConnectionError/Timeout if the coordinator can't be reached
+    def scan(self, barcode, scandate):
+        with self.session.post(f"{self.url}/scan", json={"barcode": barcode, "scandate": scandate, "station": self.station}, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    message = json.loads(line)
+                    if "coordinator" in message:
+                        self.latest = message.pop("coordinator")
+                    yield message
+
+    #Raises ConnectionError/Timeout if the coordinator is down
+    def check(self):
+        r = self.session.get(f"{self.url}/stats", timeout=self.timeout)
+        if r.status_code == 200:
+            self.latest = r.json()
+
+    #Shared Alma throughput/quota numbers (same shape as AlmaClient.stats), None until the coordinator has answered
+    def stats(self):
+        return self.latest["alma"] if self.latest is not None else None
+
+    def close(self):
+        self.session.close()
+
+
+#Stand-in for Scanner on a station that sends its scans to a coordinator: same results, same two phases, same timing numbers.
+#If the coordinator can't be reached the scan comes back as a connection failure, so it's queued and replayed like any offline scan
+class RemoteScanner:
+    def __init__(self, client, metrics):
+        self.client = client
+        self.metrics = metrics
+        #Shelf lists and bulk export are done by the coordinator (with its own settings.json), not on the stations
+        self.shelf = None
+        self.bulk = None
+
+    def check_connection(self):
+        self.client.check()
+
+    #Runs a scan on the coordinator. on_lookup is called with the lookup phase as soon as it arrives (found items the coordinator is still updating)
+    def run_scan(self, barcode, scandate=None, on_lookup=None):
+        scandate = scandate or today_scandate()
+        timings = {}
+        try:
+            for message in self.client.scan(barcode, scandate):
+                timings.update(message.pop("timings", {}))
+                if message.get("phase") == "lookup":
+                    if on_lookup is not None:
+                        on_lookup(dict(result_from_wire(message), timings=timings))
+                    continue
+                result = result_from_wire(message)
+                break
+            else:
+                raise ConnectionError("Coordinator closed the connection before the scan finished")
+        #Wrong station token: nothing will work until settings.json is fixed, so it's reported like a rejected API key rather than queued
+        except HTTPError as e:
+            logging.error(f"Barcode {barcode} scanned. Coordinator refused the scan (HTTP {e.response.status_code}), check the station token.")
+            result = {"barcode": barcode, "scandate": scandate, "connectFail": False, "founditem": False, "lookup": "auth_error"}
+        except (ConnectionError, Timeout) as e:
+            logging.warning(f"Coordinator at {self.client.url} couldn't be reached: {e}")
+            logging.error(f"Barcode {barcode} scanned. Connection attempt timed out.")
+            result = {"barcode": barcode, "scandate": scandate, "connectFail": True, "founditem": False}
+        result["timings"] = timings
+        return(result)
+
+    def process_barcode(self, barcode, scandate=None):
+        start = time.perf_counter()
+        result = self.run_scan(barcode, scandate)
+        self.metrics.record(result, (time.perf_counter() - start) * 1000)
+        return(result)
+
+
+#RemoteScanner if the "coordinator" block in settings.json has a url (this computer is a station), otherwise None
+def remote_scanner_from_settings(settings):
+    coordinator = settings.get('coordinator', {})
+    if not coordinator.get('url'):
+        return None
+    http = settings.get('http', {})
+    client = CoordinatorClient(coordinator['url'], coordinator.get('station'), coordinator.get('token'), http.get('pool_size', 10), http.get('connect_timeout', 5))
+    return RemoteScanner(client, metrics_from_settings(settings))
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import threading
+import time
+
+from inventory_core.item_parser import parse_item
+
+
+#Persistent item cache (SQLite in WAL mode) shared by both front-ends and batch mode, so a new session doesn't start cold.
+#Found items keep their parsed fields (for the display) and the raw record, barcodes Alma says don't exist are remembered
+#as "not found" so the same stray sticker doesn't cost a lookup every time it's scanned. Each kind has its own time limit
+class ItemCache:
+    def __init__(self, path="item_cache.db", found_ttl_seconds=7 * 24 * 60 * 60, not_found_ttl_seconds=24 * 60 * 60, max_items=50000):
+        self.found_ttl_seconds = found_ttl_seconds
+        self.not_found_ttl_seconds = not_found_ttl_seconds
+        self.max_items = max_items
+        self.writes = 0
+        #Shared between the Tk thread and the worker threads, the lock keeps writes in order
+        self.lock = threading.Lock()
+        #Both programs can have the file open at once, the timeout waits out the other one's write instead of failing
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS items (
+            barcode TEXT PRIMARY KEY,
+            found INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            fields TEXT,
+            record BLOB)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_stored_at ON items (stored_at)")
+
+    #(found, fields) for a barcode, or None if it isn't cached (or the entry has expired). fields is None for a "not found" entry
+    def get(self, barcode):
+        with self.lock:
+            row = self.conn.execute("SELECT found, stored_at, fields FROM items WHERE barcode = ?", (barcode,)).fetchone()
+            if row is None:
+                return None
+            found, stored_at, fields = row
+            ttl = self.found_ttl_seconds if found else self.not_found_ttl_seconds
+            if time.time() - stored_at > ttl:
+                self.conn.execute("DELETE FROM items WHERE barcode = ?", (barcode,))
+                return None
+            return (bool(found), json.loads(fields) if found else None)
+
+    #Raw item record XML as last fetched (or sent) for a barcode, or None
+    def record(self, barcode):
+        with self.lock:
+            row = self.conn.execute("SELECT record FROM items WHERE barcode = ? AND found = 1", (barcode,)).fetchone()
+            return row[0] if row is not None else None
+
+    #Stores a found item: the fields from parse_item (the updated copy of the record is left out) and the record as Alma returned it
+    def put(self, barcode, fields, record):
+        fields = {name: value for name, value in fields.items() if name != "itemdata"}
+        if isinstance(record, str):
+            record = record.encode('utf-8')
+        self.store(barcode, 1, json.dumps(fields), record)
+
+    #Parses and stores a record straight from a lookup response (for callers that don't parse with parse_item themselves)
+    def put_record(self, barcode, content):
+        self.put(barcode, parse_item(content, "", minimal=True), content)
+
+    #Remembers that Alma has no item with this barcode
+    def put_missing(self, barcode):
+        self.store(barcode, 0, None, None)
+
+    #After a successful update: the record sent is now what Alma has, so the cached copy shows the new inventory date
+    def updated(self, barcode, scandate, record):
+        cached = self.get(barcode)
+        if cached is None or not cached[0]:
+            return
+        fields = cached[1]
+        fields["inventory_date"] = scandate
+        self.put(barcode, fields, record)
+
+    def forget(self, barcode):
+        with self.lock:
+            self.conn.execute("DELETE FROM items WHERE barcode = ?", (barcode,))
+
+    def store(self, barcode, found, fields, record):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO items (barcode, found, stored_at, fields, record) VALUES (?, ?, ?, ?, ?)", (barcode, found, time.time(), fields, record))
+            #Trimming every write would mean a count each scan, every 100 writes keeps the file within about 100 of the limit
+            self.writes += 1
+            if self.writes % 100 == 0:
+                self.evict()
+
+    #Drops expired entries, then the oldest ones over max_items (call with the lock held)
+    def evict(self):
+        now = time.time()
+        self.conn.execute("DELETE FROM items WHERE (found = 1 AND stored_at < ?) OR (found = 0 AND stored_at < ?)", (now - self.found_ttl_seconds, now - self.not_found_ttl_seconds))
+        excess = self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] - self.max_items
+        if excess > 0:
+            self.conn.execute("DELETE FROM items WHERE barcode IN (SELECT barcode FROM items ORDER BY stored_at LIMIT ?)", (excess,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+#Optional "item_cache" block in settings.json (file plus ItemCache's time limits and size), None if it's left out or has no file
+def item_cache_from_settings(settings):
+    cache_settings = dict(settings.get('item_cache', {}))
+    path = cache_settings.pop('file', None)
+    if not path:
+        return None
+    return ItemCache(path, **cache_settings)
@@ -0,0 +1,119 @@
+import re
+from io import BytesIO
+
+#Uses lxml when it's installed (faster), otherwise the standard library version of the same API
+try:
+    from lxml import etree
+    _PARSE_ERRORS = (etree.XMLSyntaxError,)
+except ImportError:
+    import xml.etree.ElementTree as etree
+    _PARSE_ERRORS = (etree.ParseError,)
+
+
+#Elements whose text the updater needs from an item record
+TEXT_TAGS = ("mms_id", "holding_id", "pid", "process_type", "title", "author", "in_temp_location", "call_number", "description", "inventory_date")
+#Everything looked up by tag as the parser goes (first match wins, same as soup.<tag>), including the locations (read from their desc attribute) and the inventory date placement
+ITEM_TAGS = frozenset(TEXT_TAGS + ("library", "location", "temp_location", "item_data", "inventory_number"))
+#Code/name elements: the code is the element's text and the name its desc attribute (the temporary library isn't needed)
+CODED_TAGS = ("library", "location", "temp_location")
+
+#Raw-byte patterns for the minimal rewrite (covers <tag/>, <tag></tag> and <tag>value</tag>)
+INVENTORY_DATE_RE = re.compile(rb"<inventory_date\s*/>|<inventory_date(?:\s[^>]*)?>[^<]*</inventory_date\s*>")
+INVENTORY_NUMBER_RE = re.compile(rb"<inventory_number\s*/>|<inventory_number(?:\s[^>]*)?>[^<]*</inventory_number\s*>")
+
+
+#Minimal rewrite: sets the inventory date directly in the raw GET response bytes and leaves every other byte of the record as Alma sent it.
+#Replaces an existing <inventory_date>, otherwise inserts one right after <inventory_number>. Returns None if neither is there
+def splice_inventory_date(content, scandate):
+    newdate = b"<inventory_date>" + scandate.encode("utf-8") + b"</inventory_date>"
+    match = INVENTORY_DATE_RE.search(content)
+    if match is not None:
+        start, end = match.span()
+    else:
+        match = INVENTORY_NUMBER_RE.search(content)
+        if match is None:
+            return None
+        start = end = match.end()
+    #Joining memoryview slices copies the original buffer once, straight into the result
+    view = memoryview(content)
+    return b"".join((view[:start], newdate, view[end:]))
+
+
+#Single-pass parser: collects every field while the record streams in, then sets the inventory date
+#(spliced into the raw bytes when minimal is set, otherwise in the tree before re-serializing)
+def parse_item_fast(content, scandate, minimal=False):
+    found = {}
+    for event, elem in etree.iterparse(BytesIO(content), events=("end",)):
+        if elem.tag in ITEM_TAGS and elem.tag not in found:
+            found[elem.tag] = elem
+    #Last element closed is the <item> root
+    root = elem
+
+    fields = {tag: found[tag].text if tag in found else None for tag in TEXT_TAGS}
+    for tag in CODED_TAGS:
+        fields[tag] = found[tag].get("desc") if tag in found else None
+        fields[f"{tag}_code"] = found[tag].text if tag in found else None
+
+    if minimal:
+        fields["itemdata"] = splice_inventory_date(content, scandate)
+        if fields["itemdata"] is not None:
+            return(fields)
+
+    #Looks for existing inventory date field, adds it after the inventory number if missing, and updates value to current date
+    if "inventory_date" in found:
+        found["inventory_date"].text = scandate
+    else:
+        itemdata = found["item_data"]
+        addeddate = etree.Element("inventory_date")
+        addeddate.text = scandate
+        itemdata.insert(list(itemdata).index(found["inventory_number"]) + 1, addeddate)
+
+    #Updated item record XML to send back to Alma
+    fields["itemdata"] = etree.tostring(root, encoding="unicode")
+    return(fields)
+
+
+#Original BeautifulSoup parser, kept as the fallback for records the strict XML parser rejects
+def parse_item_soup(content, scandate, minimal=False):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "xml")
+
+    fields = {}
+    for tag in TEXT_TAGS:
+        element = soup.find(tag)
+        fields[tag] = element.string if element is not None else None
+    for tag in CODED_TAGS:
+        element = soup.find(tag)
+        fields[tag] = element.get('desc') if element is not None else None
+        fields[f"{tag}_code"] = element.string if element is not None else None
+
+    if minimal:
+        fields["itemdata"] = splice_inventory_date(content, scandate)
+        if fields["itemdata"] is not None:
+            return(fields)
+
+    #Looks for existing inventory date field, adds it if missing, and updates value to current date
+    try:
+        inventorydate = soup.inventory_date
+        inventorydate.string = scandate
+    except AttributeError:
+        addeddate = soup.new_tag("inventory_date")
+        addeddate.string = scandate
+
+        #Find inventory number field to use as placement reference
+        soup.item.item_data.inventory_number.insert_after(addeddate)
+
+    #Updated item record XML to send back to Alma
+    fields["itemdata"] = str(soup.item)
+    return(fields)
+
+
+#Parses an item record with the chosen backend ("fast" or "soup"), falling back to BeautifulSoup if the fast parser can't read it.
+#With minimal set, itemdata is the original response bytes with only the inventory date changed; otherwise it's the re-serialized record as a string
+def parse_item(content, scandate, backend="fast", minimal=False):
+    if backend == "fast":
+        try:
+            return parse_item_fast(content, scandate, minimal)
+        except _PARSE_ERRORS:
+            pass
+    return parse_item_soup(content, scandate, minimal)
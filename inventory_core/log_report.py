@@ -0,0 +1,219 @@
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+
+
+#Timestamp and message of a line in inventory_update.log
+LINE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}) (\w+)\s+(.*)$")
+
+#Scan messages written by Scanner (and the PySimpleGUI version), and what each one means: (pattern, outcome, what the groups are)
+MESSAGES = [
+    (re.compile(r"^Barcode (\S+) scanned\. Had process status (.*)\. Updated\?: (True|False)$"), None, "process"),
+    (re.compile(r"^Barcode (\S+) scanned\. Item currently has a temporary location\. Updated\?: (True|False)$"), None, "temp"),
+    (re.compile(r"^Barcode (\S+) scanned\. Flagged by rule (.*)\. Updated\?: (True|False)$"), None, "rule"),
+    (re.compile(r"^Barcode (\S+) scanned\. Updated\?: (True|False)$"), None, "plain"),
+    (re.compile(r"^Barcode (\S+) scanned\. Bulk job export: (\w+)$"), None, "bulk"),
+    (re.compile(r"^Barcode (\S+) scanned\. Item not found in Alma"), "not_found", None),
+    (re.compile(r"^Barcode (\S+) scanned\. Connection attempt timed out\.$"), "queued", None),
+    (re.compile(r"^Barcode (\S+) scanned\. Alma (?:busy|unavailable) \(HTTP \d+\), scan queued\.$"), "queued", None),
+    (re.compile(r"^Barcode (\S+) scanned\. Alma rejected the API key"), "auth_error", None),
+    #Batch mode, the GUI's scan worker and the coordinator ("scanned at station X")
+    (re.compile(r"^Barcode (\S+) (?:batch )?scanned(?: at station .+?)?\. Unexpected error"), "error", None),
+    (re.compile(r"^Barcode (\S+) scanned again\. "), "rescan", None),
+    #PySimpleGUI version
+    (re.compile(r"^Barcode (\S+) not found$"), "not_found", None),
+    (re.compile(r"^Barcode (\S+) has process type (\S+)$"), "process_status", "psg_process"),
+    (re.compile(r"^Inventory date updated! Barcode (\S+)$"), "updated", None),
+    (re.compile(r"^Inventory date not updated\? Barcode (\S+)$"), "update_failed", None),
+]
+
+#Outcomes that don't change what's known about an item, they're only counted per day
+COUNT_ONLY = frozenset(("rescan", "queued"))
+
+#Lines gathered in memory between writes to the index (keeps memory flat and makes an interrupted run lose little)
+COMMIT_EVERY = 50000
+
+
+#(day, time, barcode, outcome, processtype, temp) for a scan line of the text log, None for any other line
+def parse_log_line(line):
+    #Most lines aren't about a scan, this skips them before any regex runs
+    if "Barcode" not in line:
+        return None
+    match = LINE_RE.match(line)
+    if match is None:
+        return None
+    day, clock, level, message = match.groups()
+    for pattern, outcome, kind in MESSAGES:
+        found = pattern.match(message)
+        if found is None:
+            continue
+        barcode = found.group(1)
+        processtype = ""
+        temp = False
+        if kind == "process":
+            processtype = found.group(2)
+            outcome = "updated" if found.group(3) == "True" else "update_failed"
+        elif kind == "rule":
+            outcome = "updated" if found.group(3) == "True" else "update_failed"
+        elif kind in ("temp", "plain"):
+            temp = kind == "temp"
+            outcome = "updated" if found.group(2) == "True" else "update_failed"
+        elif kind == "bulk":
+            outcome = found.group(2)
+        elif kind == "psg_process":
+            processtype = found.group(2)
+        return (day, clock, barcode, outcome, processtype, temp)
+    return None
+
+
+#Same tuple for a line of the structured scan record file (see log_setup)
+def parse_record_line(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    day, _, clock = record["time"].partition("T")
+    return (day, clock[:8], record["barcode"], record["outcome"], record.get("processtype") or "", bool(record.get("temp")))
+
+
+#Rotated segments are numbered (.1 is the newest) when rotating by size, or dated when rotating on a schedule
+def segment_age(path, name):
+    suffix = name[len(path) + 1:].split(".")[0]
+    return (0, -int(suffix)) if suffix.isdigit() else (1, suffix)
+
+
+#The log plus its rotated segments (inventory_update.log.1.gz, ...), oldest first
+def log_files(path):
+    rotated = sorted(glob.glob(f"{path}.*"), key=lambda name: segment_age(path, name))
+    return rotated + [path]
+
+
+#Compressed rotated segments are read through gzip, their offsets are in the uncompressed text (the same as the original file's)
+def open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+#Files are known by a hash of their first line rather than their name, so a log that's been rotated to .1.gz (and then .2.gz...)
+#is recognised as the file already read, and a fresh log with the old name starts from the beginning
+def file_signature(path):
+    with open_log(path) as log:
+        first = log.readline()
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+
+#Incremental index over the scan log (SQLite, so memory doesn't grow with the log): per-day counts of each outcome and the latest
+#outcome for every barcode. Each file's byte offset is checkpointed, so running it again only reads lines added since the last run
+class ReportIndex:
+    def __init__(self, path="report_index.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (signature TEXT PRIMARY KEY, offset INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS daily (day TEXT NOT NULL, outcome TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, outcome));
+            CREATE TABLE IF NOT EXISTS latest (barcode TEXT PRIMARY KEY, seen TEXT NOT NULL, outcome TEXT NOT NULL, processtype TEXT, temp INTEGER) WITHOUT ROWID;
+        """)
+        #Counts and latest outcomes read since the last checkpoint, written to the index together with it
+        self.daily = Counter()
+        self.latest = {}
+
+    #Reads everything in a log file (text log, structured .jsonl, or a rotated .gz of either) past its checkpoint. Returns the number of scan lines indexed
+    def update(self, path):
+        signature = file_signature(path)
+        if signature is None:
+            return 0
+        row = self.conn.execute("SELECT offset FROM checkpoints WHERE signature = ?", (signature,)).fetchone()
+        offset = row[0] if row is not None else 0
+        parse = parse_record_line if ".jsonl" in path else parse_log_line
+
+        scans = 0
+        pending = 0
+        with open_log(path) as log:
+            log.seek(offset)
+            for raw in log:
+                #Last line still being written, it's picked up next time
+                if not raw.endswith(b"\n"):
+                    break
+                offset += len(raw)
+                scan = parse(raw.decode("utf-8", errors="replace"))
+                if scan is not None:
+                    self.add(scan)
+                    scans += 1
+                pending += 1
+                if pending >= COMMIT_EVERY:
+                    self.checkpoint(signature, offset)
+                    pending = 0
+        self.checkpoint(signature, offset)
+        return scans
+
+    def add(self, scan):
+        day, clock, barcode, outcome, processtype, temp = scan
+        self.daily[(day, outcome)] += 1
+        if outcome in COUNT_ONLY:
+            return
+        #Lines are in time order, so a later line for the same barcode just replaces the earlier one
+        self.latest[barcode] = (barcode, f"{day} {clock}", outcome, processtype, int(temp))
+
+    #Writes what's been gathered and saves the offset with it (one transaction, so they can't get out of step)
+    def checkpoint(self, signature, offset):
+        self.conn.executemany("INSERT INTO daily (day, outcome, count) VALUES (?, ?, ?) ON CONFLICT (day, outcome) DO UPDATE SET count = count + excluded.count", ((day, outcome, count) for (day, outcome), count in self.daily.items()))
+        self.conn.executemany("""INSERT INTO latest (barcode, seen, outcome, processtype, temp) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (barcode) DO UPDATE SET seen = excluded.seen, outcome = excluded.outcome, processtype = excluded.processtype, temp = excluded.temp
+            WHERE excluded.seen >= latest.seen""", self.latest.values())
+        self.daily.clear()
+        self.latest.clear()
+        self.conn.execute("INSERT INTO checkpoints (signature, offset) VALUES (?, ?) ON CONFLICT (signature) DO UPDATE SET offset = excluded.offset", (signature, offset))
+        self.conn.commit()
+
+    #Writes daily_summary.csv (a row per day, a column per outcome) and latest_outcomes.csv (latest outcome per barcode,
+    #only the given outcomes if there are any). Returns the paths written
+    def write_reports(self, directory, outcomes=None):
+        os.makedirs(directory, exist_ok=True)
+        summary_path = os.path.join(directory, "daily_summary.csv")
+        latest_path = os.path.join(directory, "latest_outcomes.csv")
+
+        columns = [row[0] for row in self.conn.execute("SELECT DISTINCT outcome FROM daily ORDER BY outcome")]
+        with open(summary_path, "w", newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(["day"] + columns + ["total"])
+            day = None
+            counts = {}
+            for rowday, outcome, count in self.conn.execute("SELECT day, outcome, count FROM daily ORDER BY day"):
+                if rowday != day and day is not None:
+                    writer.writerow([day] + [counts.get(column, 0) for column in columns] + [sum(counts.values())])
+                    counts = {}
+                day = rowday
+                counts[outcome] = count
+            if day is not None:
+                writer.writerow([day] + [counts.get(column, 0) for column in columns] + [sum(counts.values())])
+
+        #"process_status" picks out items that had one, whatever happened to the update
+        query = "SELECT barcode, seen, outcome, processtype, temp FROM latest"
+        clauses = []
+        parameters = [outcome for outcome in outcomes or () if outcome != "process_status"]
+        if parameters:
+            clauses.append(f"outcome IN ({', '.join('?' * len(parameters))})")
+        if outcomes and "process_status" in outcomes:
+            clauses.append("processtype != ''")
+        if clauses:
+            query += " WHERE " + " OR ".join(clauses)
+        with open(latest_path, "w", newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(["barcode", "last_scanned", "outcome", "process_status", "temporary_location"])
+            #Rows are streamed straight from the cursor
+            for barcode, seen, outcome, processtype, temp in self.conn.execute(query + " ORDER BY seen", parameters):
+                writer.writerow([barcode, seen, outcome, processtype, "yes" if temp else ""])
+        return (summary_path, latest_path)
+
+    def close(self):
+        self.conn.close()
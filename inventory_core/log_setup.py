@@ -0,0 +1,79 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+
+#Logger the per-scan machine-readable records go to (see ScanMetrics.record), each record carries the fields as record.scan
+SCAN_LOGGER = "inventory_core.scans"
+
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+#Rotated segments are gzipped as they're rolled over (on the writer thread, so never on a scan's time)
+def gzip_namer(name):
+    return name + ".gz"
+
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as plain, gzip.open(dest, "wb") as packed:
+        shutil.copyfileobj(plain, packed)
+    os.remove(source)
+
+
+#One JSON object per line: the scan record's fields
+class ScanRecordFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.scan)
+
+
+def is_scan_record(record):
+    return hasattr(record, "scan")
+
+
+def rotating_handler(path, max_bytes, when, backup_count, compress):
+    #Time based rotation if "when" is set (e.g. "midnight", "W0" for weekly), otherwise by size
+    if when:
+        handler = TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    if compress:
+        handler.namer = gzip_namer
+        handler.rotator = gzip_rotator
+    return handler
+
+
+#Sets up logging so nothing is written on the calling thread: every log call just puts the record on a queue, and a background
+#listener writes it to the rotating log file (and scan records to the structured file, if there is one).
+#The listener is flushed and stopped when the program exits
+def setup_logging(file="inventory_update.log", max_bytes=5 * 1024 * 1024, when=None, backup_count=30, compress=True, structured_file=None, level=logging.INFO):
+    textlog = rotating_handler(file, max_bytes, when, backup_count, compress)
+    textlog.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+    #Scan records are for the structured file only, the text log already has its own line for every scan
+    textlog.addFilter(lambda record: not is_scan_record(record))
+    handlers = [textlog]
+
+    if structured_file:
+        scanlog = rotating_handler(structured_file, max_bytes, when, backup_count, compress)
+        scanlog.setFormatter(ScanRecordFormatter())
+        scanlog.addFilter(is_scan_record)
+        handlers.append(scanlog)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(records))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+#Optional "logging" block in settings.json (same names as setup_logging's arguments)
+def logging_from_settings(settings):
+    return setup_logging(**settings.get('logging', {}))
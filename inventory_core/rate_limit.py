@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from collections import deque
+
+
+#Token bucket: allows short bursts up to `burst` calls, then holds callers to `rate` calls per second on average.
+#A full bucket plus a second's refill would let burst + rate calls out in one second, so on top of that no more than `rate` calls
+#are handed out in any one second (a burst only lets calls go out closer together, never more of them)
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        #Starts with one call's worth and fills up from there
+        self.tokens = 1
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        #Times of the calls handed out in the last second
+        self.recent = deque()
+        self.lock = threading.Lock()
+
+    #Blocks until a call is allowed
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.recent and self.recent[0] <= now - 1:
+                    self.recent.popleft()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif len(self.recent) >= max(1, int(self.rate)):
+                    wait = self.recent[0] + 1 - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.recent.append(now)
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+    #Stops handing out calls for a while (e.g. after Alma says the per-second threshold was hit).
+    #The bucket starts refilling from empty when the pause ends, so no burst goes out straight after it
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+#Keeps every Alma call under the per-second threshold and stretches the daily quota.
+#Reads the remaining daily calls from Alma's X-Exl-Api-Remaining header and slows down in proportion once it drops below slow_below
+class QuotaGovernor:
+    def __init__(self, per_second=20, burst=None, slow_below=10000, min_per_second=1, throttle_pause=1, log_every=500):
+        self.per_second = per_second
+        self.slow_below = slow_below
+        self.min_per_second = min_per_second
+        self.throttle_pause = throttle_pause
+        self.log_every = log_every
+        self.bucket = TokenBucket(per_second, burst)
+        self.lock = threading.Lock()
+        #Time of each call in the last minute, for the throughput figure
+        self.recent = deque()
+        self.calls = 0
+        self.throttled = 0
+        self.remaining = None
+
+    #Blocks until the next Alma call is allowed
+    def acquire(self):
+        self.bucket.acquire()
+        now = time.monotonic()
+        with self.lock:
+            self.recent.append(now)
+            self.calls += 1
+            calls = self.calls
+        if self.log_every and calls % self.log_every == 0:
+            stats = self.stats()
+            logging.info(f"Alma API usage: {calls} calls this session, {stats['per_second']:.1f} calls/s, {stats['remaining']} calls left today")
+
+    #Updates quota/throttle state from an Alma response
+    def observe(self, response):
+        remaining = response.headers.get("X-Exl-Api-Remaining")
+        if remaining is not None and remaining.isdigit():
+            with self.lock:
+                self.remaining = int(remaining)
+            self.bucket.set_rate(self.allowed_rate(int(remaining)))
+
+        #429 means a threshold was hit anyway (other stations sharing the key, or the daily quota ran out), back off for a moment
+        if response.status_code == 429:
+            with self.lock:
+                self.throttled += 1
+            logging.warning(f"Alma API threshold reached (HTTP 429), pausing requests for {self.throttle_pause}s")
+            self.bucket.pause(self.throttle_pause)
+
+    #Calls per second allowed with this many calls left today: full speed above slow_below, scaling down to min_per_second near zero
+    def allowed_rate(self, remaining):
+        if remaining >= self.slow_below:
+            return self.per_second
+        return max(self.min_per_second, self.per_second * remaining / self.slow_below)
+
+    #Current numbers for the GUI status line and the log
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+            return {"per_second": len(self.recent) / 60, "calls": self.calls, "throttled": self.throttled, "remaining": self.remaining, "allowed_per_second": self.bucket.rate}
@@ -0,0 +1,92 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory_core.log_report import open_log, parse_log_line
+from inventory_core.scan_journal import outcome_of
+
+
+#Outcomes that mean a scan has to be done again: the update failed, Alma couldn't be reached, or processing broke
+FAILED_OUTCOMES = frozenset(("update_failed", "queued", "error"))
+#Outcomes that settle an earlier failure for the same barcode (it worked, or sending it again wouldn't change anything)
+RESOLVED_OUTCOMES = frozenset(("updated", "exported", "duplicate", "flagged", "not_found"))
+
+
+#Works out which barcodes still need their update, from the scan journal and/or the log. Each barcode's latest scan decides:
+#a failure followed by a successful scan is left alone, otherwise the barcode is re-driven with the date of its last failed scan.
+#Only barcodes that failed are kept while the log is read (successes only matter for those), so memory follows the failures, not the log
+class FailedScans:
+    def __init__(self):
+        #barcode -> [time of latest scan, still failed?, scandate of the failure, journal ids to close, where it was found]
+        self.scans = {}
+
+    #Journal first: it has exact scan dates and its ids get closed once the barcode has been re-driven
+    def add_journal(self, journal):
+        for scanid, barcode, scanned_at, scandate, status, outcome in journal.history():
+            if status == "queued":
+                outcome = "queued"
+            elif status != "done":
+                continue
+            self.event(barcode, scanned_at, outcome, scandate, "journal", scanid)
+
+    def add_log(self, path):
+        with open_log(path) as log:
+            for raw in log:
+                scan = parse_log_line(raw.decode("utf-8", errors="replace"))
+                if scan is not None:
+                    day, clock, barcode, outcome, processtype, temp = scan
+                    self.event(barcode, f"{day} {clock}", outcome, f"{day}Z", "log")
+
+    def event(self, barcode, seen, outcome, scandate, source, scanid=None):
+        entry = self.scans.get(barcode)
+        if outcome in FAILED_OUTCOMES:
+            if entry is None:
+                self.scans[barcode] = [seen, True, scandate, [scanid] if scanid is not None else [], source]
+            elif seen >= entry[0]:
+                entry[:3] = [seen, True, scandate]
+                if scanid is not None:
+                    entry[3].append(scanid)
+                if source not in entry[4]:
+                    entry[4] += f"+{source}"
+        elif outcome in RESOLVED_OUTCOMES:
+            #Journal successes are kept (the log read after it may have older failures), log successes only matter for known failures
+            if entry is None and source == "journal":
+                self.scans[barcode] = [seen, False, scandate, [], source]
+            elif entry is not None and seen >= entry[0]:
+                entry[:2] = [seen, False]
+
+    #(barcode, scandate, journal ids, source) for every barcode whose latest scan failed
+    def failed(self):
+        return [(barcode, entry[2], entry[3], entry[4]) for barcode, entry in self.scans.items() if entry[1]]
+
+
+#Runs the lookup+update again for each failed scan on a thread pool, with the original scan date as the inventory date.
+#handler(barcode, scandate) returns a result dict, on_result(scan, result) is called for each one as it finishes.
+#Journal entries are closed with the new outcome (or stay queued if Alma still can't be reached). Returns a count per outcome
+def redrive(failed, handler, workers=4, limiter=None, journal=None, on_result=None):
+    counts = {}
+
+    def redrive_one(scan):
+        barcode, scandate, scanids, source = scan
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = handler(barcode, scandate)
+        except Exception as e:
+            logging.exception(f"Barcode {barcode} re-driven. Unexpected error while processing.")
+            result = {"barcode": barcode, "error": e}
+        outcome = outcome_of(result)
+        if journal is not None:
+            for scanid in scanids:
+                if outcome == "queued":
+                    journal.queue(scanid)
+                else:
+                    journal.finish(scanid, outcome)
+        logging.info(f"Barcode {barcode} re-driven from {source} (scanned {scandate}). Outcome: {outcome}")
+        if on_result is not None:
+            on_result(scan, result)
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="redrive") as pool:
+        for outcome in pool.map(redrive_one, failed):
+            counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
@@ -0,0 +1,33 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory_core.scan_journal import outcome_of
+
+
+#Sends every queued scan in the journal to Alma on a small thread pool, using each scan's original date as its inventory date.
+#handler(barcode, scandate) returns the same result dict as a live scan. Scans that hit the connection error again stay queued.
+#Returns a count of scans per outcome
+def replay_queued(journal, handler, workers=4, limiter=None):
+    counts = {}
+
+    def replay_one(scan):
+        scanid, barcode, scandate = scan
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = handler(barcode, scandate)
+        except Exception as e:
+            logging.exception(f"Barcode {barcode} replayed. Unexpected error while processing.")
+            result = {"barcode": barcode, "error": e}
+        outcome = outcome_of(result)
+        if outcome == "queued":
+            journal.queue(scanid)
+        else:
+            journal.finish(scanid, outcome)
+            logging.info(f"Barcode {barcode} replayed from offline queue (scanned {scandate}). Outcome: {outcome}")
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as pool:
+        for outcome in pool.map(replay_one, journal.queued()):
+            counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
@@ -0,0 +1,103 @@
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError
+
+
+#Sorts an Alma response into what actually happened, so a throttled or broken request isn't mistaken for a missing item:
+#"ok", "not_found" (Alma answers 400/404 for unknown barcodes), "throttled" (429), "server_error" (5xx), "auth_error" (bad/unauthorized API key)
+def classify(response):
+    status = response.status_code
+    if status == 200:
+        return "ok"
+    if status == 429:
+        return "throttled"
+    if status >= 500:
+        return "server_error"
+    if status in (401, 403):
+        return "auth_error"
+    #Alma reports a missing or unauthorized API key as a 400 with an API-key error message
+    if status == 400 and b"API-key" in response.content:
+        return "auth_error"
+    return "not_found"
+
+
+#Worth trying again: Alma or the network should recover on its own
+RETRYABLE = frozenset(["throttled", "server_error"])
+
+
+#Raised instead of making a request while the circuit breaker is open. A ConnectionError, so callers already treat it like being offline
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+#Jittered exponential backoff: each retry waits a random time up to base * 2^attempt seconds (capped), so stations don't all retry at once
+class RetryPolicy:
+    def __init__(self, retries=3, backoff_base=0.5, backoff_cap=8):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    #Seconds to wait before the next try, never more than backoff_cap: a scan waiting on Alma holds its worker and its place in the pipeline
+    def delay(self, attempt, response=None):
+        #Alma's own Retry-After wins when it sends one
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    #Alma's Retry-After in seconds, None if it didn't send a number
+    def retry_after(self, response):
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return int(response.headers["Retry-After"])
+        return None
+
+    #True if Alma asked for a longer wait than backoff_cap. Trying again sooner would only be refused, so the scan is given up on (and queued)
+    def waits_too_long(self, response):
+        retry_after = self.retry_after(response)
+        return retry_after is not None and retry_after > self.backoff_cap
+
+
+#Stops calling Alma after failure_threshold failures in a row, so scans fail fast into the offline queue
+#instead of each one waiting out its own timeout. After reset_seconds one trial request is let through to see if Alma is back
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    #True if a request may go out right now
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("Alma is reachable again, circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.warning(f"{self.failures} failed Alma requests in a row, circuit breaker opened for {self.reset_seconds}s")
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
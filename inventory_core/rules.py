@@ -0,0 +1,96 @@
+#Item fields a rule can check. Locations and libraries match by name or by code
+FIELD_VALUES = {
+    "location": ("location", "location_code"),
+    "library": ("library", "library_code"),
+    "temp_location": ("temp_location", "temp_location_code"),
+}
+
+#How matches of the built-in kinds of rule are shown and logged. Rules on any other field are "withrule"
+SCREENS = {"process_type": "withprocess", "in_temp_location": "withtemp"}
+
+#Colours a rule can give the information frame (and its scan history row)
+COLOURS = frozenset(("success", "note", "warning", "error", "misshelved"))
+
+#The checks used when settings.json has no "rules" list: the process statuses in statuslist, then temporary locations
+DEFAULT_RULES = [
+    {"name": "process_status", "field": "process_type", "colour": "warning", "message": "Item has process status: {value}, \nPlease set aside!"},
+    {"name": "temporary_location", "field": "in_temp_location", "in": ["true"], "colour": "note", "message": "Note: This item is in a temporary location"},
+]
+
+
+def lowered(values):
+    return frozenset(str(value).lower() for value in values)
+
+
+#One rule from settings.json, with its value lists turned into sets so checking an item is a few hash lookups
+class Rule:
+    __slots__ = ("name", "fields", "values", "allow", "unless", "labels", "screen", "colour", "message")
+
+    def __init__(self, rule, statuslist=(), processlabel=None):
+        self.name = rule["name"]
+        field = rule["field"]
+        self.fields = FIELD_VALUES.get(field, (field,))
+        #"in": matches items with one of these values. "not_in": an allowlist, matches items with a value that isn't on it
+        if "not_in" in rule:
+            self.values = lowered(rule["not_in"])
+            self.allow = True
+        elif "in" in rule:
+            self.values = lowered(rule["in"])
+            self.allow = False
+        elif field == "process_type":
+            self.values = lowered(statuslist)
+            self.allow = False
+        else:
+            raise ValueError(f"Rule {self.name} needs an \"in\" or \"not_in\" list")
+        #Exemptions, e.g. {"temp_location": ["Main Stacks"]} for a temporary location that's where the user is working anyway
+        self.unless = [(FIELD_VALUES.get(name, (name,)), lowered(values)) for name, values in rule.get("unless", {}).items()]
+        #Process types are shown with their labels instead of their codes
+        self.labels = (processlabel or {}) if field == "process_type" else {}
+        self.screen = SCREENS.get(field, "withrule")
+        self.colour = rule.get("colour", "warning")
+        if self.colour not in COLOURS:
+            raise ValueError(f"Rule {self.name} has unknown colour {self.colour} (one of {', '.join(sorted(COLOURS))})")
+        self.message = rule.get("message", f"Flagged by rule {self.name}, \nPlease set aside!")
+
+    #What the item matched on (its label or value), None if the rule doesn't apply to it.
+    #Items without the field at all never match (shelf list rows may not have a library, for one)
+    def test(self, fields):
+        present = [fields.get(name) for name in self.fields if fields.get(name)]
+        if not present:
+            return None
+        if any(str(value).lower() in self.values for value in present) == self.allow:
+            return None
+        for names, exempt in self.unless:
+            if any(fields.get(name) and str(fields.get(name)).lower() in exempt for name in names):
+                return None
+        return self.labels.get(present[0], present[0])
+
+
+#The rules from settings.json, checked against an item in one pass. Built once at start up
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = rules
+
+    #Every rule the item's fields match, in settings order, as JSON-safe dicts for the result. The first one decides how the item is shown
+    def evaluate(self, fields):
+        matches = []
+        for rule in self.rules:
+            value = rule.test(fields)
+            if value is not None:
+                matches.append({"name": rule.name, "screen": rule.screen, "colour": rule.colour, "message": rule.message.replace("{value}", str(value)), "value": value})
+        return matches
+
+
+#RuleSet for the "rules" list in settings.json (DEFAULT_RULES if there isn't one). statuslist and processlabel are the process statuses
+#to flag and their labels, copied from the PROCESSTYPE code table. Once the code tables have been fetched from Alma (a CodeTables)
+#Alma's own labels are used, and with flag_all_process_types set in the code_tables block every process type in them is flagged
+#instead of just the statuslist ones. Allowlists left empty are skipped
+def rules_from_settings(settings, tables=None):
+    statuslist = settings.get('statuslist', [])
+    processlabel = settings.get('processlabel', {})
+    if tables is not None and tables.process_types:
+        processlabel = dict(processlabel, **tables.process_types)
+        if settings.get('code_tables', {}).get('flag_all_process_types'):
+            statuslist = list(tables.process_types)
+    rules = [Rule(rule, statuslist, processlabel) for rule in settings.get('rules', DEFAULT_RULES) if rule.get("not_in", True)]
+    return RuleSet(rules)
@@ -0,0 +1,35 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+#Recently updated barcodes (LRU with a time limit), so a rescan of the same item returns instantly instead of costing another GET and PUT
+class RecentScans:
+    def __init__(self, size=1000, ttl_seconds=8 * 60 * 60):
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    #Last successful result for this barcode and inventory date, or None if there isn't one (or it's expired)
+    def get(self, barcode, scandate):
+        with self.lock:
+            entry = self.entries.get(barcode)
+            if entry is None:
+                return None
+            stored, result = entry
+            if time.monotonic() - stored > self.ttl_seconds or result["scandate"] != scandate:
+                del self.entries[barcode]
+                return None
+            self.entries.move_to_end(barcode)
+            return result
+
+    def put(self, barcode, result):
+        with self.lock:
+            self.entries[barcode] = (time.monotonic(), result)
+            self.entries.move_to_end(barcode)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
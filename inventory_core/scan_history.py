@@ -0,0 +1,88 @@
+#Display state for a finished scan's outcome (the colour its history row gets). Outcomes not listed are successes
+OUTCOME_STATES = {
+    "queued": "note",
+    "flagged": "warning",
+    "not_found": "error",
+    "update_failed": "error",
+    "auth_error": "error",
+    "error": "error",
+}
+
+
+#State of a history row once its scan has finished: problems override what the item showed, otherwise the item's own state
+#(process status, temporary location, out of shelf order) is kept
+def finished_state(state, outcome):
+    finished = OUTCOME_STATES.get(outcome, "success")
+    if finished == "success" and state != "pending":
+        return state
+    return finished
+
+
+#One row of the scan history. Slots keep each one small (no per-instance dict), so a full buffer is a fixed, small amount of memory
+class HistoryEntry:
+    __slots__ = ("scanid", "barcode", "title", "callnumber", "state")
+
+    def __init__(self, scanid, barcode, title="", callnumber="", state="pending"):
+        self.scanid = scanid
+        self.barcode = barcode
+        self.title = title
+        self.callnumber = callnumber
+        self.state = state
+
+
+#This session's scans, newest first. The most recent `capacity` are kept in a ring buffer (updated in place as their scans finish),
+#older ones are read back from the scan journal when scrolled to, so memory stays the same however long the session runs.
+#Only used from the Tk thread
+class ScanHistory:
+    def __init__(self, capacity=500, journal=None):
+        self.capacity = capacity
+        self.journal = journal
+        self.ring = [None] * capacity
+        #Slot of the oldest entry still in the ring, and how many entries are in it
+        self.start = 0
+        self.count = 0
+        #Scans this session, including the ones that have spilled to the journal
+        self.total = 0
+        self.first_scanid = None
+        self.byid = {}
+
+    def __len__(self):
+        return self.total
+
+    def add(self, entry):
+        if self.first_scanid is None:
+            self.first_scanid = entry.scanid
+        if self.count == self.capacity:
+            del self.byid[self.ring[self.start].scanid]
+            self.ring[self.start] = entry
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.ring[(self.start + self.count) % self.capacity] = entry
+            self.count += 1
+        self.byid[entry.scanid] = entry
+        self.total += 1
+
+    #Entry for a scan still in the ring, None once it has spilled
+    def get(self, scanid):
+        return self.byid.get(scanid)
+
+    #Newest entry for a barcode still in the ring
+    def latest(self, barcode):
+        for index in range(self.count):
+            entry = self.ring[(self.start + self.count - 1 - index) % self.capacity]
+            if entry.barcode == barcode:
+                return entry
+        return None
+
+    #Up to `limit` entries starting `offset` from the newest: from the ring, then from the journal for anything older
+    def rows(self, offset, limit):
+        entries = []
+        for index in range(offset, min(offset + limit, self.count)):
+            entries.append(self.ring[(self.start + self.count - 1 - index) % self.capacity])
+        if len(entries) < limit and self.journal is not None and self.total > self.count:
+            oldest = self.ring[self.start].scanid
+            spilled = max(0, offset - self.count)
+            for scanid, barcode, title, callnumber, status, outcome in self.journal.page(self.first_scanid, oldest, spilled, limit - len(entries)):
+                state = finished_state("pending", outcome) if status == "done" else ("note" if status == "queued" else "pending")
+                entries.append(HistoryEntry(scanid, barcode, title or "", callnumber or "", state))
+        return entries
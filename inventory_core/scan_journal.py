@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+
+#Inventory date for a scan made right now, in the format Alma expects
+def today_scandate():
+    rawdate = datetime.now().strftime("%Y-%m-%d")
+    return f"{rawdate}Z"
+
+
+#Durable local record of every scan (SQLite in WAL mode), so scans made while Alma can't be reached are kept and replayed later.
+#Status is "pending" while a scan is being processed, "queued" while it's waiting for the connection to come back, and "done" once Alma answered
+class ScanJournal:
+    def __init__(self, path="scan_journal.db"):
+        #Shared between the Tk thread and the worker/replay threads, the lock keeps writes in order
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS scans (
+            id INTEGER PRIMARY KEY,
+            barcode TEXT NOT NULL,
+            scanned_at TEXT NOT NULL,
+            scandate TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            outcome TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            title TEXT,
+            call_number TEXT)""")
+        #Journals from before the scan history panel don't have the item's title and call number yet
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(scans)")]
+        for column in ("title", "call_number"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE scans ADD COLUMN {column} TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS scans_status ON scans (status)")
+        #Anything still "pending" was cut off by the program closing mid-scan, so it goes back in the queue
+        self.conn.execute("UPDATE scans SET status = 'queued' WHERE status = 'pending'")
+
+    #Records a scan the moment it's made, scandate is the inventory date it should get even if it's only sent days later
+    def record(self, barcode, scandate, status="pending"):
+        with self.lock:
+            cursor = self.conn.execute("INSERT INTO scans (barcode, scanned_at, scandate, status) VALUES (?, ?, ?, ?)", (barcode, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), scandate, status))
+            return cursor.lastrowid
+
+    #Marks a scan as waiting for the connection to come back
+    def queue(self, scanid):
+        with self.lock:
+            self.conn.execute("UPDATE scans SET status = 'queued', attempts = attempts + 1 WHERE id = ?", (scanid,))
+
+    #Marks a scan as finished with its outcome (see outcome_of), and the item's title and call number if it was found
+    def finish(self, scanid, outcome, title=None, callnumber=None):
+        with self.lock:
+            self.conn.execute("UPDATE scans SET status = 'done', outcome = ?, attempts = attempts + 1, title = COALESCE(?, title), call_number = COALESCE(?, call_number) WHERE id = ?", (outcome, title, callnumber, scanid))
+
+    #Scans still waiting to go to Alma, oldest first
+    def queued(self):
+        with self.lock:
+            return self.conn.execute("SELECT id, barcode, scandate FROM scans WHERE status = 'queued' ORDER BY id").fetchall()
+
+    #Every scan, oldest first: (id, barcode, scanned_at, scandate, status, outcome)
+    def history(self):
+        with self.lock:
+            return self.conn.execute("SELECT id, barcode, scanned_at, scandate, status, outcome FROM scans ORDER BY id").fetchall()
+
+    #Scans from first_id up to (not including) before_id, newest first, skipping the newest `offset`: (id, barcode, title, call_number, status, outcome)
+    def page(self, first_id, before_id, offset, limit):
+        with self.lock:
+            return self.conn.execute("SELECT id, barcode, title, call_number, status, outcome FROM scans WHERE id >= ? AND id < ? ORDER BY id DESC LIMIT ? OFFSET ?", (first_id, before_id, limit, offset)).fetchall()
+
+    def queued_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scans WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+#Short outcome label for a processed scan result dict
+def outcome_of(result):
+    if "error" in result:
+        return "error"
+    if result["connectFail"]:
+        return "queued"
+    if result.get("lookup") == "auth_error":
+        return "auth_error"
+    if not result["founditem"]:
+        return "not_found"
+    #Bulk job export mode: "exported", "flagged" or "duplicate" instead of an update result
+    if "bulk" in result:
+        return result["bulk"]
+    if result["updatestatus"]:
+        return "updated"
+    return "update_failed"
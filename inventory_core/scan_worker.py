@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+
+
+#Runs scan lookups/updates on background threads so the Tk mainloop never waits on Alma.
+#Barcodes go in through submit(), results come back out on the Tk thread through poll().
+#With several workers, several scans are in flight at once, but results are still handed back in scan order: a scan's first
+#result is held until every earlier scan has shown its first result, so the screen always matches the item in hand
+class ScanWorker:
+    def __init__(self, handler, workers=1, max_queued=None):
+        #handler takes a barcode (plus any keyword arguments given to submit) and returns a result dict for the GUI to display
+        self.handler = handler
+        #Scans allowed in flight (running or waiting for a worker) before submit starts refusing, None for no limit
+        self.limit = None if max_queued is None else workers + max_queued
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        #Sequence numbers: next one to hand out, next one to show, and out-of-order results held until their turn
+        self.nextseq = 0
+        self.showseq = 0
+        self.waiting = {}
+        #Sequence number of the scan each worker thread is running, so post() can tag in-between results
+        self.local = threading.local()
+        self.threads = []
+        for n in range(workers):
+            thread = threading.Thread(target=self._run, name=f"scan-worker-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    #Queues a barcode for processing and returns immediately. Returns False (and queues nothing) if the window is full.
+    #fields go to the handler as keyword arguments, and are copied into the error result if the handler fails
+    def submit(self, barcode, **fields):
+        with self.lock:
+            if self.limit is not None and self.inflight >= self.limit:
+                return False
+            self.inflight += 1
+            seq = self.nextseq
+            self.nextseq += 1
+        self.jobs.put((seq, barcode, fields))
+        return True
+
+    #True if submit would refuse the next barcode
+    def full(self):
+        with self.lock:
+            return self.limit is not None and self.inflight >= self.limit
+
+    #Worker loop, a None job tells the thread to exit
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            seq, barcode, fields = job
+            self.local.seq = seq
+            try:
+                result = self.handler(barcode, **fields)
+            except Exception as e:
+                #Anything unexpected still has to come back to the GUI (with what it was submitted with, e.g. its journal entry), otherwise the scan just vanishes
+                logging.exception(f"Barcode {barcode} scanned. Unexpected error while processing.")
+                result = dict(fields, barcode=barcode, error=e)
+            self.local.seq = None
+            with self.lock:
+                self.inflight -= 1
+            self.results.put((seq, result))
+
+    #Lets a handler send an in-between result back to the GUI before it returns (e.g. item details before the update is done).
+    #From any other thread the result isn't tied to a scan and is handed over straight away
+    def post(self, result):
+        self.results.put((getattr(self.local, "seq", None), result))
+
+    #Returns every result that can be shown so far (in scan order) without blocking
+    def drain(self):
+        ready = []
+        while True:
+            try:
+                seq, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            #Untied results, and later results for scans already on screen, don't need to wait
+            if seq is None or seq < self.showseq:
+                ready.append(result)
+            else:
+                self.waiting.setdefault(seq, []).append(result)
+
+        while self.showseq in self.waiting:
+            ready.extend(self.waiting.pop(self.showseq))
+            self.showseq += 1
+        return ready
+
+    #Checks for finished results every interval (ms) from the Tk thread and hands each one to callback.
+    #A result the callback fails on is logged and skipped, polling carries on whatever happens
+    def poll(self, gui, callback, interval=50):
+        try:
+            for result in self.drain():
+                try:
+                    callback(result)
+                except Exception:
+                    logging.exception(f"Result for barcode {result.get('barcode')} couldn't be shown.")
+        finally:
+            gui.after(interval, lambda: self.poll(gui, callback, interval))
+
+    #Tells all worker threads to finish once the jobs already queued are done
+    def stop(self):
+        for thread in self.threads:
+            self.jobs.put(None)
@@ -0,0 +1,366 @@
+import logging
+import re
+import time
+
+from requests.exceptions import ConnectionError, Timeout
+
+from inventory_core.alma_client import client_from_settings
+from inventory_core.bulk_export import bulk_export_from_settings
+from inventory_core.call_numbers import call_number_key
+from inventory_core.code_tables import code_tables_from_settings
+from inventory_core.item_cache import item_cache_from_settings
+from inventory_core.item_parser import parse_item
+from inventory_core.resilience import RETRYABLE, classify
+from inventory_core.rules import rules_from_settings
+from inventory_core.scan_cache import RecentScans
+from inventory_core.scan_journal import today_scandate
+from inventory_core.telemetry import collect_timings, metrics_from_settings, span
+
+
+#True if an item's inventory date is already scandate or later. Only Alma's own YYYY-MM-DD format is compared
+#(shelf list exports can have other date formats, those items just get fetched and checked again)
+def dated_on_or_after(inventorydate, scandate):
+    return re.match(r"\d{4}-\d{2}-\d{2}", inventorydate) is not None and inventorydate[:10] >= scandate[:10]
+
+
+#Back-end scan steps (the API requests and data parsing), with no GUI attached so the front-ends and the batch tools can share them.
+#Holds everything from settings.json the steps need, plus the shared pooled client and the cache of recently updated barcodes
+class Scanner:
+    def __init__(self, settings, client=None):
+        #R/W Bibs API Key for Alma instance
+        self.bibapi = settings['bibapi']
+        #Base Alma server URL
+        self.alma_base = settings['alma_base']
+        self.headers = settings['headers']
+        #Item XML parser: "fast" (single-pass lxml/ElementTree) or "soup" (BeautifulSoup)
+        self.xml_parser = settings.get('xml_parser', "fast")
+        #Only changes the inventory date in the raw record bytes instead of re-serializing the whole record for the update
+        self.minimal_rewrite = settings.get('minimal_rewrite', True)
+        #Shared pooled connection to Alma (keep-alive, default headers and timeouts come from settings)
+        self.client = client or client_from_settings(settings)
+        #PROCESSTYPE and location code tables, read from a local file and refreshed from Alma in the background (None if turned off)
+        self.settings = settings
+        self.codes = code_tables_from_settings(settings, self.client)
+        #Status/location rules (process statuses from the PROCESSTYPE code table, temporary locations, allowlists), compiled once into lookup sets
+        self.rules = rules_from_settings(settings, self.codes.tables if self.codes is not None else None)
+        if self.codes is not None:
+            self.codes.start(self.code_tables_changed)
+        #Barcodes already updated this session, so rescans skip the GET and PUT
+        self.recent = RecentScans(**settings.get('duplicate_cache', {}))
+        #Persistent cache of item records and unknown barcodes, kept between sessions (None if turned off)
+        self.items = item_cache_from_settings(settings)
+        #Optional ShelfList of expected items, scans found in it are shown without waiting for the lookup
+        self.shelf = None
+        #Bulk job export mode: found items are written to job files for Alma's "Change Physical Items" job instead of being updated one by one (None for normal updates)
+        self.bulk = bulk_export_from_settings(settings)
+        #Per-stage timings of every scan (rolling numbers for the GUI panel, JSON lines file if set)
+        self.metrics = metrics_from_settings(settings)
+
+    #Look up item by barcode, if found get item record XML
+    def scan_barcode (self, barcode):
+        try:
+            with span("lookup"):
+                r = self.client.get(f"{self.alma_base}/items?view=label&item_barcode={barcode}&apikey={self.bibapi}")
+
+            kind = classify(r)
+
+            #Still throttled or erroring after the client's retries: Alma's side, not the item, so it's handled like a failed connection (the scan is queued for later)
+            if kind in ("throttled", "server_error"):
+                founditem = False
+                connectFail = True
+
+            #Connected, but the record wasn't returned (item not found, or the API key was rejected)
+            elif kind != "ok":
+                founditem = False
+                connectFail = False
+
+            #Otherwise, status code is 200, connection made and record found
+            else:
+                founditem = True
+                connectFail = False
+
+            return(founditem, connectFail, r)
+
+        #Adds timeout exception if unable to connect to server to check for item
+        except (ConnectionError, Timeout):
+            connectFail = True
+            founditem = False
+            r = ""
+            return(founditem, connectFail, r)
+
+    #Parses item data XML to find elements for display and eventual record update
+    #barcode is only passed when the record should also be saved to the item cache
+    def retreive_item_data (self, r, scandate, barcode=None):
+        #Pulls every field and sets the inventory date in one pass (BeautifulSoup if set in settings or the fast parser can't read the record)
+        with span("parse"):
+            fields = parse_item(r.content, scandate, self.xml_parser, self.minimal_rewrite)
+        if barcode is not None and self.items is not None:
+            self.items.put(barcode, fields, r.content)
+
+        #Locate identifiers in data (used for update request)
+        mmsid = fields['mms_id']
+        holdid = fields['holding_id']
+        itemid = fields['pid']
+
+        processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches = self.describe(fields)
+
+        #Updated item record XML to send back to Alma (inventory date already set by the parser)
+        itemdata = fields['itemdata']
+        return(itemdata, mmsid, holdid, itemid, processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches)
+
+    #New code tables from the background refresh: the rules are compiled again with them and swapped in whole
+    def code_tables_changed (self, tables):
+        self.rules = rules_from_settings(self.settings, tables)
+
+    #Display/status values for an item's fields (from a parsed record or a shelf list entry)
+    def describe (self, fields):
+        #Library/location names the record or shelf list row doesn't have, from the code tables
+        tables = self.codes.tables if self.codes is not None else None
+        if tables is not None:
+            fields = tables.fill_names(fields)
+
+        #Checks every rule (process status, temporary location, and any set up in settings.json) in one pass
+        matches = self.rules.evaluate(fields)
+        processtype = next((match["value"] for match in matches if match["screen"] == "withprocess"), "")
+        inprocess = any(match["screen"] == "withprocess" for match in matches)
+        intemp = any(match["screen"] == "withtemp" for match in matches)
+
+        #Look for metadata elements for display
+        title = fields.get('title') or ""
+        author = fields.get('author') or ""
+
+        #Shows the temporary location if the item is in one (even one a rule exempts)
+        if fields.get('in_temp_location') == 'true':
+            templocation_raw = fields['temp_location']
+            location = f"{templocation_raw} (Temporary Location)"
+        else:
+            location = fields.get('location') or fields.get('location_code')
+
+        #Gets call number and item description
+        callnumber = fields.get('call_number') or ""
+        desc = fields.get('description') or ""
+
+        #Inventory date the record had before this scan
+        inventorydate = fields.get('inventory_date') or ""
+
+        return(processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches)
+
+    #Update Alma item record
+    def update_inventory_date(self, itemdata, mmsid, holdid, itemid):
+        #This should be the XML body data to send back in as a PUT (already bytes when it comes from the minimal rewrite)
+        if isinstance(itemdata, str):
+            itemdata = itemdata.encode('utf-8')
+        try:
+            with span("update"):
+                updatepush = self.client.put(f"{self.alma_base}/bibs/{mmsid}/holdings/{holdid}/items/{itemid}?generate_description=false&apikey={self.bibapi}", data=itemdata)
+        #Connection dropped between the lookup and the update, counts as a failed update
+        except (ConnectionError, Timeout):
+            return(False, None)
+
+        #Code 200 is "success", anything else is a failure and will display an error
+        if updatepush.status_code != 200:
+            updatestatus = False
+            logging.warning(f"Item {itemid} update rejected by Alma: {classify(updatepush)} (HTTP {updatepush.status_code})")
+
+        else:
+            updatestatus = True
+
+        return(updatestatus, updatepush)
+
+    #First half of a scan: lookup and parse, everything the display needs. Found items that still need their
+    #inventory date sent come back with "pendingupdate" set, pass the result to save_update to finish the scan.
+    #scandate defaults to today, replayed offline scans pass the date they were actually scanned.
+    #The result's "timings" holds how long each stage took (ms), save_update adds to the same dict
+    def lookup_barcode (self, barcode, scandate=None):
+        timings = {}
+        with collect_timings(timings):
+            result = self.lookup_item(barcode, scandate)
+        result["timings"] = timings
+        return(result)
+
+    def lookup_item (self, barcode, scandate=None):
+        scandate = scandate or today_scandate()
+
+        #Same item already updated with this date (double scan or rescan), show the earlier result without calling Alma
+        cached = self.recent.get(barcode, scandate)
+        if cached is not None:
+            logging.info(f"Barcode {barcode} scanned again. Already updated with {scandate} this session, skipped.")
+            return dict(cached, cached=True)
+
+        result = {"barcode": barcode, "scandate": scandate}
+
+        #Item is in the prefetched shelf list: everything for the display is already here, the record is only fetched when the update is sent.
+        #The export can be days old, so the rules are checked again against that record (see recheck)
+        shelfitem = self.shelf.get(barcode) if self.shelf is not None else None
+        if self.shelf is not None:
+            self.shelf.mark_scanned(barcode)
+        if shelfitem is not None:
+            result.update({"connectFail": False, "founditem": True, "fromshelf": True})
+            processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches = self.describe(shelfitem)
+            return self.found(result, None, processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches)
+
+        #Item cache from earlier sessions: known items are shown straight away (the record is fetched fresh for the update), known bad barcodes skip Alma entirely
+        cacheditem = self.items.get(barcode) if self.items is not None else None
+        if cacheditem is not None:
+            founditem, fields = cacheditem
+            result.update({"connectFail": False, "founditem": founditem, "fromcache": True})
+            if not founditem:
+                logging.error(f"Barcode {barcode} scanned. Item not found in Alma (remembered from an earlier lookup).")
+                if self.bulk is not None:
+                    self.bulk.missing(barcode, scandate)
+                return(result)
+            processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches = self.describe(fields)
+            return self.found(result, None, processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches)
+
+        #Checks Alma for barcode
+        founditem, connectFail, r = self.scan_barcode (barcode)
+        result["connectFail"] = connectFail
+        result["founditem"] = founditem
+
+        if (connectFail == True):
+            #Alma answered, but is throttling or down even after the client's retries: queued the same way, but it isn't the network
+            kind = classify(r) if r != "" else "connection"
+            if kind in RETRYABLE:
+                result["lookup"] = kind
+                logging.error(f"Barcode {barcode} scanned. Alma {'busy' if kind == 'throttled' else 'unavailable'} (HTTP {r.status_code}), scan queued.")
+            else:
+                #Logs that the item was scanned while not connected (for troubleshooting from log if needed later)
+                logging.error(f"Barcode {barcode} scanned. Connection attempt timed out.")
+            return(result)
+
+        if founditem == False:
+            #A rejected API key isn't the item's fault, so it's reported separately instead of as "not found"
+            if classify(r) == "auth_error":
+                result["lookup"] = "auth_error"
+                logging.error(f"Barcode {barcode} scanned. Alma rejected the API key (HTTP {r.status_code}).")
+            else:
+                logging.error(f"Barcode {barcode} scanned. Item not found in Alma.")
+                if self.items is not None:
+                    self.items.put_missing(barcode)
+                if self.bulk is not None:
+                    self.bulk.missing(barcode, scandate)
+            return(result)
+
+        #If found, retreives and parses item data
+        itemdata, mmsid, holdid, itemid, processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches = self.retreive_item_data (r, scandate, barcode)
+        return self.found(result, (itemdata, mmsid, holdid, itemid), processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches)
+
+    #Fills in the result for a found item. update is the (itemdata, mmsid, holdid, itemid) to send, or None if the record still has to be fetched first
+    def found (self, result, update, processtype, inprocess, title, author, location, callnumber, desc, intemp, inventorydate, matches):
+        barcode = result["barcode"]
+        scandate = result["scandate"]
+
+        #The first rule the item matched decides how it's shown and logged (to affect display and messages)
+        if matches:
+            screenpath = matches[0]["screen"]
+        else:
+            screenpath = "clearstatus"
+
+        result.update({"screenpath": screenpath, "rules": matches, "processtype": processtype, "inprocess": inprocess, "intemp": intemp, "title": title, "author": author, "location": location, "callnumber": callnumber, "desc": desc})
+        #Shelf order sort key, worked out here on the worker thread so the shelf-reading check on screen is just a binary search
+        result["shelfkey"] = call_number_key(callnumber)
+
+        #Record already has this inventory date (or a later one, for a replayed or recovered scan), nothing to send
+        if dated_on_or_after(inventorydate, scandate):
+            result.update({"updatestatus": True, "updatepush": None, "skipped": True})
+            logging.info(f"Barcode {barcode} already has inventory date {inventorydate}, update to {scandate} skipped.")
+            self.finish(result)
+        else:
+            result["pendingupdate"] = update
+        return(result)
+
+    #Second half of a scan: sends the inventory date update for a result from lookup_barcode
+    def save_update (self, result):
+        with collect_timings(result.setdefault("timings", {})):
+            return self.send_update(result)
+
+    def send_update (self, result):
+        update = result.pop("pendingupdate")
+
+        #Shown from the shelf list or the item cache, so the current record hasn't been fetched yet
+        #(and the process status/location shown may be out of date)
+        if update is None:
+            founditem, connectFail, r = self.scan_barcode (result["barcode"])
+            if not founditem:
+                result.update({"updatestatus": False, "updatepush": None})
+                logging.error(f"Barcode {result['barcode']} was shown from the shelf list or item cache but its record couldn't be fetched for the update.")
+                self.finish(result)
+                return(result)
+            itemfields = self.retreive_item_data (r, result["scandate"], result["barcode"])
+            self.recheck(result, itemfields)
+            #Record already has this inventory date (or a later one), nothing to send
+            if dated_on_or_after(itemfields[12], result["scandate"]):
+                result.update({"updatestatus": True, "updatepush": None, "skipped": True})
+                self.finish(result)
+                return(result)
+            update = itemfields[:4]
+
+        #Bulk job export mode: the item goes in a job file (or the flagged file, checked against the current record) instead of being sent
+        if self.bulk is not None:
+            result.update({"updatestatus": True, "updatepush": None, "bulk": self.bulk.add(result)})
+            self.finish(result)
+            return(result)
+
+        itemdata, mmsid, holdid, itemid = update
+
+        #Attempt to update item data in Alma via API
+        updatestatus, updatepush = self.update_inventory_date(itemdata, mmsid, holdid, itemid)
+        result.update({"updatestatus": updatestatus, "updatepush": updatepush})
+        if updatestatus and self.items is not None:
+            self.items.updated(result["barcode"], result["scandate"], itemdata)
+        self.finish(result)
+        return(result)
+
+    #Checks the rules again against the record just fetched for an item shown from the shelf list or item cache (either can be days old).
+    #If they come out differently the result is corrected and marked, so the front-end can change what it showed
+    def recheck (self, result, itemfields):
+        processtype, inprocess, location, intemp, matches = itemfields[4], itemfields[5], itemfields[8], itemfields[11], itemfields[13]
+        if matches == result["rules"]:
+            return
+        result.update({"screenpath": matches[0]["screen"] if matches else "clearstatus", "rules": matches, "processtype": processtype, "inprocess": inprocess, "intemp": intemp, "location": location, "corrected": True})
+        logging.warning(f"Barcode {result['barcode']} was shown from the shelf list or item cache, but the current record in Alma matches different rules: {', '.join(match['name'] for match in matches) or 'none'}")
+
+    #Logs a found item once its update is settled, and remembers it if it worked
+    def finish (self, result):
+        barcode = result["barcode"]
+        screenpath = result["screenpath"]
+        processtype = result["processtype"]
+        updatestatus = result["updatestatus"]
+
+        if "bulk" in result:
+            logging.info(f"Barcode {barcode} scanned. Bulk job export: {result['bulk']}")
+        elif screenpath == "withprocess":
+            logging.info(f"Barcode {barcode} scanned. Had process status {processtype}. Updated?: {updatestatus}")
+        elif screenpath == "withtemp":
+            logging.info(f"Barcode {barcode} scanned. Item currently has a temporary location. Updated?: {updatestatus}")
+        elif screenpath == "withrule":
+            logging.info(f"Barcode {barcode} scanned. Flagged by rule {result['rules'][0]['name']}. Updated?: {updatestatus}")
+        elif screenpath == "clearstatus":
+            logging.info(f"Barcode {barcode} scanned. Updated?: {updatestatus}")
+
+        #Only successful updates are remembered (without the response object), anything else should be tried again on a rescan
+        if updatestatus:
+            self.recent.put(barcode, dict(result, updatepush=None))
+
+    #Both halves of a scan. on_lookup is called with the lookup result (without the pending update) before the update is sent,
+    #so a front-end can show the item straight away. It shares the result's timings dict
+    def run_scan (self, barcode, scandate=None, on_lookup=None):
+        result = self.lookup_barcode(barcode, scandate)
+        if "pendingupdate" in result:
+            if on_lookup is not None:
+                lookup = dict(result)
+                del lookup["pendingupdate"]
+                on_lookup(lookup)
+            self.save_update(result)
+        return(result)
+
+    #Raises ConnectionError/Timeout if Alma can't be reached (used while offline to know when to send the queue)
+    def check_connection (self):
+        self.client.get(f"{self.alma_base}/bibs/test?apikey={self.bibapi}")
+
+    #Runs the full lookup/parse/update for one barcode and returns a result dict (safe to call from any thread)
+    def process_barcode (self, barcode, scandate=None):
+        start = time.perf_counter()
+        result = self.run_scan(barcode, scandate)
+        self.metrics.record(result, (time.perf_counter() - start) * 1000)
+        return(result)
@@ -0,0 +1,118 @@
+import csv
+import threading
+
+from inventory_core.call_numbers import call_number_key
+
+
+#Column names Alma uses in physical item exports/reports for each field (lower case), first one found wins
+COLUMN_ALIASES = {
+    "barcode": ["barcode", "item barcode"],
+    "title": ["title"],
+    "author": ["author"],
+    "call_number": ["permanent call number", "call number", "item call number"],
+    "location": ["permanent location", "location", "location name"],
+    "location_code": ["location code", "permanent physical location code", "permanent location code"],
+    "temp_location": ["temporary location", "temp location", "temporary physical location"],
+    "temp_location_code": ["temporary location code", "temporary physical location code"],
+    "library": ["permanent library", "library", "library name"],
+    "library_code": ["library code", "permanent library code"],
+    "process_type": ["process type", "process type code"],
+    "description": ["description"],
+    "inventory_date": ["inventory date"],
+}
+
+
+#Expected items for a shelf/location, loaded up front from an exported Alma item file and indexed by barcode.
+#Scans are checked against it locally, and at the end of the session reconcile() sorts out what was and wasn't where it should be
+class ShelfList:
+    def __init__(self, location=None, call_number_from=None, call_number_to=None, processlabel=None):
+        #Location (code or name) being inventoried, and the optional call number range within it
+        self.location = location.lower() if location else None
+        self.call_number_from = call_number_from
+        self.call_number_to = call_number_to
+        #Range ends as sort keys, so the range follows shelf order (QA9 comes before QA76) rather than text order
+        self.key_from = call_number_key(call_number_from) if call_number_from is not None else None
+        self.key_to = call_number_key(call_number_to) if call_number_to is not None else None
+        #Reports can carry process type labels instead of codes, this maps them back
+        self.processcodes = {label.lower(): code for code, label in (processlabel or {}).items()}
+        self.items = {}
+        self.expected = set()
+        self.scanned = set()
+        self.lock = threading.Lock()
+
+    #Reads an Alma item export (CSV, as saved from a physical items search or an Analytics report). Returns the number of items loaded
+    def load(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as export:
+            rows = csv.reader(export)
+            header = [name.strip().lower() for name in next(rows)]
+            columns = {}
+            for field, aliases in COLUMN_ALIASES.items():
+                for alias in aliases:
+                    if alias in header:
+                        columns[field] = header.index(alias)
+                        break
+            if "barcode" not in columns:
+                raise ValueError(f"No barcode column in {path}")
+
+            count = 0
+            for row in rows:
+                entry = {field: row[index].strip() if index < len(row) else "" for field, index in columns.items()}
+                if entry["barcode"]:
+                    self.add(entry)
+                    count += 1
+        return count
+
+    #Adds one item (dict of the COLUMN_ALIASES fields) to the index, and to the expected set if it belongs on this shelf
+    def add(self, entry):
+        entry.setdefault("temp_location", "")
+        entry["in_temp_location"] = "true" if entry["temp_location"] else "false"
+        process = entry.get("process_type", "")
+        entry["process_type"] = self.processcodes.get(process.lower(), process) or None
+        self.items[entry["barcode"]] = entry
+        if self.belongs_here(entry):
+            self.expected.add(entry["barcode"])
+
+    #True if the item's permanent location (and call number, if a range is set) is the one being inventoried
+    def belongs_here(self, entry):
+        if self.location is not None and self.location not in (entry.get("location", "").lower(), entry.get("location_code", "").lower()):
+            return False
+        key = call_number_key(entry.get("call_number", ""))
+        if self.key_from is not None and key < self.key_from:
+            return False
+        if self.key_to is not None and key > self.key_to:
+            return False
+        return True
+
+    #Indexed item for a barcode, or None if it isn't in the loaded file
+    def get(self, barcode):
+        return self.items.get(barcode)
+
+    def mark_scanned(self, barcode):
+        with self.lock:
+            self.scanned.add(barcode)
+
+    #Set arithmetic over the index, no API calls:
+    #  missing     expected here but never scanned
+    #  unexpected  scanned but not in the loaded file at all
+    #  wrong_location  scanned and in the file, but it belongs somewhere else
+    def reconcile(self):
+        with self.lock:
+            scanned = set(self.scanned)
+        known = self.items.keys()
+        return {
+            "missing": sorted(self.expected - scanned),
+            "unexpected": sorted(scanned - known),
+            "wrong_location": sorted((scanned & known) - self.expected),
+        }
+
+    #Writes the reconciliation as one CSV (category, barcode and what the index knows about the item). Returns the category counts
+    def write_report(self, path):
+        report = self.reconcile()
+        with open(path, "w", newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(["category", "barcode", "title", "call_number", "location", "temp_location"])
+            for category, barcodes in report.items():
+                for barcode in barcodes:
+                    entry = self.items.get(barcode, {})
+                    writer.writerow([category, barcode, entry.get("title", ""), entry.get("call_number", ""), entry.get("location") or entry.get("location_code", ""), entry.get("temp_location", "")])
+        return {category: len(barcodes) for category, barcodes in report.items()}
@@ -0,0 +1,167 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from inventory_core.log_setup import SCAN_LOGGER
+from inventory_core.scan_journal import outcome_of
+
+
+#Timings for whatever scan the current thread is working on (a dict of stage name -> milliseconds), None when nothing is being timed
+_current = threading.local()
+
+#Outcomes counted as errors for the error rate (Alma or the program let the scan down, rather than the item)
+ERROR_OUTCOMES = frozenset(("error", "queued", "auth_error", "update_failed"))
+
+#Histogram bucket upper edges in milliseconds, the last bucket catches everything slower
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+#Collects every span timed on this thread into timings until the block ends
+@contextmanager
+def collect_timings(timings):
+    _current.timings = timings
+    try:
+        yield timings
+    finally:
+        _current.timings = None
+
+
+#Times one stage of a scan (lookup, parse, update, throttle...). Time for the same stage adds up, e.g. a GET that had to be retried.
+#Does nothing when the thread isn't collecting
+@contextmanager
+def span(name):
+    timings = getattr(_current, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + (time.perf_counter() - start) * 1000
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+#Per-scan timing records: logged as structured scan records (JSON lines in the structured log file, see log_setup) and kept
+#for the last window scans as rolling per-stage samples, so the GUI panel and the log can show throughput, latency and error rate
+class ScanMetrics:
+    def __init__(self, window=1000):
+        self.window = window
+        #(finished at, total ms, outcome) per scan, and the recent samples for each stage
+        self.scans = deque(maxlen=window)
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.log = logging.getLogger(SCAN_LOGGER)
+
+    #Records a finished scan result (with the "timings" lookup_barcode/save_update collected). total is the whole scan as the user saw it, in ms
+    def record(self, result, total=None):
+        timings = result.get("timings", {})
+        outcome = outcome_of(result)
+        line = {"time": datetime.now().isoformat(timespec='milliseconds'), "barcode": result["barcode"], "outcome": outcome, "processtype": result.get("processtype") or None, "temp": bool(result.get("intemp")), "total_ms": round(total, 2) if total is not None else None, "spans": {name: round(ms, 2) for name, ms in timings.items()}}
+        with self.lock:
+            self.scans.append((time.monotonic(), total, outcome))
+            for name, ms in timings.items():
+                self.stages.setdefault(name, deque(maxlen=self.window)).append(ms)
+        #Only queued here, the logging thread writes it
+        self.log.info(f"Scan record {result['barcode']}", extra={"scan": line})
+
+    #Scans counted per histogram bucket for one stage ("total" for the whole scan), over the rolling window
+    def histogram(self, stage):
+        with self.lock:
+            samples = [scan[1] for scan in self.scans if scan[1] is not None] if stage == "total" else list(self.stages.get(stage, ()))
+        counts = [0] * (len(BUCKETS) + 1)
+        for ms in samples:
+            counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        return counts
+
+    #Items per hour, median/p95 total latency, error rate and median/p95 for each stage, over the rolling window. None before the first scan
+    def summary(self):
+        with self.lock:
+            scans = list(self.scans)
+            stages = {name: list(samples) for name, samples in self.stages.items()}
+        if not scans:
+            return None
+        totals = [scan[1] for scan in scans if scan[1] is not None]
+        elapsed = scans[-1][0] - scans[0][0]
+        return {
+            "scans": len(scans),
+            "items_per_hour": (len(scans) - 1) / elapsed * 3600 if elapsed > 0 else None,
+            "median": percentile(totals, 0.5),
+            "p95": percentile(totals, 0.95),
+            "error_rate": sum(1 for scan in scans if scan[2] in ERROR_OUTCOMES) / len(scans),
+            "stages": {name: (percentile(samples, 0.5), percentile(samples, 0.95)) for name, samples in stages.items()},
+        }
+
+
+#Opt-in capture for diagnosing a slow station: cProfile of every scan handled by the worker threads (one profiler per thread,
+#merged when dumped) and/or tracemalloc snapshots of where memory is being allocated.
+#The profiling modules are only imported when it's switched on, so they don't add to every start up
+class ProfileCapture:
+    def __init__(self, profile_file="scan_profile.prof", profile=True, trace_memory=False):
+        self.profile_file = profile_file
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profilers = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    #Runs handler(*args) under this thread's profiler
+    def run(self, handler, *args):
+        if not self.profile:
+            return handler(*args)
+        profiler = getattr(self.local, "profiler", None)
+        if profiler is None:
+            import cProfile
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers.append(profiler)
+        profiler.enable()
+        try:
+            return handler(*args)
+        finally:
+            profiler.disable()
+
+    #Writes the merged profile (open with pstats or snakeviz) and the top memory allocations next to it
+    def dump(self):
+        with self.lock:
+            profilers = [profiler for profiler in self.profilers if profiler.getstats()]
+        if profilers:
+            import pstats
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(self.profile_file)
+            logging.info(f"Scan profile written to {self.profile_file}")
+        if self.trace_memory:
+            import tracemalloc
+            top = tracemalloc.take_snapshot().statistics("lineno")[:25]
+            with open(f"{self.profile_file}.memory.txt", "w", encoding='utf-8') as memory_file:
+                memory_file.write("\n".join(str(stat) for stat in top) + "\n")
+            logging.info(f"Top memory allocations written to {self.profile_file}.memory.txt")
+
+
+#Optional "telemetry" block in settings.json: window for ScanMetrics, and profile/trace_memory/profile_file for ProfileCapture
+def metrics_from_settings(settings):
+    telemetry = settings.get('telemetry', {})
+    return ScanMetrics(telemetry.get('window', 1000))
+
+
+#ProfileCapture if profiling or memory tracing is switched on, otherwise None
+def profile_from_settings(settings):
+    telemetry = settings.get('telemetry', {})
+    if not (telemetry.get('profile') or telemetry.get('trace_memory')):
+        return None
+    return ProfileCapture(telemetry.get('profile_file', "scan_profile.prof"), telemetry.get('profile', False), telemetry.get('trace_memory', False))
@@ -0,0 +1,79 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import threading
+
+from inventory_batch import RESULT_COLUMNS, result_row
+from inventory_core.log_report import log_files
+from inventory_core.log_setup import logging_from_settings
+from inventory_core.rate_limit import TokenBucket
+from inventory_core.recovery import FailedScans, redrive
+from inventory_core.scan_journal import ScanJournal
+from inventory_core.scanning import Scanner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find scans whose update failed or never reached Alma (in the log and the scan journal) and send them again with their original scan dates. Run it while the scanning program is closed.")
+    parser.add_argument("logs", nargs="*", help="log files to read (default: inventory_update.log and its rotated segments)")
+    parser.add_argument("--no-log", action="store_true", help="only use the scan journal")
+    parser.add_argument("--no-journal", action="store_true", help="only use the log")
+    parser.add_argument("-o", "--output", default="recovery_results.csv", help="results CSV (default: recovery_results.csv)")
+    parser.add_argument("-w", "--workers", type=int, help="parallel requests (default: replay workers in settings.json)")
+    parser.add_argument("--per-second", type=float, help="items per second (default: replay per_second in settings.json)")
+    parser.add_argument("--list", action="store_true", help="only write the barcodes that would be sent, don't send anything")
+    parser.add_argument("--settings", default="settings.json", help="settings file (default: settings.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.settings) as config_file:
+        settings = json.load(config_file)
+    logging_from_settings(settings)
+    replay_settings = settings.get('replay', {})
+    workers = args.workers or replay_settings.get('workers', 4)
+
+    scans = FailedScans()
+    journal = None
+    if not args.no_journal:
+        journal = ScanJournal(settings.get('journal_file', "scan_journal.db"))
+        scans.add_journal(journal)
+    if not args.no_log:
+        for path in args.logs or log_files(settings.get('logging', {}).get('file', "inventory_update.log")):
+            try:
+                scans.add_log(path)
+            except FileNotFoundError:
+                print(f"Skipping {path}: not found", file=sys.stderr)
+    failed = scans.failed()
+    print(f"{len(failed)} barcodes still need their inventory date", file=sys.stderr)
+
+    with open(args.output, "w", newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=["scandate", "source"] + RESULT_COLUMNS)
+        writer.writeheader()
+
+        if args.list:
+            for barcode, scandate, scanids, source in failed:
+                writer.writerow({"barcode": barcode, "scandate": scandate, "source": source})
+            print(f"Listed in {args.output}", file=sys.stderr)
+            return
+
+        write_lock = threading.Lock()
+
+        def write_result(scan, result):
+            with write_lock:
+                writer.writerow(dict(result_row(result), scandate=scan[1], source=scan[3]))
+                out.flush()
+
+        settings.setdefault('http', {})['pool_size'] = max(workers, settings['http'].get('pool_size', 10))
+        scanner = Scanner(settings)
+        limiter = TokenBucket(args.per_second or replay_settings.get('per_second', 5))
+        counts = redrive(failed, scanner.process_barcode, workers, limiter, journal, write_result)
+
+    if journal is not None:
+        journal.close()
+    recovered = counts.get("updated", 0) + counts.get("exported", 0)
+    logging.info(f"Recovery run finished: {counts}")
+    print(f"Recovered {recovered} of {len(failed)}, {len(failed) - recovered} still need attention {counts}. Details in {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import sys
+import time
+
+from inventory_core.log_report import ReportIndex, log_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the scan log: counts per day and outcome, and the latest outcome for every barcode.")
+    parser.add_argument("logs", nargs="*", help="log files to read (default: inventory_update.log and its rotated segments). Use the structured .jsonl file or the text log, not both")
+    parser.add_argument("-o", "--output", default="reports", help="folder for daily_summary.csv and latest_outcomes.csv (default: reports)")
+    parser.add_argument("--index", default="report_index.db", help="index file kept between runs so only new lines are read (default: report_index.db)")
+    parser.add_argument("--only", help="comma separated outcomes for latest_outcomes.csv, e.g. not_found,update_failed,process_status")
+    args = parser.parse_args(argv)
+
+    paths = args.logs or log_files("inventory_update.log")
+    index = ReportIndex(args.index)
+    start = time.monotonic()
+    scans = 0
+    for path in paths:
+        try:
+            scans += index.update(path)
+        except FileNotFoundError:
+            print(f"Skipping {path}: not found", file=sys.stderr)
+    outcomes = args.only.split(",") if args.only else None
+    summary_path, latest_path = index.write_reports(args.output, outcomes)
+    index.close()
+
+    print(f"{scans} new scan lines indexed in {time.monotonic() - start:.1f}s. Reports: {summary_path}, {latest_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
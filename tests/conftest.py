@@ -0,0 +1,25 @@
+import pytest
+
+from benchmarks.mock_alma import start_mock_server
+
+
+#Settings for a Scanner pointed at the mock Alma server: no item cache, code tables, shelf list or bulk export unless a test adds them
+SETTINGS = {
+    "bibapi": "test",
+    "headers": {"Accept": "application/xml", "Content-Type": "application/xml"},
+    "statuslist": ["LOAN", "MISSING"],
+    "processlabel": {"LOAN": "On Loan", "MISSING": "Missing"},
+}
+
+
+#One mock server for the whole run. It remembers the inventory date sent for each barcode, so every test uses barcodes of its own
+@pytest.fixture(scope="session")
+def mock_alma():
+    server, base = start_mock_server()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def scanner_settings(mock_alma):
+    return dict(SETTINGS, alma_base=f"http://127.0.0.1:{mock_alma.server_address[1]}/almaws/v1")
@@ -0,0 +1,59 @@
+import csv
+
+from inventory_core.bulk_export import BulkJobWriter, bulk_export_from_settings
+from inventory_core.scanning import Scanner
+from inventory_core.shelf_list import ShelfList
+
+
+def found(barcode, scandate="2024-05-01Z", rules=()):
+    return {"barcode": barcode, "scandate": scandate, "rules": list(rules), "title": "A title", "callnumber": "QA1", "location": "Main Stacks"}
+
+
+def rows(directory, filename):
+    with open(directory / filename, newline='', encoding='utf-8') as job:
+        return list(csv.reader(job))
+
+
+def test_job_files_are_split_into_chunks(tmp_path):
+    writer = BulkJobWriter(str(tmp_path), chunk_size=2, name="session")
+    assert [writer.add(found(f"B{n}")) for n in range(5)] == ["exported"] * 5
+    writer.close()
+    assert rows(tmp_path, "session_2024-05-01_part1.csv") == [["Barcode"], ["B0"], ["B1"]]
+    assert rows(tmp_path, "session_2024-05-01_part2.csv") == [["Barcode"], ["B2"], ["B3"]]
+    assert rows(tmp_path, "session_2024-05-01_part3.csv") == [["Barcode"], ["B4"]]
+
+
+def test_each_inventory_date_gets_its_own_files(tmp_path):
+    writer = BulkJobWriter(str(tmp_path), name="session")
+    writer.add(found("B1", "2024-04-30Z"))
+    writer.add(found("B2", "2024-05-01Z"))
+    writer.close()
+    assert rows(tmp_path, "session_2024-04-30_part1.csv") == [["Barcode"], ["B1"]]
+    assert rows(tmp_path, "session_2024-05-01_part1.csv") == [["Barcode"], ["B2"]]
+
+
+def test_flagged_duplicate_and_missing_items(tmp_path):
+    writer = BulkJobWriter(str(tmp_path), name="session")
+    rule = {"name": "process_status", "screen": "withprocess", "colour": "warning", "message": "", "value": "On Loan"}
+    assert writer.add(found("B1", rules=[rule])) == "flagged"
+    assert writer.add(found("B2")) == "exported"
+    assert writer.add(found("B2")) == "duplicate"
+    writer.missing("NF1", "2024-05-01Z")
+    assert writer.close() == {"exported": 1, "flagged": 1, "not_found": 1, "duplicate": 1}
+    assert rows(tmp_path, "session_flagged.csv")[1][:3] == ["B1", "2024-05-01Z", "Process status: On Loan"]
+    assert rows(tmp_path, "session_not_found.csv")[1] == ["NF1", "2024-05-01Z"]
+
+
+def test_bulk_export_is_off_unless_enabled(tmp_path):
+    assert bulk_export_from_settings({}) is None
+    assert bulk_export_from_settings({"bulk_export": {"enabled": False, "directory": str(tmp_path)}}) is None
+
+
+def test_stale_shelf_list_row_is_flagged_from_the_current_record(tmp_path, scanner_settings):
+    scanner = Scanner(dict(scanner_settings, bulk_export={"enabled": True, "directory": str(tmp_path)}))
+    scanner.shelf = ShelfList()
+    scanner.shelf.add({"barcode": "PROC-LOAN-15001", "title": "Listed title", "author": "", "call_number": "QA1", "location": "Main Stacks", "process_type": ""})
+    result = scanner.run_scan("PROC-LOAN-15001")
+    scanner.bulk.close()
+    assert result["corrected"]
+    assert result["bulk"] == "flagged"
@@ -0,0 +1,77 @@
+from inventory_core.call_numbers import ShelfOrder, call_number_key, shelf_order_from_settings
+
+
+def shelved(callnumbers):
+    return sorted(callnumbers, key=call_number_key)
+
+
+def test_lc_call_numbers_sort_in_shelf_order():
+    expected = ["Q180.A1 B2", "QA9 .Z1", "QA76 .C3", "QA76.5 .B2", "QA76.55 .A1", "QA76.73.P98 T47 2019", "QA76.73.P98 T47 2020", "QB1 .A2"]
+    assert shelved(reversed(expected)) == expected
+
+
+def test_cutters_sort_as_decimals_and_volumes_as_numbers():
+    assert shelved(["QA1 .B3", "QA1 .B15", "QA1 .B2"]) == ["QA1 .B15", "QA1 .B2", "QA1 .B3"]
+    assert shelved(["QA1 .B2 v.10", "QA1 .B2 v.2"]) == ["QA1 .B2 v.2", "QA1 .B2 v.10"]
+
+
+def test_dewey_call_numbers_sort_in_shelf_order():
+    expected = ["005.133 P98", "823 D27", "823.914 D27s", "823.92 A1"]
+    assert shelved(reversed(expected)) == expected
+
+
+def test_keys_are_case_and_space_insensitive():
+    assert call_number_key("qa76.73.p98  t47") == call_number_key("QA76.73.P98 T47")
+    assert call_number_key("") == ""
+    assert call_number_key(None) == ""
+
+
+def check_all(order, callnumbers):
+    return [order.check(callnumber, callnumber) for callnumber in callnumbers]
+
+
+def test_items_in_order_are_ok():
+    order = ShelfOrder()
+    assert [verdict for verdict, entry in check_all(order, ["QA1", "QA2", "QA3", "QA3 .B2"])] == ["ok"] * 4
+
+
+def test_item_that_belongs_further_back_is_misshelved():
+    order = ShelfOrder()
+    check_all(order, ["QA1", "QA2", "QA3"])
+    verdict, entry = order.check("QA1.5", "QA1.5")
+    assert verdict == "misshelved"
+    assert entry[3] == "QA2"
+    #It isn't kept, so the next item in order is still fine
+    assert order.check("QA4", "QA4") == ("ok", None)
+
+
+def test_previous_item_out_of_order_is_blamed():
+    order = ShelfOrder()
+    check_all(order, ["QA2", "QA9 .Z1"])
+    verdict, entry = order.check("QA4", "QA4")
+    assert verdict == "previous"
+    assert entry[3] == "QA9 .Z1"
+
+
+def test_run_of_items_out_of_place_starts_a_new_section():
+    order = ShelfOrder(restart_after=3)
+    check_all(order, ["QA1", "QA2", "QA3", "QA4"])
+    verdicts = [verdict for verdict, entry in check_all(order, ["PR1", "PR2", "PR3", "PR4"])]
+    assert verdicts == ["misshelved", "misshelved", "ok", "ok"]
+
+
+def test_change_of_scheme_starts_again():
+    order = ShelfOrder()
+    check_all(order, ["QA5", "QA6"])
+    assert order.check("823.914 D27s", "823.914 D27s") == ("ok", None)
+
+
+def test_item_without_call_number_is_unknown():
+    assert ShelfOrder().check("1", "") == ("unknown", None)
+
+
+def test_shelf_order_is_off_unless_enabled():
+    assert shelf_order_from_settings({}) is None
+    assert shelf_order_from_settings({"shelf_order": {"enabled": False, "window": 10}}) is None
+    order = shelf_order_from_settings({"shelf_order": {"enabled": True, "window": 5, "restart_after": 2}})
+    assert (order.window, order.restart_after) == (5, 2)
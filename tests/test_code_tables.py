@@ -0,0 +1,100 @@
+import threading
+
+from benchmarks.mock_alma import MOCK_PROCESS_TYPES
+from inventory_core.code_tables import CodeTableCache, CodeTables, CodeTablesRefused, load_code_tables, save_code_tables
+from inventory_core.rules import rules_from_settings
+from inventory_core.scanning import Scanner
+
+
+def tables(process_types=None):
+    return CodeTables(process_types or {"LOAN": "On loan from Alma"}, {"MAIN": "Main Library"}, {"MAIN": {"STACKS": "Main Stacks"}})
+
+
+#Fetch function that hands out the given answers in turn (raising any exceptions), counting its calls
+def scripted_fetch(*answers):
+    answers = list(answers)
+
+    def fetch():
+        fetch.calls += 1
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    fetch.calls = 0
+    return fetch
+
+
+def test_fetched_from_the_conf_api_and_saved(tmp_path, scanner_settings):
+    path = tmp_path / "code_tables.json"
+    scanner = Scanner(dict(scanner_settings, code_tables={"file": str(path), "refresh": False}))
+    assert scanner.codes.tables is None
+    assert scanner.codes.refresh()
+    assert scanner.codes.tables.process_types == MOCK_PROCESS_TYPES
+    assert scanner.codes.tables.location_name("MAIN", "RESERVES") == "Course Reserves"
+    assert load_code_tables(str(path)).stamp == scanner.codes.tables.stamp
+
+
+def test_refresh_reports_only_real_changes(tmp_path):
+    cache = CodeTableCache(str(tmp_path / "code_tables.json"), scripted_fetch(tables(), tables(), tables({"LOAN": "Out"})))
+    assert cache.refresh()
+    assert not cache.refresh()
+    assert cache.refresh()
+    assert cache.tables.process_types == {"LOAN": "Out"}
+
+
+def test_unreadable_or_old_files_are_ignored(tmp_path):
+    path = tmp_path / "code_tables.json"
+    save_code_tables(tables(), str(path))
+    assert load_code_tables(str(path)).process_types == {"LOAN": "On loan from Alma"}
+    path.write_text('{"format": 0}')
+    assert load_code_tables(str(path)) is None
+    path.write_text("{")
+    assert load_code_tables(str(path)) is None
+    assert load_code_tables(str(tmp_path / "missing.json")) is None
+
+
+def test_failed_refreshes_back_off_up_to_the_ttl(tmp_path):
+    cache = CodeTableCache(str(tmp_path / "code_tables.json"), scripted_fetch(*[RuntimeError("HTTP 503")] * 4, tables()), ttl_seconds=3600)
+    waits = []
+    for _ in range(4):
+        assert not cache.refresh()
+        waits.append(cache.retry_in())
+    assert waits == [600, 1200, 2400, 3600]
+    #A success starts the backoff over
+    assert cache.refresh()
+    assert cache.failures == 0
+
+
+def test_refused_key_stops_the_background_refresh(tmp_path):
+    fetch = scripted_fetch(CodeTablesRefused("HTTP 401"), tables())
+    #Held until the thread has been found, so it can't finish first
+    go = threading.Event()
+    cache = CodeTableCache(str(tmp_path / "code_tables.json"), lambda: go.wait() and fetch())
+    cache.start(lambda tables: None)
+    [thread] = [thread for thread in threading.enumerate() if thread.name == "code-tables"]
+    go.set()
+    thread.join(1)
+    assert not thread.is_alive()
+    assert cache.refused
+    assert fetch.calls == 1
+
+
+def test_rules_use_alma_labels():
+    settings = {"statuslist": ["LOAN"], "processlabel": {"LOAN": "On Loan"}}
+    fields = {"process_type": "LOAN", "in_temp_location": "false"}
+    [match] = rules_from_settings(settings, tables()).evaluate(fields)
+    assert match["value"] == "On loan from Alma"
+    #Every process type Alma has is flagged when flag_all_process_types is set
+    technical = {"process_type": "TECHNICAL", "in_temp_location": "false"}
+    alma = tables({"LOAN": "On loan", "TECHNICAL": "Technical"})
+    assert rules_from_settings(settings, alma).evaluate(technical) == []
+    [match] = rules_from_settings(dict(settings, code_tables={"flag_all_process_types": True}), alma).evaluate(technical)
+    assert match["value"] == "Technical"
+
+
+def test_missing_names_are_filled_from_codes():
+    filled = tables().fill_names({"library_code": "MAIN", "location_code": "STACKS", "location": None})
+    assert (filled["library"], filled["location"]) == ("Main Library", "Main Stacks")
+    fields = {"library": "Main Library", "location": "Main Stacks"}
+    assert tables().fill_names(fields) is fields
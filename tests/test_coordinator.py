@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from inventory_core.coordinator import CoordinatorClient, RemoteScanner, start_coordinator
+from inventory_core.scanning import Scanner
+from inventory_core.telemetry import ScanMetrics
+
+
+@pytest.fixture
+def coordinator(scanner_settings):
+    #Rate limit high enough that it's the server being tested, not the limiter
+    settings = dict(scanner_settings, http={"pool_size": 64}, rate_limit={"per_second": 1000, "log_every": 0})
+    server, url = start_coordinator(Scanner(settings), "127.0.0.1", 0, token="secret")
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+def station(url, name, token="secret"):
+    return RemoteScanner(CoordinatorClient(url, name, token), ScanMetrics())
+
+
+#Every station's scans in flight connect at the same moment (each scan on a connection of its own)
+def scan_all_at_once(url, barcodes):
+    results = {}
+    ready = threading.Barrier(len(barcodes))
+
+    def scan(barcode):
+        remote = station(url, f"station-{barcode}")
+        ready.wait()
+        results[barcode] = remote.run_scan(barcode, "2024-05-01Z")
+        remote.client.close()
+
+    threads = [threading.Thread(target=scan, args=(barcode,)) for barcode in barcodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_scans_come_back_in_two_phases(coordinator):
+    server, url = coordinator
+    lookups = []
+    result = station(url, "desk").run_scan("39000000021001", "2024-05-01Z", on_lookup=lookups.append)
+    assert lookups[0]["title"] == result["title"]
+    assert result["updatestatus"] and not result["connectFail"]
+
+
+def test_many_stations_at_once_are_all_accepted(coordinator):
+    server, url = coordinator
+    #8 stations with 8 scans in flight each, well past ThreadingHTTPServer's usual backlog of 5
+    barcodes = [f"3900000002{n:04d}" for n in range(64)]
+    results = scan_all_at_once(url, barcodes)
+    assert [barcode for barcode, result in results.items() if result["connectFail"]] == []
+    assert all(result["updatestatus"] for result in results.values())
+    assert sum(server.coordinator.stats()["stations"].values()) == 64
+
+
+def test_same_barcode_from_two_stations_is_scanned_once(coordinator, mock_alma):
+    server, url = coordinator
+    mock_alma.latency = 0.2
+    try:
+        results = list(scan_all_at_once(url, ["39000000021002"]).values())
+        #Second station joins the first one's scan while its lookup is still on the way
+        remotes = [station(url, "desk"), station(url, "cart")]
+        shared = []
+        threads = [threading.Thread(target=lambda remote=remote: shared.append(remote.run_scan("39000000021003", "2024-05-01Z"))) for remote in remotes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        mock_alma.latency = 0
+    assert results[0]["updatestatus"]
+    assert server.coordinator.stats()["shared"] == 1
+    assert sorted(bool(result.get("cached")) for result in shared) == [False, True]
+
+
+def test_wrong_token_is_refused(coordinator):
+    server, url = coordinator
+    result = station(url, "desk", token="wrong").run_scan("39000000021004", "2024-05-01Z")
+    assert result["lookup"] == "auth_error"
+    assert not result["connectFail"]
+
+
+def test_coordinator_down_is_a_connection_failure(scanner_settings):
+    server, url = start_coordinator(Scanner(scanner_settings), "127.0.0.1", 0)
+    server.shutdown()
+    server.server_close()
+    assert station(url, "desk").run_scan("39000000021005", "2024-05-01Z")["connectFail"]
+
+
+def test_listening_beyond_this_computer_needs_a_token(scanner_settings):
+    with pytest.raises(ValueError):
+        start_coordinator(Scanner(scanner_settings), "0.0.0.0", 0)
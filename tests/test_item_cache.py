@@ -0,0 +1,96 @@
+import pytest
+
+from benchmarks.mock_alma import item_record
+from inventory_core.item_cache import ItemCache
+from inventory_core.scanning import Scanner
+
+
+#Clock the cache reads instead of the real time, moved on by the tests
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("inventory_core.item_cache.time.time", clock)
+    return clock
+
+
+def cache_in(tmp_path, **limits):
+    return ItemCache(str(tmp_path / "item_cache.db"), **limits)
+
+
+def test_found_items_and_unknown_barcodes_have_their_own_time_limits(tmp_path, clock):
+    cache = cache_in(tmp_path, found_ttl_seconds=100, not_found_ttl_seconds=10)
+    cache.put_record("C1", item_record("C1").encode("utf-8"))
+    cache.put_missing("C2")
+    assert cache.get("C1")[0] is True
+    assert cache.get("C2") == (False, None)
+
+    clock.now += 11
+    assert cache.get("C2") is None
+    assert cache.get("C1")[0] is True
+
+    clock.now += 90
+    assert cache.get("C1") is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_record_and_fields_are_kept(tmp_path):
+    cache = cache_in(tmp_path)
+    content = item_record("PROC-LOAN-14001").encode("utf-8")
+    cache.put_record("PROC-LOAN-14001", content)
+    found, fields = cache.get("PROC-LOAN-14001")
+    assert fields["process_type"] == "LOAN"
+    assert fields["inventory_date"] is None
+    assert cache.record("PROC-LOAN-14001") == content
+    cache.close()
+
+
+def test_update_shows_the_new_inventory_date(tmp_path):
+    cache = cache_in(tmp_path)
+    cache.put_record("C3", item_record("C3").encode("utf-8"))
+    sent = item_record("C3", "2024-05-01Z").encode("utf-8")
+    cache.updated("C3", "2024-05-01Z", sent)
+    assert cache.get("C3")[1]["inventory_date"] == "2024-05-01Z"
+    assert cache.record("C3") == sent
+    #Nothing to update for a barcode that isn't cached, or that Alma doesn't know
+    cache.put_missing("C4")
+    cache.updated("C4", "2024-05-01Z", sent)
+    cache.updated("C5", "2024-05-01Z", sent)
+    assert cache.get("C4") == (False, None)
+    assert cache.get("C5") is None
+    cache.close()
+
+
+def test_oldest_entries_go_over_max_items(tmp_path, clock):
+    cache = cache_in(tmp_path, max_items=50)
+    for n in range(100):
+        clock.now += 1
+        cache.put_missing(f"C{n:03d}")
+    #Trimmed on the 100th write
+    assert len(cache) == 50
+    assert cache.get("C049") is None
+    assert cache.get("C050") == (False, None)
+    cache.close()
+
+
+def test_rescan_in_a_new_session_shows_the_date_from_the_last_update(tmp_path, scanner_settings):
+    settings = dict(scanner_settings, item_cache={"file": str(tmp_path / "item_cache.db")})
+    first = Scanner(settings)
+    assert first.run_scan("39000000014001", "2024-05-01Z")["updatestatus"]
+    assert first.items.get("39000000014001")[1]["inventory_date"] == "2024-05-01Z"
+    first.items.close()
+
+    second = Scanner(settings)
+    lookups = []
+    second.run_scan("39000000014001", "2024-05-02Z", on_lookup=lookups.append)
+    assert lookups[0]["fromcache"]
+    assert second.items.get("39000000014001")[1]["inventory_date"] == "2024-05-02Z"
+    second.items.close()
@@ -0,0 +1,71 @@
+import pytest
+
+from benchmarks.mock_alma import item_record
+from inventory_core.item_parser import parse_item, parse_item_fast, parse_item_soup, splice_inventory_date
+
+
+SCANDATE = "2024-05-01Z"
+
+
+def record(barcode="39000001234567", inventory_date=None):
+    return item_record(barcode, inventory_date).encode("utf-8")
+
+
+@pytest.mark.parametrize("barcode", ["39000001234567", "PROC-LOAN-1", "TEMP1"])
+def test_fast_and_soup_parsers_agree(barcode):
+    content = record(barcode)
+    fast = parse_item_fast(content, SCANDATE)
+    soup = parse_item_soup(content, SCANDATE)
+    assert {k: v for k, v in fast.items() if k != "itemdata"} == {k: v for k, v in soup.items() if k != "itemdata"}
+    assert SCANDATE in fast["itemdata"]
+    assert SCANDATE in soup["itemdata"]
+
+
+def test_fields_read_from_the_record():
+    fields = parse_item(record("PROC-LOAN-1"), SCANDATE)
+    assert fields["process_type"] == "LOAN"
+    assert fields["call_number"] == "QA76.73.P98 T47 2020"
+    assert (fields["location"], fields["location_code"]) == ("Main Stacks", "STACKS")
+    assert (fields["library"], fields["library_code"]) == ("Main Library", "MAIN")
+    assert fields["inventory_date"] is None
+
+
+def test_records_the_fast_parser_rejects_fall_back_to_soup():
+    content = record().replace(b"The mock record", b"Fish & chips")
+    fields = parse_item(content, SCANDATE)
+    assert fields["pid"] is not None
+    assert SCANDATE in fields["itemdata"]
+
+
+
+def test_splice_replaces_the_existing_date_only():
+    content = record(inventory_date="2020-01-01Z")
+    spliced = splice_inventory_date(content, SCANDATE)
+    assert spliced == content.replace(b"2020-01-01Z", SCANDATE.encode("utf-8"))
+
+
+def test_splice_inserts_after_the_inventory_number():
+    spliced = splice_inventory_date(record(), SCANDATE)
+    assert b"<inventory_number></inventory_number><inventory_date>2024-05-01Z</inventory_date>" in spliced
+
+
+@pytest.mark.parametrize("element", [b"<inventory_date/>", b"<inventory_date />", b"<inventory_date></inventory_date>"])
+def test_splice_fills_in_an_empty_date(element):
+    content = record().replace(b"<inventory_number></inventory_number>", b"<inventory_number></inventory_number>" + element)
+    spliced = splice_inventory_date(content, SCANDATE)
+    assert spliced.count(b"<inventory_date") == 1
+    assert b"<inventory_date>2024-05-01Z</inventory_date>" in spliced
+
+
+def test_splice_needs_somewhere_to_put_the_date():
+    content = record().replace(b"<inventory_number></inventory_number>", b"")
+    assert splice_inventory_date(content, SCANDATE) is None
+
+
+@pytest.mark.parametrize("backend", ["fast", "soup"])
+def test_minimal_rewrite_returns_the_spliced_bytes(backend):
+    content = record(inventory_date="2020-01-01Z")
+    fields = parse_item(content, SCANDATE, backend, minimal=True)
+    assert fields["itemdata"] == splice_inventory_date(content, SCANDATE)
+    #The date read is the one Alma has, not the new one
+    assert fields["inventory_date"] == "2020-01-01Z"
\ No newline at end of file
@@ -0,0 +1,92 @@
+import csv
+import gzip
+
+import pytest
+
+from inventory_core.log_report import ReportIndex, log_files, parse_log_line, parse_record_line
+
+
+def line(message, clock="10:00:00", level="INFO"):
+    return f"2024-05-01 {clock} {level:<8} {message}\n"
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Barcode 123 scanned. Updated?: True", ("123", "updated", "", False)),
+    ("Barcode 123 scanned. Updated?: False", ("123", "update_failed", "", False)),
+    ("Barcode 123 scanned. Had process status LOAN. Updated?: True", ("123", "updated", "LOAN", False)),
+    ("Barcode 123 scanned. Item currently has a temporary location. Updated?: True", ("123", "updated", "", True)),
+    ("Barcode 123 scanned. Flagged by rule other_library. Updated?: False", ("123", "update_failed", "", False)),
+    ("Barcode 123 scanned. Bulk job export: flagged", ("123", "flagged", "", False)),
+    ("Barcode 123 scanned. Item not found in Alma.", ("123", "not_found", "", False)),
+    ("Barcode 123 scanned. Connection attempt timed out.", ("123", "queued", "", False)),
+    ("Barcode 123 scanned. Alma unavailable (HTTP 503), scan queued.", ("123", "queued", "", False)),
+    ("Barcode 123 scanned. Alma rejected the API key (HTTP 401).", ("123", "auth_error", "", False)),
+    ("Barcode 123 scanned again. Already updated with 2024-05-01Z this session, skipped.", ("123", "rescan", "", False)),
+    #Unexpected errors from the GUI's scan worker, batch mode and the coordinator
+    ("Barcode 123 scanned. Unexpected error while processing.", ("123", "error", "", False)),
+    ("Barcode 123 batch scanned. Unexpected error while processing.", ("123", "error", "", False)),
+    ("Barcode 123 scanned at station Desk 2. Unexpected error while processing.", ("123", "error", "", False)),
+    #PySimpleGUI version
+    ("Barcode 123 has process type MISSING", ("123", "process_status", "MISSING", False)),
+    ("Inventory date updated! Barcode 123", ("123", "updated", "", False)),
+    ("Inventory date not updated? Barcode 123", ("123", "update_failed", "", False)),
+])
+def test_scan_lines(message, expected):
+    assert parse_log_line(line(message))[2:] == expected
+
+
+def test_other_lines_are_skipped():
+    assert parse_log_line(line("Code tables updated: 4 process types")) is None
+    #Older PySimpleGUI logs didn't say which barcode was updated
+    assert parse_log_line(line("Inventory date updated!")) is None
+    assert parse_log_line("Barcode 123 scanned. Updated?: True\n") is None
+
+
+def test_structured_record_lines():
+    scan = parse_record_line('{"time": "2024-05-01T10:00:00.123", "barcode": "123", "outcome": "updated", "processtype": "LOAN", "temp": false}')
+    assert scan == ("2024-05-01", "10:00:00", "123", "updated", "LOAN", False)
+    assert parse_record_line("not json") is None
+
+
+def test_rotated_segments_are_read_oldest_first(tmp_path):
+    path = str(tmp_path / "inventory_update.log")
+    for name in ("inventory_update.log", "inventory_update.log.1.gz", "inventory_update.log.2.gz"):
+        (tmp_path / name).write_bytes(b"")
+    assert log_files(path) == [f"{path}.2.gz", f"{path}.1.gz", path]
+
+
+def test_index_only_reads_new_lines(tmp_path):
+    log = tmp_path / "inventory_update.log"
+    log.write_text(line("Barcode 1 scanned. Updated?: True") + line("Barcode 2 scanned. Item not found in Alma."))
+    index = ReportIndex(str(tmp_path / "report_index.db"))
+    assert index.update(str(log)) == 2
+    assert index.update(str(log)) == 0
+
+    with open(log, "a") as out:
+        out.write(line("Barcode 2 scanned. Updated?: True", clock="11:00:00"))
+        #Half-written last line is left for next time
+        out.write("2024-05-01 11:00:01 INFO     Barcode 3 sca")
+    assert index.update(str(log)) == 1
+
+    summary_path, latest_path = index.write_reports(str(tmp_path / "reports"))
+    index.close()
+    with open(summary_path) as summary:
+        assert list(csv.reader(summary)) == [["day", "not_found", "updated", "total"], ["2024-05-01", "1", "2", "3"]]
+    with open(latest_path) as latest:
+        rows = list(csv.DictReader(latest))
+    assert {row["barcode"]: row["outcome"] for row in rows} == {"1": "updated", "2": "updated"}
+
+
+def test_rotated_log_is_recognised(tmp_path):
+    log = tmp_path / "inventory_update.log"
+    content = line("Barcode 1 scanned. Updated?: True")
+    log.write_text(content)
+    index = ReportIndex(str(tmp_path / "report_index.db"))
+    index.update(str(log))
+
+    #Rotated and compressed with another line added before rotation, then a fresh log started
+    with gzip.open(f"{log}.1.gz", "wt") as rotated:
+        rotated.write(content + line("Barcode 2 scanned. Updated?: False", clock="10:30:00"))
+    log.write_text(line("Barcode 3 scanned. Updated?: True", clock="11:00:00"))
+    assert sum(index.update(path) for path in log_files(str(log))) == 2
+    index.close()
@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+from inventory_core.rate_limit import QuotaGovernor, TokenBucket
+
+
+def timed(bucket, calls):
+    start = time.monotonic()
+    for _ in range(calls):
+        bucket.acquire()
+    return time.monotonic() - start
+
+
+def test_burst_goes_straight_through_once_the_bucket_has_filled():
+    bucket = TokenBucket(10, burst=5)
+    time.sleep(0.5)
+    assert timed(bucket, 5) < 0.05
+
+
+def test_bucket_starts_with_one_call():
+    #1 straight away, then 4 more at 20 a second
+    assert timed(TokenBucket(20, burst=20), 5) >= 0.19
+
+
+def test_calls_past_the_burst_are_held_to_the_rate():
+    bucket = TokenBucket(20, burst=2)
+    time.sleep(0.1)
+    #2 straight away, then 4 more at 20 a second
+    assert timed(bucket, 6) >= 0.19
+
+
+def test_no_second_has_more_calls_than_the_rate():
+    #Shipped settings shape (burst as big as the rate): a full bucket plus a second's refill mustn't double the rate
+    bucket = TokenBucket(20, burst=20)
+    time.sleep(1)
+    calls = []
+    for _ in range(50):
+        bucket.acquire()
+        calls.append(time.monotonic())
+    busiest = max(sum(1 for other in calls if start <= other < start + 1) for start in calls)
+    assert busiest <= 20
+
+
+def test_no_burst_straight_after_a_pause():
+    bucket = TokenBucket(10, burst=5)
+    bucket.pause(0.2)
+    #The pause, then 3 calls at 10 a second from an empty bucket (not refilled for the time it was paused)
+    assert timed(bucket, 3) >= 0.45
+
+
+def response(status_code=200, remaining=None):
+    headers = {} if remaining is None else {"X-Exl-Api-Remaining": str(remaining)}
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+
+def test_rate_slows_down_as_the_daily_quota_runs_out():
+    governor = QuotaGovernor(per_second=20, slow_below=10000, min_per_second=1)
+    assert governor.allowed_rate(50000) == 20
+    assert governor.allowed_rate(5000) == 10
+    assert governor.allowed_rate(0) == 1
+
+
+def test_remaining_header_sets_the_rate():
+    governor = QuotaGovernor(per_second=20, slow_below=10000)
+    governor.observe(response(remaining=2500))
+    stats = governor.stats()
+    assert stats["remaining"] == 2500
+    assert stats["allowed_per_second"] == 5
+
+
+def test_throttled_response_pauses_the_bucket():
+    governor = QuotaGovernor(throttle_pause=0.2, log_every=0)
+    governor.observe(response(429))
+    assert governor.stats()["throttled"] == 1
+    start = time.monotonic()
+    governor.acquire()
+    assert time.monotonic() - start >= 0.15
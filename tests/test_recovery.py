@@ -0,0 +1,98 @@
+from inventory_core.recovery import FailedScans, redrive
+from inventory_core.scan_journal import ScanJournal
+from inventory_core.scanning import Scanner
+
+
+def write_log(tmp_path, *lines):
+    path = tmp_path / "inventory_update.log"
+    path.write_text("".join(f"{when} ERROR    {message}\n" for when, message in lines))
+    return str(path)
+
+
+def journal_in(tmp_path):
+    return ScanJournal(str(tmp_path / "scan_journal.db"))
+
+
+def test_failures_in_the_log_are_found_with_their_scan_date(tmp_path):
+    scans = FailedScans()
+    scans.add_log(write_log(tmp_path,
+        ("2024-04-30 09:00:00", "Barcode R1 scanned. Updated?: False"),
+        ("2024-05-01 10:00:00", "Barcode R2 scanned. Connection attempt timed out."),
+        ("2024-05-01 10:01:00", "Barcode R3 scanned. Unexpected error while processing."),
+        ("2024-05-01 10:02:00", "Barcode R4 scanned. Updated?: True"),
+        ("2024-05-01 10:03:00", "Barcode R5 not found"),
+    ))
+    assert sorted(scans.failed()) == [("R1", "2024-04-30Z", [], "log"), ("R2", "2024-05-01Z", [], "log"), ("R3", "2024-05-01Z", [], "log")]
+
+
+def test_later_success_settles_an_earlier_failure(tmp_path):
+    scans = FailedScans()
+    scans.add_log(write_log(tmp_path,
+        ("2024-05-01 10:00:00", "Barcode R6 scanned. Updated?: False"),
+        ("2024-05-01 10:05:00", "Barcode R6 scanned. Updated?: True"),
+        ("2024-05-01 10:06:00", "Barcode R7 scanned. Updated?: True"),
+        ("2024-05-01 10:07:00", "Barcode R7 scanned. Updated?: False"),
+    ))
+    assert scans.failed() == [("R7", "2024-05-01Z", [], "log")]
+
+
+def test_queued_journal_scans_keep_their_ids_and_dates(tmp_path):
+    journal = journal_in(tmp_path)
+    queued = journal.record("R8", "2024-04-29Z", status="queued")
+    done = journal.record("R9", "2024-04-29Z")
+    journal.finish(done, "update_failed")
+    fine = journal.record("R10", "2024-04-29Z")
+    journal.finish(fine, "updated")
+    scans = FailedScans()
+    scans.add_journal(journal)
+    assert sorted(scans.failed()) == [("R8", "2024-04-29Z", [queued], "journal"), ("R9", "2024-04-29Z", [done], "journal")]
+    journal.close()
+
+
+def test_log_success_after_a_journal_failure(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.record("R11", "2024-04-29Z", status="queued")
+    scans = FailedScans()
+    scans.add_journal(journal)
+    #Updated later by a station whose journal this isn't
+    scans.add_log(write_log(tmp_path, ("2999-01-01 10:00:00", "Barcode R11 scanned. Updated?: True")))
+    assert scans.failed() == []
+    journal.close()
+
+
+def test_redrive_sends_the_original_date_and_closes_the_journal(tmp_path):
+    journal = journal_in(tmp_path)
+    first = journal.record("R12", "2024-04-29Z", status="queued")
+    second = journal.record("R13", "2024-04-30Z", status="queued")
+    sent = {}
+
+    def handler(barcode, scandate):
+        sent[barcode] = scandate
+        if barcode == "R13":
+            return {"barcode": barcode, "connectFail": True, "founditem": False}
+        return {"barcode": barcode, "connectFail": False, "founditem": True, "updatestatus": True}
+
+    scans = FailedScans()
+    scans.add_journal(journal)
+    assert redrive(scans.failed(), handler, journal=journal) == {"updated": 1, "queued": 1}
+    assert sent == {"R12": "2024-04-29Z", "R13": "2024-04-30Z"}
+    #Still unreachable, so it stays queued for the next run
+    assert journal.queued() == [(second, "R13", "2024-04-30Z")]
+    assert {row[0]: row[4:] for row in journal.history()}[first] == ("done", "updated")
+    journal.close()
+
+
+def test_redrive_through_the_scanner(tmp_path, mock_alma, scanner_settings):
+    scans = FailedScans()
+    scans.add_log(write_log(tmp_path,
+        ("2024-04-28 09:00:00", "Barcode 39000000019001 scanned. Updated?: False"),
+        ("2024-04-28 09:01:00", "Barcode 39000000019002 scanned. Updated?: False"),
+    ))
+    #Scanned again since with a later date, which is kept
+    mock_alma.inventory_dates["39000000019002"] = "2024-05-01Z"
+    results = {}
+    counts = redrive(scans.failed(), Scanner(scanner_settings).process_barcode, workers=2, on_result=lambda scan, result: results.update({scan[0]: result}))
+    assert counts == {"updated": 2}
+    assert mock_alma.inventory_dates["39000000019001"] == "2024-04-28Z"
+    assert mock_alma.inventory_dates["39000000019002"] == "2024-05-01Z"
+    assert results["39000000019002"]["skipped"]
@@ -0,0 +1,131 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from inventory_core.alma_client import AlmaClient
+from inventory_core.log_report import parse_log_line
+from inventory_core.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, classify
+from inventory_core.scanning import Scanner
+
+
+def response(status_code, content=b"", **headers):
+    return SimpleNamespace(status_code=status_code, content=content, headers=headers)
+
+
+#AlmaClient whose session answers with the given responses (or raises the given exceptions) in turn
+def scripted_client(answers, retry=None, breaker=None):
+    client = AlmaClient("http://alma.invalid/almaws/v1", "test", retry=retry, breaker=breaker)
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(method)
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    client.session.request = request
+    return client, calls
+
+
+def test_responses_are_classified():
+    assert classify(response(200)) == "ok"
+    assert classify(response(400, b"No items found for barcode")) == "not_found"
+    assert classify(response(400, b"Invalid API-key")) == "auth_error"
+    assert classify(response(403)) == "auth_error"
+    assert classify(response(429)) == "throttled"
+    assert classify(response(503)) == "server_error"
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(backoff_base=0.5, backoff_cap=2)
+    assert all(0 <= policy.delay(0) <= 0.5 for _ in range(20))
+    assert all(0 <= policy.delay(10) <= 2 for _ in range(20))
+
+
+def test_retry_after_is_followed_up_to_the_cap():
+    policy = RetryPolicy(backoff_cap=8)
+    assert policy.delay(0, response(429, **{"Retry-After": "3"})) == 3
+    assert policy.delay(0, response(429, **{"Retry-After": "3600"})) == 8
+    assert policy.waits_too_long(response(429, **{"Retry-After": "3600"}))
+    assert not policy.waits_too_long(response(429, **{"Retry-After": "3"}))
+    assert not policy.waits_too_long(response(429))
+
+
+def test_throttled_and_server_errors_are_retried():
+    client, calls = scripted_client([response(429), response(503), response(200)], RetryPolicy(retries=3, backoff_base=0.01))
+    assert client.get("http://alma.invalid/items").status_code == 200
+    assert len(calls) == 3
+
+
+def test_not_found_is_not_retried():
+    client, calls = scripted_client([response(400)], RetryPolicy(retries=3, backoff_base=0.01))
+    assert client.get("http://alma.invalid/items").status_code == 400
+    assert len(calls) == 1
+
+
+def test_long_retry_after_gives_up_straight_away():
+    client, calls = scripted_client([response(429, **{"Retry-After": "3600"}), response(200)], RetryPolicy(retries=3, backoff_cap=1))
+    start = time.monotonic()
+    assert client.get("http://alma.invalid/items").status_code == 429
+    assert time.monotonic() - start < 0.5
+    assert len(calls) == 1
+
+
+def test_connection_errors_are_raised_after_the_retries():
+    client, calls = scripted_client([ConnectionError(), ConnectionError()], RetryPolicy(retries=1, backoff_base=0.01))
+    with pytest.raises(ConnectionError):
+        client.get("http://alma.invalid/items")
+    assert len(calls) == 2
+
+
+def test_breaker_opens_after_failures_in_a_row_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    client, calls = scripted_client([response(503), response(503), response(200)], breaker=breaker)
+    client.get("http://alma.invalid/items")
+    client.get("http://alma.invalid/items")
+    assert breaker.is_open
+    #Refused without calling Alma while it's open (like being offline)
+    with pytest.raises(CircuitOpenError):
+        client.get("http://alma.invalid/items")
+    assert len(calls) == 2
+
+    time.sleep(0.1)
+    assert breaker.allow()
+    #Only one trial at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_throttling_doesnt_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2)
+    client, calls = scripted_client([response(429)] * 3, breaker=breaker)
+    for _ in range(3):
+        client.get("http://alma.invalid/items")
+    assert not breaker.is_open
+
+
+def test_busy_alma_is_queued_as_busy_not_offline(mock_alma, scanner_settings, caplog):
+    scanner = Scanner(dict(scanner_settings, retry={"retries": 0}))
+    mock_alma.throttle_rate = 1
+    try:
+        with caplog.at_level("ERROR"):
+            result = scanner.run_scan("39000000008001")
+    finally:
+        mock_alma.throttle_rate = 0
+    assert result["connectFail"]
+    assert result["lookup"] == "throttled"
+    #Still counted as queued by the session report and recovery
+    [message] = [record.getMessage() for record in caplog.records if "39000000008001" in record.getMessage()]
+    assert message == "Barcode 39000000008001 scanned. Alma busy (HTTP 429), scan queued."
+    assert parse_log_line(f"2024-05-01 10:00:00 ERROR    {message}\n")[3] == "queued"
+
+
+def test_network_failure_is_still_offline(scanner_settings):
+    scanner = Scanner(dict(scanner_settings, alma_base="http://127.0.0.1:9/almaws/v1", retry={"retries": 0}, http={"connect_timeout": 1}))
+    result = scanner.run_scan("39000000008002")
+    assert result["connectFail"]
+    assert "lookup" not in result
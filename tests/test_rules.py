@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+from inventory_core.rules import DEFAULT_RULES, Rule, RuleSet, rules_from_settings
+
+
+SETTINGS = {"statuslist": ["LOAN", "MISSING"], "processlabel": {"LOAN": "On Loan", "MISSING": "Missing"}}
+
+
+def test_default_rules_flag_listed_process_types_by_label():
+    rules = rules_from_settings(SETTINGS)
+    [match] = rules.evaluate({"process_type": "LOAN", "in_temp_location": "false"})
+    assert match["name"] == "process_status"
+    assert match["screen"] == "withprocess"
+    assert match["value"] == "On Loan"
+    assert "On Loan" in match["message"]
+
+
+def test_default_rules_skip_unlisted_process_types():
+    rules = rules_from_settings(SETTINGS)
+    assert rules.evaluate({"process_type": "TECHNICAL", "in_temp_location": "false"}) == []
+
+
+def test_every_matching_rule_is_returned_in_settings_order():
+    rules = rules_from_settings(SETTINGS)
+    matches = rules.evaluate({"process_type": "MISSING", "in_temp_location": "true"})
+    assert [match["name"] for match in matches] == ["process_status", "temporary_location"]
+
+
+def test_allowlist_matches_by_name_or_code():
+    rule = Rule({"name": "other_location", "field": "location", "not_in": ["Main Stacks"], "colour": "note"})
+    assert rule.test({"location": "Main Stacks", "location_code": "STACKS"}) is None
+    assert rule.test({"location": "Reference", "location_code": "REF"}) == "Reference"
+    #Items without the field never match
+    assert rule.test({"barcode": "1"}) is None
+
+
+def test_unless_exempts_matching_items():
+    rule = Rule({"name": "temporary_location", "field": "in_temp_location", "in": ["true"], "unless": {"temp_location": ["reserves"]}})
+    assert rule.test({"in_temp_location": "true", "temp_location": "Course Reserves", "temp_location_code": "RESERVES"}) is None
+    assert rule.test({"in_temp_location": "true", "temp_location": "Bindery", "temp_location_code": "BIND"}) == "true"
+
+
+def test_empty_allowlists_are_skipped():
+    rules = rules_from_settings(dict(SETTINGS, rules=DEFAULT_RULES + [{"name": "other_library", "field": "library", "not_in": []}]))
+    assert [rule.name for rule in rules.rules] == ["process_status", "temporary_location"]
+
+
+def test_bad_rules_are_refused():
+    with pytest.raises(ValueError):
+        Rule({"name": "no_values", "field": "library"})
+    with pytest.raises(ValueError):
+        Rule({"name": "bad_colour", "field": "library", "in": ["MAIN"], "colour": "purple"})
+
+
+def test_code_table_labels_replace_the_settings_ones():
+    tables = SimpleNamespace(process_types={"LOAN": "Loaned out", "TECHNICAL": "Technical - Migration"})
+    rules = rules_from_settings(SETTINGS, tables)
+    [match] = rules.evaluate({"process_type": "LOAN"})
+    assert match["value"] == "Loaned out"
+    #Only the statuslist ones are flagged unless flag_all_process_types is set
+    assert rules.evaluate({"process_type": "TECHNICAL"}) == []
+
+
+def test_flag_all_process_types_is_opt_in():
+    tables = SimpleNamespace(process_types={"LOAN": "On Loan", "TECHNICAL": "Technical - Migration"})
+    rules = rules_from_settings(dict(SETTINGS, code_tables={"flag_all_process_types": True}), tables)
+    [match] = rules.evaluate({"process_type": "TECHNICAL"})
+    assert match["value"] == "Technical - Migration"
+
+
+def test_rule_set_with_no_rules_matches_nothing():
+    assert RuleSet([]).evaluate({"process_type": "LOAN"}) == []
@@ -0,0 +1,90 @@
+from inventory_core.replay import replay_queued
+from inventory_core.scan_journal import ScanJournal, outcome_of
+from inventory_core.scanning import Scanner
+
+
+def journal_in(tmp_path):
+    return ScanJournal(str(tmp_path / "scan_journal.db"))
+
+
+def status_of(journal, scanid):
+    return {row[0]: row[4:] for row in journal.history()}[scanid]
+
+
+def test_scan_is_pending_until_finished(tmp_path):
+    journal = journal_in(tmp_path)
+    scanid = journal.record("J1", "2024-05-01Z")
+    assert status_of(journal, scanid) == ("pending", None)
+    journal.finish(scanid, "updated", "A title", "QA1")
+    assert status_of(journal, scanid) == ("done", "updated")
+    assert journal.queued_count() == 0
+    journal.close()
+
+
+def test_scans_cut_off_by_closing_are_queued_again(tmp_path):
+    journal = journal_in(tmp_path)
+    scanid = journal.record("J2", "2024-05-01Z")
+    journal.close()
+
+    journal = journal_in(tmp_path)
+    assert journal.queued() == [(scanid, "J2", "2024-05-01Z")]
+    journal.close()
+
+
+def test_replay_uses_the_original_scandate(tmp_path):
+    journal = journal_in(tmp_path)
+    first = journal.record("J3", "2024-04-30Z", status="queued")
+    second = journal.record("J4", "2024-05-01Z", status="queued")
+    sent = {}
+
+    def handler(barcode, scandate):
+        sent[barcode] = scandate
+        return {"barcode": barcode, "connectFail": False, "founditem": True, "updatestatus": True}
+
+    assert replay_queued(journal, handler) == {"updated": 2}
+    assert sent == {"J3": "2024-04-30Z", "J4": "2024-05-01Z"}
+    assert status_of(journal, first) == ("done", "updated")
+    assert status_of(journal, second) == ("done", "updated")
+    journal.close()
+
+
+def test_scans_that_still_cant_connect_stay_queued(tmp_path):
+    journal = journal_in(tmp_path)
+    scanid = journal.record("J5", "2024-05-01Z", status="queued")
+    counts = replay_queued(journal, lambda barcode, scandate: {"barcode": barcode, "connectFail": True, "founditem": False})
+    assert counts == {"queued": 1}
+    assert journal.queued() == [(scanid, "J5", "2024-05-01Z")]
+    journal.close()
+
+
+def test_handler_errors_finish_the_scan_as_an_error(tmp_path):
+    journal = journal_in(tmp_path)
+    scanid = journal.record("J6", "2024-05-01Z", status="queued")
+
+    def handler(barcode, scandate):
+        raise ValueError("broken record")
+
+    assert replay_queued(journal, handler) == {"error": 1}
+    assert status_of(journal, scanid) == ("done", "error")
+    journal.close()
+
+
+def test_replay_through_the_scanner_stamps_the_original_date(tmp_path, mock_alma, scanner_settings):
+    journal = journal_in(tmp_path)
+    scanid = journal.record("39000000005001", "2024-04-30Z", status="queued")
+    scanner = Scanner(scanner_settings)
+    assert replay_queued(journal, lambda barcode, scandate: scanner.run_scan(barcode, scandate)) == {"updated": 1}
+    assert mock_alma.inventory_dates["39000000005001"] == "2024-04-30Z"
+    assert status_of(journal, scanid) == ("done", "updated")
+    journal.close()
+
+
+def test_outcomes():
+    found = {"connectFail": False, "founditem": True}
+    assert outcome_of(dict(found, updatestatus=True)) == "updated"
+    assert outcome_of(dict(found, updatestatus=False)) == "update_failed"
+    assert outcome_of(dict(found, updatestatus=True, bulk="flagged")) == "flagged"
+    assert outcome_of({"connectFail": True, "founditem": False}) == "queued"
+    assert outcome_of({"connectFail": False, "founditem": False}) == "not_found"
+    assert outcome_of({"connectFail": False, "founditem": False, "lookup": "auth_error"}) == "auth_error"
+    assert outcome_of({"barcode": "1", "error": ValueError()}) == "error"
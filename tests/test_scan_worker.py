@@ -0,0 +1,100 @@
+import threading
+import time
+
+from inventory_core.scan_worker import ScanWorker
+
+
+#Stands in for the Tk window: keeps what poll schedules instead of running a mainloop
+class FakeGui:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, interval, callback):
+        self.scheduled.append(callback)
+
+
+#Drains the worker until count results are in (or the timeout runs out)
+def collect(worker, count, timeout=5):
+    results = []
+    end = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < end:
+        results.extend(worker.drain())
+        time.sleep(0.01)
+    return results
+
+
+def test_results_come_back_in_scan_order():
+    #First scan is the slowest, later ones finish first but have to wait for it
+    delays = {"A": 0.2, "B": 0.05, "C": 0}
+    worker = ScanWorker(lambda barcode: (time.sleep(delays[barcode]), {"barcode": barcode})[1], workers=3)
+    for barcode in "ABC":
+        worker.submit(barcode)
+    assert [result["barcode"] for result in collect(worker, 3)] == ["A", "B", "C"]
+    worker.stop()
+
+
+def test_submit_fields_go_to_the_handler():
+    worker = ScanWorker(lambda barcode, scanid: {"barcode": barcode, "scanid": scanid})
+    worker.submit("A", scanid=7)
+    assert collect(worker, 1) == [{"barcode": "A", "scanid": 7}]
+    worker.stop()
+
+
+def test_posted_result_comes_before_the_final_one():
+    def handler(barcode):
+        worker.post({"barcode": barcode, "phase": "lookup"})
+        return {"barcode": barcode}
+
+    worker = ScanWorker(handler)
+    worker.submit("A")
+    assert [result.get("phase") for result in collect(worker, 2)] == ["lookup", None]
+    worker.stop()
+
+
+def test_submit_refuses_once_the_window_is_full():
+    release = threading.Event()
+    worker = ScanWorker(lambda barcode: (release.wait(), {"barcode": barcode})[1], workers=1, max_queued=1)
+    assert worker.submit("A")
+    assert worker.submit("B")
+    assert worker.full()
+    assert not worker.submit("C")
+    release.set()
+    assert len(collect(worker, 2)) == 2
+    assert not worker.full()
+    worker.stop()
+
+
+def test_handler_error_keeps_the_submitted_fields():
+    def handler(barcode, scanid):
+        raise ValueError("broken record")
+
+    worker = ScanWorker(handler)
+    worker.submit("BAD", scanid=3)
+    [result] = collect(worker, 1)
+    assert result["barcode"] == "BAD"
+    assert result["scanid"] == 3
+    assert isinstance(result["error"], ValueError)
+    worker.stop()
+
+
+def test_poll_carries_on_after_a_callback_error():
+    worker = ScanWorker(lambda barcode: {"barcode": barcode})
+    worker.submit("A")
+    worker.submit("B")
+    collect_until = time.monotonic() + 5
+    while worker.results.qsize() < 2 and time.monotonic() < collect_until:
+        time.sleep(0.01)
+
+    shown = []
+
+    def callback(result):
+        if result["barcode"] == "A":
+            raise KeyError("title")
+        shown.append(result["barcode"])
+
+    gui = FakeGui()
+    worker.poll(gui, callback)
+    #The result after the failing one is still shown, and polling is scheduled again
+    assert shown == ["B"]
+    assert len(gui.scheduled) == 1
+    worker.stop()
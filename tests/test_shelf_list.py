@@ -0,0 +1,76 @@
+from inventory_core.scanning import Scanner
+from inventory_core.shelf_list import ShelfList
+
+
+EXPORT = """Barcode,Title,Permanent Call Number,Permanent Location,Location Code,Process Type
+39000000013001,First,QA1 .A1,Main Stacks,STACKS,
+39000000013002,Second,QA9 .B2,Main Stacks,STACKS,On Loan
+39000000013003,Third,QA76 .C3,Main Stacks,STACKS,
+39000000013004,Elsewhere,PR1 .D4,Reference,REF,
+"""
+
+
+def shelf_list_file(tmp_path):
+    path = tmp_path / "shelf.csv"
+    path.write_text(EXPORT, encoding="utf-8")
+    return str(path)
+
+
+def test_export_columns_and_process_labels_are_read(tmp_path):
+    shelf = ShelfList("stacks", processlabel={"LOAN": "On Loan"})
+    assert shelf.load(shelf_list_file(tmp_path)) == 4
+    entry = shelf.get("39000000013002")
+    assert (entry["title"], entry["call_number"], entry["location"]) == ("Second", "QA9 .B2", "Main Stacks")
+    assert entry["process_type"] == "LOAN"
+    assert shelf.expected == {"39000000013001", "39000000013002", "39000000013003"}
+
+
+def test_call_number_range_follows_shelf_order(tmp_path):
+    #QA9 comes before QA76 on the shelf, even though "QA76" < "QA9" as text
+    shelf = ShelfList("Main Stacks", call_number_from="QA5", call_number_to="QA80")
+    shelf.load(shelf_list_file(tmp_path))
+    assert shelf.expected == {"39000000013002", "39000000013003"}
+
+
+def test_reconcile_after_scanning(tmp_path, scanner_settings):
+    scanner = Scanner(scanner_settings)
+    scanner.shelf = ShelfList("STACKS")
+    scanner.shelf.load(shelf_list_file(tmp_path))
+    for barcode in ("39000000013001", "39000000013004", "39000000013099"):
+        scanner.run_scan(barcode)
+    assert scanner.shelf.reconcile() == {
+        "missing": ["39000000013002", "39000000013003"],
+        "unexpected": ["39000000013099"],
+        "wrong_location": ["39000000013004"],
+    }
+    counts = scanner.shelf.write_report(str(tmp_path / "shelf_report.csv"))
+    assert counts == {"missing": 2, "unexpected": 1, "wrong_location": 1}
+
+
+#Scanner on the mock, with a shelf list row for each barcode given (as the export had it)
+def scanner_with_rows(settings, rows):
+    scanner = Scanner(settings)
+    scanner.shelf = ShelfList()
+    for barcode, process_type in rows.items():
+        scanner.shelf.add({"barcode": barcode, "title": "Listed title", "author": "", "call_number": "QA1", "location": "Main Stacks", "process_type": process_type})
+    return scanner
+
+
+def test_stale_row_is_corrected_from_the_record(scanner_settings):
+    scanner = scanner_with_rows(scanner_settings, {"PROC-LOAN-13001": ""})
+    lookups = []
+    result = scanner.run_scan("PROC-LOAN-13001", on_lookup=lookups.append)
+    #Shown from the shelf list first, without a process status
+    assert lookups[0]["fromshelf"] and lookups[0]["rules"] == []
+    #Alma's record says otherwise, so the finished result carries the current rules
+    assert result["corrected"]
+    assert result["screenpath"] == "withprocess"
+    assert [match["name"] for match in result["rules"]] == ["process_status"]
+
+
+def test_row_that_matches_the_record_is_left_alone(scanner_settings):
+    scanner = scanner_with_rows(scanner_settings, {"PROC-LOAN-13002": "LOAN"})
+    result = scanner.run_scan("PROC-LOAN-13002")
+    assert "corrected" not in result
+    assert result["screenpath"] == "withprocess"
+    assert result["updatestatus"]